@@ -18,6 +18,9 @@ from score_db.score_table_models import InstrumentMeta as im
 from score_db.instrument_meta import InstrumentMetaRequest
 from score_db import time_utils
 from score_db import db_utils
+from score_db import dimension_cache
+from score_db import log_utils
+from score_db import result_formats
 import traceback
 
 from pandas import DataFrame 
@@ -28,6 +31,8 @@ from sqlalchemy import and_, or_, not_
 from sqlalchemy import asc, desc
 from sqlalchemy.sql import func
 
+logger = log_utils.get_logger(__name__)
+
 ArrayMetricTypeInputData = namedtuple(
     'ArrayMetricTypeInputData',
     [
@@ -163,12 +168,12 @@ def get_string_filter(filter_dict, cls, key, constructed_filter, key_name):
             f'type: {type(filter_dict)}'
         raise TypeError(msg)
 
-    print(f'Column \'{key}\' is of type {type(getattr(cls, key).type)}.')
+    logger.debug('Column \'%s\' is of type %s.', key, type(getattr(cls, key).type))
     string_flt = filter_dict.get(key_name)
-    print(f'string_flt: {string_flt}')
+    logger.debug('string_flt: %s', string_flt)
 
     if string_flt is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
         return constructed_filter
 
     like_filter = string_flt.get('like')
@@ -219,7 +224,7 @@ def get_instrument_meta_id(body):
     try:    
         instrument_meta_name = body.get('instrument_meta_name')
     except KeyError as err:
-        print(f'Required instrument meta input value not found: {err}')
+        logger.warning('Required instrument meta input value not found: %s', err)
         return instrument_meta_id
 
     if instrument_meta_name is None:
@@ -238,12 +243,12 @@ def get_instrument_meta_id(body):
         }
     }
 
-    print(f'instrument_meta_request: {instrument_meta_request}')
+    logger.debug('instrument_meta_request: %s', instrument_meta_request)
 
     im_request = InstrumentMetaRequest(instrument_meta_request)
 
     results = im_request.submit()
-    print(f'results: {results}')
+    logger.debug('results: %s', results)
 
     record_cnt = 0
     try:
@@ -270,7 +275,7 @@ def get_instrument_meta_id(body):
     except Exception as err:
         error_msg = f'Problem finding instrument meta id from record: {records} ' \
             f'- err: {err}'
-        print(f'error_msg: {error_msg}')
+        logger.debug('error_msg: %s', error_msg)
         raise ArrayMetricTypeError(error_msg) 
     return instrument_meta_id
 
@@ -282,6 +287,7 @@ class ArrayMetricTypeRequest:
     filters: dict = field(default_factory=dict, init=False)
     ordering: list = field(default_factory=list, init=False)
     record_limit: int = field(default_factory=int, init=False)
+    output_format: str = field(default=None, init=False)
     body: dict = field(default_factory=dict, init=False)
     array_metric_type: ArrayMetricType = field(init=False)
     array_metric_type_data: namedtuple = field(init=False)
@@ -291,6 +297,7 @@ class ArrayMetricTypeRequest:
     def __post_init__(self):
         self.method = db_utils.validate_method(self.request_dict.get('method'))
         self.params = self.request_dict.get('params')
+        self.output_format = result_formats.get_output_format(self.params)
 
         self.body = self.request_dict.get('body')
         if self.method == db_utils.HTTP_PUT:
@@ -301,7 +308,7 @@ class ArrayMetricTypeRequest:
             except Exception as err:
                 error_msg = 'Failed to get array metric type information to insert -' \
                     f' err: {err}'
-                print(f'Submit PUT error: {error_msg}')
+                logger.error('Submit PUT error: %s', error_msg)
                 return self.failed_request(error_msg)
         else:
             if isinstance(self.params, dict):
@@ -335,12 +342,10 @@ class ArrayMetricTypeRequest:
             except Exception as err:
                 error_msg = 'Failed to insert array metric type record -' \
                     f' err: {err}'
-                print(f'Submit PUT error: {error_msg}')
+                logger.error('Submit PUT error: %s', error_msg)
                 return self.failed_request(error_msg)
             
     def put_array_metric_type(self):
-        session = stm.get_session()
-
         instrument_meta_id = self.instrument_meta_id if self.instrument_meta_id > 0 else None
 
         insert_stmt = insert(amt).values(
@@ -359,7 +364,7 @@ class ArrayMetricTypeRequest:
             created_at=datetime.utcnow(),
             updated_at=None
         ).returning(amt)
-        print(f'insert_stmt: {insert_stmt}')
+        logger.debug('insert_stmt: %s', insert_stmt)
 
         time_now = datetime.utcnow()
 
@@ -376,26 +381,27 @@ class ArrayMetricTypeRequest:
             )
         )
 
-        print(f'do_update_stmt: {do_update_stmt}')
+        logger.debug('do_update_stmt: %s', do_update_stmt)
 
-        try:
-            result = session.execute(do_update_stmt)
-            session.flush()
-            result_row = result.fetchone()
-            action = db_utils.INSERT
-            if result_row.updated_at is not None:
-                action = db_utils.UPDATE
-
-            session.commit()
-            session.close()
-        except Exception as err:
-            message = f'Attempt to INSERT/UPDATE array metric type record FAILED'
-            error_msg = f'Failed to insert/update record - err: {err}'
-            print(f'error_msg: {error_msg}')
-            session.close()
-        else:
-            message = f'Attempt to {action} array metric type record SUCCEEDED'
-            error_msg = None
+        with stm.session_scope() as session:
+            try:
+                result = session.execute(do_update_stmt)
+                session.flush()
+                result_row = result.fetchone()
+                action = db_utils.INSERT
+                if result_row.updated_at is not None:
+                    action = db_utils.UPDATE
+
+                session.commit()
+            except Exception as err:
+                session.rollback()
+                result_row = None
+                message = f'Attempt to INSERT/UPDATE array metric type record FAILED'
+                error_msg = f'Failed to insert/update record - err: {err}'
+                logger.error('error_msg: %s', error_msg)
+            else:
+                message = f'Attempt to {action} array metric type record SUCCEEDED'
+                error_msg = None
         
         results = {}
         if result_row is not None:
@@ -403,6 +409,9 @@ class ArrayMetricTypeRequest:
             results['data'] = [result_row._mapping]
             results['id'] = result_row.id
 
+        # the next id lookup during ingest reloads the table
+        dimension_cache.invalidate(stm.ARRAY_METRIC_TYPES_TABLE)
+
         response = DbActionResponse(
             self.request_dict,
             (error_msg is None),
@@ -411,60 +420,40 @@ class ArrayMetricTypeRequest:
             error_msg
         )
 
-        print(f'response: {response}')
+        logger.debug('response: %s', response)
         return response
 
     def get_array_metric_types(self):
-        session = stm.get_session()
-
-        q = session.query(
-            amt
-        ).outerjoin(
-            im, amt.instrument_meta
-        )
+        with stm.read_session_scope() as session:
+            q = session.query(
+                amt
+            ).outerjoin(
+                im, amt.instrument_meta
+            )
 
-        print('Before adding filters to array metric types request########################')
-        if self.filters is not None and len(self.filters) > 0:
-            for key, value in self.filters.items():
-                q = q.filter(value)
+            logger.debug('Before adding filters to array metric types request########################')
+            if self.filters is not None and len(self.filters) > 0:
+                for key, value in self.filters.items():
+                    q = q.filter(value)
         
-        print('After adding filters to array metric types request########################')
+            logger.debug('After adding filters to array metric types request########################')
         
-        # add column ordering
-        column_ordering = db_utils.build_column_ordering(amt, self.ordering)
-        if column_ordering is not None and len(column_ordering) > 0:
-            for ordering_item in column_ordering:
-                q = q.order_by(ordering_item)
-
-        # limit number of returned records
-        if self.record_limit is not None and self.record_limit > 0:
-            q = q.limit(self.record_limit)
-
-        array_metric_types = q.all()
-
-        parsed_types = []
-        for metric_type in array_metric_types:
-            if metric_type.instrument_meta is not None:
-                record = ArrayMetricTypeData(
-                id=metric_type.id,
-                name=metric_type.name,
-                long_name=metric_type.long_name,
-                obs_platform=metric_type.obs_platform,
-                measurement_type=metric_type.measurement_type,
-                measurement_units=metric_type.measurement_units,
-                stat_type=metric_type.stat_type,
-                array_coord_labels=metric_type.array_coord_labels,
-                array_coord_units=metric_type.array_coord_units,
-                array_index_values=metric_type.array_index_values,
-                array_dimensions=metric_type.array_dimensions,
-                description=metric_type.description,
-                instrument_meta_id=metric_type.instrument_meta.id,
-                instrument_name=metric_type.instrument_meta.name,
-                instrument_num_channels=metric_type.instrument_meta.num_channels,
-                instrument_scan_angle=metric_type.instrument_meta.scan_angle
-            )
-            else:
-                record = ArrayMetricTypeData(
+            # add column ordering
+            column_ordering = db_utils.build_column_ordering(amt, self.ordering)
+            if column_ordering is not None and len(column_ordering) > 0:
+                for ordering_item in column_ordering:
+                    q = q.order_by(ordering_item)
+
+            # limit number of returned records
+            if self.record_limit is not None and self.record_limit > 0:
+                q = q.limit(self.record_limit)
+
+            array_metric_types = q.all()
+
+            parsed_types = []
+            for metric_type in array_metric_types:
+                if metric_type.instrument_meta is not None:
+                    record = ArrayMetricTypeData(
                     id=metric_type.id,
                     name=metric_type.name,
                     long_name=metric_type.long_name,
@@ -477,39 +466,58 @@ class ArrayMetricTypeRequest:
                     array_index_values=metric_type.array_index_values,
                     array_dimensions=metric_type.array_dimensions,
                     description=metric_type.description,
-                    instrument_meta_id=None,
-                    instrument_name=None,
-                    instrument_num_channels=None,
-                    instrument_scan_angle=None
+                    instrument_meta_id=metric_type.instrument_meta.id,
+                    instrument_name=metric_type.instrument_meta.name,
+                    instrument_num_channels=metric_type.instrument_meta.num_channels,
+                    instrument_scan_angle=metric_type.instrument_meta.scan_angle
                 )
-            parsed_types.append(record)
+                else:
+                    record = ArrayMetricTypeData(
+                        id=metric_type.id,
+                        name=metric_type.name,
+                        long_name=metric_type.long_name,
+                        obs_platform=metric_type.obs_platform,
+                        measurement_type=metric_type.measurement_type,
+                        measurement_units=metric_type.measurement_units,
+                        stat_type=metric_type.stat_type,
+                        array_coord_labels=metric_type.array_coord_labels,
+                        array_coord_units=metric_type.array_coord_units,
+                        array_index_values=metric_type.array_index_values,
+                        array_dimensions=metric_type.array_dimensions,
+                        description=metric_type.description,
+                        instrument_meta_id=None,
+                        instrument_name=None,
+                        instrument_num_channels=None,
+                        instrument_scan_angle=None
+                    )
+                parsed_types.append(record)
 
         try:
-            arr_metric_types_df = DataFrame(
+            arr_metric_types_records = result_formats.format_records(
                 parsed_types,
-                columns=ArrayMetricTypeData._fields
+                ArrayMetricTypeData._fields,
+                self.output_format
             )
         except Exception as err:
             trcbk = traceback.format_exc()
-            msg = f'Problem casting array metric type query output into pandas ' \
-                f'DataFrame - err: {trcbk}'
+            msg = f'Problem casting array metric type query output into ' \
+                f'{self.output_format} - err: {trcbk}'
             raise TypeError(msg) from err
 
-        results = DataFrame()
+        results = None
         error_msg = None
         record_count = 0
         try:
             if len(parsed_types) > 0:
-                results = arr_metric_types_df
+                results = arr_metric_types_records
             
         except Exception as err:
             message = 'Request for array metric type records FAILED'
             error_msg = f'Failed to get array metric type records - err: {err}'
         else:
             message = 'Request for array metric type records SUCCEEDED'
-            for idx, row in results.iterrows():
-                print(f'idx: {idx}, row: {row}')
-            record_count = len(results.index)
+            logger.debug('records: %s', results)
+            record_count = len(parsed_types)
         
         details = {}
         details['record_count'] = record_count
@@ -524,7 +532,6 @@ class ArrayMetricTypeRequest:
             details,
             error_msg
         )
-        print(f'response: {response}')
+        logger.debug('response: %s', response)
 
-        session.close()
         return response
@@ -0,0 +1,556 @@
+"""
+Copyright 2024 NOAA
+All rights reserved.
+
+Collection of methods to manage the process-wide database connection.
+A single engine (and its connection pool) plus a single session factory
+are created lazily the first time a handler asks for a session and are
+then shared by every request made from the same process.  The pool is
+configured from the same environment (or .env file) used for the
+database credentials.  GET handlers can also be awaited (submit_async),
+these share a second, asyncio engine built on the asyncpg driver which is
+only created (and asyncpg only imported) the first time it is used.
+
+When a read replica is configured the GET handlers read through a second
+pool connected to the replica while PUTs (and the ingest lookups) stay on
+the primary.  Replication is asynchronous so, to read its own writes, a
+process reads from the primary for a few seconds after it has written
+(SCORE_DB_READ_YOUR_WRITES_SECONDS) and any block of code can be pinned
+to the primary with read_from_primary().
+
+"""
+import atexit
+from contextlib import contextmanager
+import contextvars
+import importlib.util
+import os
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+DB_USERNAME_ENV = 'SCORE_POSTGRESQL_DB_USERNAME'
+DB_PASSWORD_ENV = 'SCORE_POSTGRESQL_DB_PASSWORD'
+DB_ENDPOINT_ENV = 'SCORE_POSTGRESQL_DB_ENDPOINT'
+DB_PORT_ENV = 'SCORE_POSTGRESQL_DB_PORT'
+DB_NAME_ENV = 'SCORE_POSTGRESQL_DB_NAME'
+DB_REPLICA_ENDPOINT_ENV = 'SCORE_POSTGRESQL_DB_REPLICA_ENDPOINT'
+DB_REPLICA_PORT_ENV = 'SCORE_POSTGRESQL_DB_REPLICA_PORT'
+DB_POOL_SIZE_ENV = 'SCORE_POSTGRESQL_DB_POOL_SIZE'
+DB_MAX_OVERFLOW_ENV = 'SCORE_POSTGRESQL_DB_MAX_OVERFLOW'
+DB_POOL_PRE_PING_ENV = 'SCORE_POSTGRESQL_DB_POOL_PRE_PING'
+DB_POOL_RECYCLE_ENV = 'SCORE_POSTGRESQL_DB_POOL_RECYCLE'
+AUTO_INIT_SCHEMA_ENV = 'SCORE_DB_AUTO_INIT_SCHEMA'
+LEAK_DETECTION_ENV = 'SCORE_DB_LEAK_DETECTION'
+READ_YOUR_WRITES_ENV = 'SCORE_DB_READ_YOUR_WRITES_SECONDS'
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_OVERFLOW = 20
+DEFAULT_POOL_PRE_PING = True
+# seconds, recycle well before RDS/proxy idle timeouts drop the socket
+DEFAULT_POOL_RECYCLE = 1800
+# seconds after a write during which reads stay on the primary
+DEFAULT_READ_YOUR_WRITES_SECONDS = 5
+
+TRUE_STRINGS = ['1', 'true', 'yes', 'on']
+
+ASYNC_DRIVER = 'asyncpg'
+
+PRIMARY = 'primary'
+REPLICA = 'replica'
+
+# set by read_from_primary(), follows threads started with asyncio.to_thread
+_read_from_primary = contextvars.ContextVar(
+    'score_db_read_from_primary', default=False)
+
+
+def get_int_setting(name, default):
+    value = os.getenv(name)
+    if value is None or value == '':
+        return default
+
+    try:
+        return int(value)
+    except ValueError as err:
+        msg = f'Environment setting \'{name}\' must be an integer, ' \
+            f'was: {value}'
+        raise ValueError(msg) from err
+
+
+def get_bool_setting(name, default):
+    value = os.getenv(name)
+    if value is None or value == '':
+        return default
+
+    return value.strip().lower() in TRUE_STRINGS
+
+
+@dataclass
+class DbSettings:
+    ''' connection and pool settings for the score-db database '''
+    user: str
+    passwd: str
+    host: str
+    port: str
+    db_name: str
+    pool_size: int = DEFAULT_POOL_SIZE
+    max_overflow: int = DEFAULT_MAX_OVERFLOW
+    pool_pre_ping: bool = DEFAULT_POOL_PRE_PING
+    pool_recycle: int = DEFAULT_POOL_RECYCLE
+    auto_init_schema: bool = False
+    leak_detection: bool = False
+    replica_host: str = None
+    replica_port: str = None
+    read_your_writes_seconds: int = DEFAULT_READ_YOUR_WRITES_SECONDS
+
+    def __post_init__(self):
+        if not isinstance(self.pool_size, int) or self.pool_size <= 0:
+            msg = f'pool_size must be a positive int - was: {self.pool_size}'
+            raise ValueError(msg)
+        if not isinstance(self.max_overflow, int) or self.max_overflow < 0:
+            msg = 'max_overflow must be a non-negative int - was: ' \
+                f'{self.max_overflow}'
+            raise ValueError(msg)
+        if not isinstance(self.read_your_writes_seconds, int) or \
+            self.read_your_writes_seconds < 0:
+            msg = 'read_your_writes_seconds must be a non-negative int - ' \
+                f'was: {self.read_your_writes_seconds}'
+            raise ValueError(msg)
+
+    def has_replica(self):
+        return self.replica_host is not None and self.replica_host != ''
+
+    def get_host_port(self, role=PRIMARY):
+        if role == REPLICA and self.has_replica():
+            port = self.replica_port
+            if port is None or port == '':
+                port = self.port
+            return self.replica_host, port
+        return self.host, self.port
+
+    def get_url(self, role=PRIMARY):
+        host, port = self.get_host_port(role)
+        return f'postgresql://{self.user}:{self.passwd}@{host}:' \
+            f'{port}/{self.db_name}'
+
+    def get_async_url(self, role=PRIMARY):
+        host, port = self.get_host_port(role)
+        return f'postgresql+{ASYNC_DRIVER}://{self.user}:{self.passwd}@' \
+            f'{host}:{port}/{self.db_name}'
+
+
+def get_settings_from_env():
+    load_dotenv()
+
+    return DbSettings(
+        os.getenv(DB_USERNAME_ENV),
+        os.getenv(DB_PASSWORD_ENV),
+        os.getenv(DB_ENDPOINT_ENV),
+        os.getenv(DB_PORT_ENV),
+        os.getenv(DB_NAME_ENV),
+        pool_size=get_int_setting(DB_POOL_SIZE_ENV, DEFAULT_POOL_SIZE),
+        max_overflow=get_int_setting(
+            DB_MAX_OVERFLOW_ENV, DEFAULT_MAX_OVERFLOW),
+        pool_pre_ping=get_bool_setting(
+            DB_POOL_PRE_PING_ENV, DEFAULT_POOL_PRE_PING),
+        pool_recycle=get_int_setting(
+            DB_POOL_RECYCLE_ENV, DEFAULT_POOL_RECYCLE),
+        auto_init_schema=get_bool_setting(AUTO_INIT_SCHEMA_ENV, False),
+        leak_detection=get_bool_setting(LEAK_DETECTION_ENV, False),
+        replica_host=os.getenv(DB_REPLICA_ENDPOINT_ENV),
+        replica_port=os.getenv(DB_REPLICA_PORT_ENV),
+        read_your_writes_seconds=get_int_setting(
+            READ_YOUR_WRITES_ENV, DEFAULT_READ_YOUR_WRITES_SECONDS)
+    )
+
+
+@dataclass
+class PoolCheckoutTracker:
+    """
+    Track connections checked out of the pool and not yet returned.  When
+    'capture_stacks' is set the stack of the code which checked out each
+    connection is kept so that a leaked connection can be traced back to
+    the handler which forgot to close its session.
+    """
+    capture_stacks: bool = False
+    checked_out: dict = field(default_factory=dict, init=False)
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False)
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        stack = None
+        if self.capture_stacks:
+            stack = ''.join(traceback.format_stack(limit=20)[:-1])
+        with self._lock:
+            self.checked_out[id(connection_record)] = stack
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checked_out.pop(id(connection_record), None)
+
+    def get_unreleased(self):
+        with self._lock:
+            return list(self.checked_out.values())
+
+    def report(self, stream=None):
+        unreleased = self.get_unreleased()
+        if len(unreleased) == 0:
+            return 0
+
+        if stream is None:
+            stream = sys.stderr
+
+        msg = f'score_db: {len(unreleased)} database connection(s) were ' \
+            'checked out of the pool and never released.'
+        if not self.capture_stacks:
+            msg += f' Set {LEAK_DETECTION_ENV}=true to record where.'
+        print(msg, file=stream)
+        for stack in unreleased:
+            if stack is not None:
+                print(f'connection checked out at:\n{stack}', file=stream)
+
+        return len(unreleased)
+
+
+@dataclass
+class ConnectionManager:
+    '''
+    owns the lazily created engines and session factories of the primary
+    and (if configured) of the read replica
+    '''
+    settings: DbSettings
+    engine: object = field(default=None, init=False)
+    session_factory: sessionmaker = field(default=None, init=False)
+    replica_engine: object = field(default=None, init=False)
+    replica_session_factory: sessionmaker = field(default=None, init=False)
+    async_engine: object = field(default=None, init=False)
+    async_session_factory: sessionmaker = field(default=None, init=False)
+    async_replica_engine: object = field(default=None, init=False)
+    async_replica_session_factory: sessionmaker = field(
+        default=None, init=False)
+    last_write: float = field(default=None, init=False)
+    checkout_tracker: PoolCheckoutTracker = field(default=None, init=False)
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False)
+
+    def __post_init__(self):
+        self.checkout_tracker = PoolCheckoutTracker(
+            self.settings.leak_detection)
+
+    def build_engine(self, role):
+        engine = create_engine(
+            self.settings.get_url(role),
+            pool_size=self.settings.pool_size,
+            max_overflow=self.settings.max_overflow,
+            pool_pre_ping=self.settings.pool_pre_ping,
+            pool_recycle=self.settings.pool_recycle,
+            echo=False,
+            connect_args={"options": "-c timezone=utc"}
+        )
+        event.listen(
+            engine, 'checkout', self.checkout_tracker.on_checkout)
+        event.listen(
+            engine, 'checkin', self.checkout_tracker.on_checkin)
+        return engine
+
+    def get_engine(self):
+        if self.engine is not None:
+            return self.engine
+
+        with self._lock:
+            if self.engine is None:
+                engine = self.build_engine(PRIMARY)
+                self.session_factory = sessionmaker(bind=engine)
+                self.engine = engine
+
+        return self.engine
+
+    def get_session(self):
+        self.get_engine()
+        return self.session_factory()
+
+    def get_replica_engine(self):
+        """ the read replica's engine, or the primary's if none is set """
+        if not self.settings.has_replica():
+            return self.get_engine()
+        if self.replica_engine is not None:
+            return self.replica_engine
+
+        with self._lock:
+            if self.replica_engine is None:
+                engine = self.build_engine(REPLICA)
+                self.replica_session_factory = sessionmaker(bind=engine)
+                self.replica_engine = engine
+
+        return self.replica_engine
+
+    def mark_write(self):
+        """ note that this process wrote to the primary just now """
+        self.last_write = time.monotonic()
+
+    def is_read_from_primary(self):
+        """
+        True if reads must go to the primary: no replica is configured,
+        the caller is inside read_from_primary() or this process wrote
+        less than 'read_your_writes_seconds' ago.
+        """
+        if not self.settings.has_replica() or _read_from_primary.get():
+            return True
+        last_write = self.last_write
+        return last_write is not None and \
+            time.monotonic() - last_write < \
+            self.settings.read_your_writes_seconds
+
+    def get_read_session(self):
+        """ a session for a GET, routed to the replica when possible """
+        if self.is_read_from_primary():
+            return self.get_session()
+        self.get_replica_engine()
+        return self.replica_session_factory()
+
+    def get_async_engine(self):
+        """
+        Return the asyncio engine.  asyncpg connections belong to the event
+        loop which opened them, so the engine must be disposed of (see
+        dispose_async_engine) before the loop is closed.
+        """
+        if self.async_engine is not None:
+            return self.async_engine
+
+        with self._lock:
+            if self.async_engine is None:
+                engine = self.build_async_engine(PRIMARY)
+                self.async_session_factory = self.get_async_session_factory(
+                    engine)
+                self.async_engine = engine
+
+        return self.async_engine
+
+    def build_async_engine(self, role):
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        engine = create_async_engine(
+            self.settings.get_async_url(role),
+            pool_size=self.settings.pool_size,
+            max_overflow=self.settings.max_overflow,
+            pool_pre_ping=self.settings.pool_pre_ping,
+            pool_recycle=self.settings.pool_recycle,
+            echo=False,
+            connect_args={'server_settings': {'timezone': 'utc'}}
+        )
+        event.listen(
+            engine.sync_engine, 'checkout',
+            self.checkout_tracker.on_checkout)
+        event.listen(
+            engine.sync_engine, 'checkin',
+            self.checkout_tracker.on_checkin)
+        return engine
+
+    def get_async_session_factory(self, engine):
+        from sqlalchemy.ext.asyncio import AsyncSession
+
+        return sessionmaker(
+            bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    def get_async_session(self):
+        self.get_async_engine()
+        return self.async_session_factory()
+
+    def get_async_replica_engine(self):
+        if not self.settings.has_replica():
+            return self.get_async_engine()
+        if self.async_replica_engine is not None:
+            return self.async_replica_engine
+
+        with self._lock:
+            if self.async_replica_engine is None:
+                engine = self.build_async_engine(REPLICA)
+                self.async_replica_session_factory = \
+                    self.get_async_session_factory(engine)
+                self.async_replica_engine = engine
+
+        return self.async_replica_engine
+
+    def get_async_read_session(self):
+        if self.is_read_from_primary():
+            return self.get_async_session()
+        self.get_async_replica_engine()
+        return self.async_replica_session_factory()
+
+    async def dispose_async_engine(self):
+        with self._lock:
+            engines = [self.async_engine, self.async_replica_engine]
+            self.async_engine = None
+            self.async_session_factory = None
+            self.async_replica_engine = None
+            self.async_replica_session_factory = None
+        for engine in engines:
+            if engine is not None:
+                await engine.dispose()
+
+    def get_pool_stats(self):
+        stats = {
+            'pool_size': self.settings.pool_size,
+            'max_overflow': self.settings.max_overflow,
+            'checked_in': 0,
+            'checked_out': 0,
+            'overflow': 0,
+            'unreleased': len(self.checkout_tracker.get_unreleased()),
+            'status': 'engine not created'
+        }
+
+        if self.engine is None:
+            return stats
+
+        pool = self.engine.pool
+        stats['checked_in'] = pool.checkedin()
+        stats['checked_out'] = pool.checkedout()
+        stats['overflow'] = pool.overflow()
+        stats['status'] = pool.status()
+
+        if self.replica_engine is not None:
+            pool = self.replica_engine.pool
+            stats['replica'] = {
+                'checked_in': pool.checkedin(),
+                'checked_out': pool.checkedout(),
+                'overflow': pool.overflow(),
+                'status': pool.status()
+            }
+        return stats
+
+    def dispose(self):
+        with self._lock:
+            for engine in [self.engine, self.replica_engine]:
+                if engine is not None:
+                    engine.dispose()
+            self.engine = None
+            self.session_factory = None
+            self.replica_engine = None
+            self.replica_session_factory = None
+            for engine in [self.async_engine, self.async_replica_engine]:
+                if engine is not None:
+                    terminate_async_engine(engine)
+            self.async_engine = None
+            self.async_session_factory = None
+            self.async_replica_engine = None
+            self.async_replica_session_factory = None
+
+
+def terminate_async_engine(engine):
+    """
+    Dispose of an async engine's pool from outside its event loop.  asyncpg
+    connections can only be closed gracefully by awaiting them on their
+    own loop (see ConnectionManager.dispose_async_engine), so the checked
+    in connections are terminated (their sockets closed) instead of being
+    left open.
+    """
+    sync_engine = engine.sync_engine
+    sync_engine.dialect.do_close = sync_engine.dialect.do_terminate
+    sync_engine.dispose()
+
+
+_connection_manager = None
+_connection_manager_lock = threading.Lock()
+
+
+def get_connection_manager():
+    global _connection_manager
+    if _connection_manager is not None:
+        return _connection_manager
+
+    with _connection_manager_lock:
+        if _connection_manager is None:
+            _connection_manager = ConnectionManager(get_settings_from_env())
+
+    return _connection_manager
+
+
+def reset_connection_manager():
+    """
+    Dispose of the shared engine so the next request builds a new one.
+    Call this after forking a worker process (pooled connections must not
+    be shared across processes) or after changing the pool settings.
+    """
+    global _connection_manager
+    with _connection_manager_lock:
+        if _connection_manager is not None:
+            _connection_manager.dispose()
+        _connection_manager = None
+
+
+def get_engine():
+    return get_connection_manager().get_engine()
+
+
+def get_session():
+    return get_connection_manager().get_session()
+
+
+def get_pool_stats():
+    return get_connection_manager().get_pool_stats()
+
+
+def get_read_session():
+    return get_connection_manager().get_read_session()
+
+
+def mark_write():
+    get_connection_manager().mark_write()
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Send every read made inside the block (in this thread or task, and in
+    threads it starts with asyncio.to_thread) to the primary, e.g. to GET
+    rows right after writing them:
+
+        with db_connection.read_from_primary():
+            response = ExptMetricRequest(request_dict).submit()
+    """
+    token = _read_from_primary.set(True)
+    try:
+        yield
+    finally:
+        _read_from_primary.reset(token)
+
+
+def has_async_driver():
+    return importlib.util.find_spec(ASYNC_DRIVER) is not None
+
+
+def get_async_engine():
+    return get_connection_manager().get_async_engine()
+
+
+def get_async_session():
+    return get_connection_manager().get_async_session()
+
+
+def get_async_read_session():
+    return get_connection_manager().get_async_read_session()
+
+
+async def dispose_async_engine():
+    if _connection_manager is None:
+        return
+    await _connection_manager.dispose_async_engine()
+
+
+def report_unreleased_connections():
+    """
+    Report (to stderr) any pooled connections which were checked out and
+    never returned.  Registered to run at interpreter exit.
+    """
+    if _connection_manager is None:
+        return 0
+
+    return _connection_manager.checkout_tracker.report()
+
+
+atexit.register(report_unreleased_connections)
@@ -0,0 +1,317 @@
+"""
+Copyright 2024 NOAA
+All rights reserved.
+
+Collection of methods to bulk load rows into a table with PostgreSQL's
+'COPY ... FROM STDIN'.  Rows are plain tuples (in the order of the column
+list) which are serialized in batches to either the CSV or the binary
+COPY format and streamed to the server over the session's connection, so
+the load commits or rolls back with the rest of the session.  This is
+much faster than an executemany of individual INSERT statements for the
+large fact tables (e.g. expt_metrics).  DataFrames can be copied
+directly, in the CSV format they are serialized column-wise by pandas
+without building a Python object per row.  COPY cannot resolve conflicts,
+so upsert_frame copies into a temporary staging table first and then
+merges it into the target table with 'INSERT ... ON CONFLICT DO UPDATE'.
+
+"""
+import csv
+from datetime import datetime, timezone
+import io
+from itertools import islice
+import math
+import struct
+
+import sqlalchemy as sa
+from sqlalchemy import BigInteger, Boolean, DateTime, Float, Integer, String
+from sqlalchemy.dialects.postgresql import insert
+
+from score_db import log_utils
+
+logger = log_utils.get_logger(__name__)
+
+COPY_FORMAT_CSV = 'csv'
+COPY_FORMAT_BINARY = 'binary'
+VALID_COPY_FORMATS = [COPY_FORMAT_CSV, COPY_FORMAT_BINARY]
+
+DEFAULT_COPY_FORMAT = COPY_FORMAT_CSV
+DEFAULT_COPY_BATCH_SIZE = 50000
+
+CSV_NULL = '\\N'
+CSV_DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+PGCOPY_TRAILER = struct.pack('!h', -1)
+NULL_FIELD = struct.pack('!i', -1)
+POSTGRES_EPOCH = datetime(2000, 1, 1)
+
+
+def validate_copy_format(copy_format):
+    if copy_format is None:
+        return DEFAULT_COPY_FORMAT
+
+    if copy_format not in VALID_COPY_FORMATS:
+        msg = f'copy_format must be one of {VALID_COPY_FORMATS}, was: ' \
+            f'{copy_format}'
+        raise ValueError(msg)
+    return copy_format
+
+
+def validate_batch_size(batch_size):
+    if batch_size is None:
+        return DEFAULT_COPY_BATCH_SIZE
+
+    if isinstance(batch_size, bool) or not isinstance(batch_size, int) or \
+        batch_size <= 0:
+        msg = f'batch_size must be a positive int, was: {batch_size}'
+        raise ValueError(msg)
+    return batch_size
+
+
+def is_null(value):
+    if value is None:
+        return True
+    try:
+        return math.isnan(value)
+    except TypeError:
+        return False
+
+
+def get_copy_statement(table_name, column_names, copy_format):
+    columns = ', '.join(column_names)
+    if copy_format == COPY_FORMAT_BINARY:
+        options = 'FORMAT binary'
+    else:
+        options = f'FORMAT csv, NULL \'{CSV_NULL}\''
+    return f'COPY {table_name} ({columns}) FROM STDIN WITH ({options})'
+
+
+def to_csv_buffer(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    for row in rows:
+        writer.writerow(
+            [CSV_NULL if is_null(value) else value for value in row])
+    buffer.seek(0)
+    return buffer
+
+
+def to_datetime(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def encode_int4(value):
+    return struct.pack('!i', int(value))
+
+
+def encode_int8(value):
+    return struct.pack('!q', int(value))
+
+
+def encode_float8(value):
+    return struct.pack('!d', float(value))
+
+
+def encode_bool(value):
+    return struct.pack('!?', bool(value))
+
+
+def encode_text(value):
+    return str(value).encode('utf-8')
+
+
+def encode_timestamp(value):
+    delta = to_datetime(value) - POSTGRES_EPOCH
+    microseconds = (delta.days * 86400 + delta.seconds) * 1000000 + \
+        delta.microseconds
+    return struct.pack('!q', microseconds)
+
+
+def get_binary_encoder(column):
+    # order matters, BigInteger is a subclass of Integer
+    column_type = column.type
+    if isinstance(column_type, Boolean):
+        return encode_bool
+    if isinstance(column_type, BigInteger):
+        return encode_int8
+    if isinstance(column_type, Integer):
+        return encode_int4
+    if isinstance(column_type, Float):
+        return encode_float8
+    if isinstance(column_type, String):
+        return encode_text
+    if isinstance(column_type, DateTime) and not column_type.timezone:
+        return encode_timestamp
+
+    msg = f'Column \'{column.name}\' of type \'{column_type}\' is not ' \
+        'supported by the binary COPY format, use the csv format instead.'
+    raise ValueError(msg)
+
+
+def to_binary_buffer(rows, encoders):
+    buffer = io.BytesIO()
+    buffer.write(PGCOPY_HEADER)
+    field_count = struct.pack('!h', len(encoders))
+    for row in rows:
+        buffer.write(field_count)
+        for value, encoder in zip(row, encoders):
+            if is_null(value):
+                buffer.write(NULL_FIELD)
+                continue
+            data = encoder(value)
+            buffer.write(struct.pack('!i', len(data)))
+            buffer.write(data)
+    buffer.write(PGCOPY_TRAILER)
+    buffer.seek(0)
+    return buffer
+
+
+def get_batches(rows, batch_size):
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if len(batch) == 0:
+            return
+        yield batch
+
+
+def copy_rows(session, table, column_names, rows, copy_format=None,
+              batch_size=None, target_name=None):
+    """
+    Stream 'rows' (an iterable of tuples ordered like 'column_names') into
+    'table' (a sqlalchemy Table) with COPY FROM STDIN, 'batch_size' rows
+    per COPY statement.  Runs inside the session's transaction, the caller
+    is responsible for the commit (e.g. via session_scope).  'target_name'
+    copies into another table with the same columns (e.g. a staging table).
+
+    Returns the number of rows copied.
+    """
+    copy_format = validate_copy_format(copy_format)
+    batch_size = validate_batch_size(batch_size)
+
+    encoders = None
+    if copy_format == COPY_FORMAT_BINARY:
+        encoders = [
+            get_binary_encoder(table.columns[name]) for name in column_names
+        ]
+
+    if target_name is None:
+        target_name = table.name
+    statement = get_copy_statement(target_name, column_names, copy_format)
+    dbapi_connection = session.connection().connection
+    row_count = 0
+    with dbapi_connection.cursor() as cursor:
+        for batch in get_batches(rows, batch_size):
+            if encoders is None:
+                buffer = to_csv_buffer(batch)
+            else:
+                buffer = to_binary_buffer(batch, encoders)
+            cursor.copy_expert(statement, buffer)
+            row_count += len(batch)
+            logger.debug(
+                'copied %s rows into %s (%s total)',
+                len(batch), target_name, row_count)
+
+    return row_count
+
+
+def copy_frame(session, table, frame, copy_format=None, batch_size=None,
+               target_name=None):
+    """
+    Same as copy_rows but for a DataFrame whose columns are named after
+    the table's columns.  Null values (None, NaN, NaT, NA) are loaded as
+    NULL.
+
+    Returns the number of rows copied.
+    """
+    copy_format = validate_copy_format(copy_format)
+    batch_size = validate_batch_size(batch_size)
+    column_names = list(frame.columns)
+
+    if copy_format == COPY_FORMAT_BINARY:
+        # the binary encoders work on python values, nulls become None
+        rows = frame.astype(object).where(frame.notna(), None).itertuples(
+            index=False, name=None)
+        return copy_rows(
+            session, table, column_names, rows, copy_format, batch_size,
+            target_name)
+
+    if target_name is None:
+        target_name = table.name
+    statement = get_copy_statement(target_name, column_names, copy_format)
+    dbapi_connection = session.connection().connection
+    row_count = 0
+    with dbapi_connection.cursor() as cursor:
+        for start in range(0, frame.shape[0], batch_size):
+            batch = frame.iloc[start:start + batch_size]
+            buffer = io.StringIO()
+            batch.to_csv(
+                buffer,
+                header=False,
+                index=False,
+                na_rep=CSV_NULL,
+                date_format=CSV_DATE_FORMAT
+            )
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+            row_count += batch.shape[0]
+            logger.debug(
+                'copied %s rows into %s (%s total)',
+                batch.shape[0], target_name, row_count)
+
+    return row_count
+
+
+def upsert_frame(session, table, frame, natural_key, key_column_names,
+                 update_column_names, copy_format=None, batch_size=None,
+                 server_values=None):
+    """
+    Insert the rows of 'frame' into 'table', updating 'update_column_names'
+    of any existing row with the same natural key.  'natural_key' is the
+    list of index expressions of the table's unique natural key index and
+    'key_column_names' the frame columns it is built from (rows repeating
+    a key within the frame are dropped, the last one wins).
+    'server_values' maps further columns to the SQL expressions the
+    database evaluates for each row (e.g. a created_at stamp).
+
+    Returns the number of rows written.
+    """
+    if server_values is None:
+        server_values = {}
+    frame = frame.drop_duplicates(subset=key_column_names, keep='last')
+    column_names = list(frame.columns)
+    columns = ', '.join(column_names)
+
+    staging_name = f'{table.name}_staging'
+    session.execute(sa.text(
+        f'CREATE TEMPORARY TABLE {staging_name} ON COMMIT DROP AS '
+        f'SELECT {columns} FROM {table.name} WITH NO DATA'
+    ))
+    copy_frame(
+        session, table, frame, copy_format, batch_size, staging_name)
+
+    staging = sa.table(
+        staging_name, *[sa.column(name) for name in column_names])
+    insert_stmt = insert(table).from_select(
+        column_names + list(server_values.keys()),
+        sa.select(
+            *[staging.c[name] for name in column_names],
+            *server_values.values()
+        )
+    )
+    upsert_stmt = insert_stmt.on_conflict_do_update(
+        index_elements=natural_key,
+        set_={
+            name: getattr(insert_stmt.excluded, name)
+            for name in update_column_names
+        }
+    )
+    session.execute(upsert_stmt)
+    session.execute(sa.text(f'DROP TABLE {staging_name}'))
+
+    logger.debug('upserted %s rows into %s', frame.shape[0], table.name)
+    return frame.shape[0]
@@ -4,110 +4,153 @@ All rights reserved.
 
 Collection request handlers registrations.  This module helps define
 the request handler format as well as the module definitions for each
-request type
+request type.  Each handler's request class is registered by its dotted
+path ('request_path') and is only imported the first time that request
+type is used (either through get_request_class or the handler's
+'request' attribute), so a simple request (e.g. a 'region' GET) does not
+pay to import plotting, harvesting or dataframe dependencies it never
+uses.
 
 """
 from collections import namedtuple
-from score_db.regions import RegionRequest
-from score_db.experiments import ExperimentRequest
+import importlib
+import threading
+
 from score_db.db_action_response import DbActionResponse
-from score_db.expt_metrics import ExptMetricRequest
-from score_db.metric_types import MetricTypeRequest
-from score_db.harvest_innov_stats import HarvestInnovStatsRequest
-from score_db.plot_innov_stats import PlotInnovStatsRequest
-from score_db.file_types import FileTypeRequest
-from score_db.storage_locations import StorageLocationRequest
-from score_db.expt_file_counts import ExptFileCountRequest
-from score_db.harvest_metrics import HarvestMetricsRequest
-from score_db.array_metric_types import ArrayMetricTypeRequest
-from score_db.sat_meta import SatMetaRequest
-from score_db.expt_array_metrics import ExptArrayMetricRequest
-from score_db.instrument_meta import InstrumentMetaRequest
 
+# GET 'output_format' values, see result_formats.py
 NAMED_TUPLES_LIST = 'tuples_list'
 PANDAS_DATAFRAME = 'pandas_dataframe'
+NUMPY_STRUCTURED_ARRAY = 'numpy_structured_array'
+ARROW_TABLE = 'arrow_table'
 
 INNOV_TEMPERATURE_NETCDF = 'innov_temperature_netcdf'
 
 
-RequestHandler = namedtuple(
+_resolved_requests = {}
+_resolve_lock = threading.Lock()
+
+
+def resolve_request_path(request_path):
+    """
+    Import and return the request class registered at 'request_path'
+    """
+    request_class = _resolved_requests.get(request_path)
+    if request_class is not None:
+        return request_class
+
+    with _resolve_lock:
+        request_class = _resolved_requests.get(request_path)
+        if request_class is None:
+            module_name, class_name = request_path.rsplit('.', 1)
+            module = importlib.import_module(module_name)
+            request_class = getattr(module, class_name)
+            _resolved_requests[request_path] = request_class
+
+    return request_class
+
+
+class RequestHandler(namedtuple(
     'RequestHandler',
     [
         'description',
-        'request',
+        'request_path',
         'result'
     ],
-)
+)):
+    """
+    Registered request handler, 'request' still returns the request
+    class (imported on first access) for callers of the registry
+    """
+    __slots__ = ()
+
+    @property
+    def request(self):
+        return resolve_request_path(self.request_path)
+
 
 request_registry = {
     'region': RequestHandler(
         'Add or get regions',
-        RegionRequest,
+        'score_db.regions.RegionRequest',
         DbActionResponse
     ),
     'experiment': RequestHandler(
         'Add or get or update experiment registration data',
-        ExperimentRequest,
+        'score_db.experiments.ExperimentRequest',
         DbActionResponse
     ),
     'expt_metrics': RequestHandler(
         'Add or get experiment metrics data',
-        ExptMetricRequest,
+        'score_db.expt_metrics.ExptMetricRequest',
         DbActionResponse
     ),
     'metric_types': RequestHandler(
         'Add or get or update metric types',
-        MetricTypeRequest,
+        'score_db.metric_types.MetricTypeRequest',
         DbActionResponse
     ),
     'harvest_innov_stats': RequestHandler(
         'Gather and store innovation statistics from diagnostics files',
-        HarvestInnovStatsRequest,
+        'score_db.harvest_innov_stats.HarvestInnovStatsRequest',
         DbActionResponse
     ),
     'plot_innov_stats': RequestHandler(
         'Plot innovation statistics',
-        PlotInnovStatsRequest,
+        'score_db.plot_innov_stats.PlotInnovStatsRequest',
         DbActionResponse
     ),
     'file_types': RequestHandler(
         'Add or get or update file types',
-        FileTypeRequest,
+        'score_db.file_types.FileTypeRequest',
         DbActionResponse
     ),
     'storage_locations': RequestHandler(
         'Add or get or update storage locations',
-        StorageLocationRequest,
+        'score_db.storage_locations.StorageLocationRequest',
         DbActionResponse
     ),
     'expt_file_counts': RequestHandler(
         'Add or get experiment file counts',
-        ExptFileCountRequest,
+        'score_db.expt_file_counts.ExptFileCountRequest',
         DbActionResponse
     ),
     'harvest_metrics': RequestHandler(
         'Harvest and store metrics',
-        HarvestMetricsRequest,
+        'score_db.harvest_metrics.HarvestMetricsRequest',
         DbActionResponse
     ),
     'array_metric_types': RequestHandler(
         'Add or get or update array metric types',
-        ArrayMetricTypeRequest,
+        'score_db.array_metric_types.ArrayMetricTypeRequest',
         DbActionResponse
     ),
     'sat_meta': RequestHandler(
         'Add or get or update sat metadata',
-        SatMetaRequest,
+        'score_db.sat_meta.SatMetaRequest',
         DbActionResponse
     ),
     'expt_array_metrics': RequestHandler(
         'Add or get experiment array metrics data',
-        ExptArrayMetricRequest,
+        'score_db.expt_array_metrics.ExptArrayMetricRequest',
         DbActionResponse
     ),
     'instrument_meta': RequestHandler(
         'Add or get or update instrument meta data',
-        InstrumentMetaRequest,
+        'score_db.instrument_meta.InstrumentMetaRequest',
         DbActionResponse
     )
 }
+
+def get_request_class(request_name):
+    """
+    Return the request class registered under 'request_name', importing
+    its module on first use.
+    """
+    request_handler = request_registry.get(request_name)
+    if request_handler is None:
+        msg = f'No request registered with name: \'{request_name}\', ' \
+            f'valid names: {list(request_registry.keys())}'
+        raise KeyError(msg)
+
+    return request_handler.request
@@ -6,25 +6,32 @@ Collection of methods to facilitate handling of score db requests
 
 """
 
+import asyncio
+import base64
 from collections import namedtuple
 import copy
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timedelta
+from itertools import islice
 import json
 import pprint
 from score_db.db_action_response import DbActionResponse
 import score_db.score_table_models as stm
 from score_db.score_table_models import MetricType as mt
+from score_db import db_connection
 from score_db import time_utils
+from score_db import log_utils
 
 from pandas import DataFrame
 import sqlalchemy as db
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.inspection import inspect
 from sqlalchemy import and_, or_, not_
-from sqlalchemy import asc, desc
+from sqlalchemy import asc, desc, tuple_
 from sqlalchemy.sql import func
 
+logger = log_utils.get_logger(__name__)
+
 ASCENDING = 'asc'
 DESCENDING = 'desc'
 
@@ -42,6 +49,23 @@ EXACT_DATETIME = 'exact'
 FROM_DATETIME = 'from'
 TO_DATETIME = 'to'
 
+# rows per DataFrame yielded by the streaming (chunked) GET requests
+DEFAULT_CHUNK_SIZE = 10000
+
+# keyset (seek) pagination key of the fact tables, rows of a page are
+# ordered by these columns and the next page starts after the last row
+PAGE_KEY_COLUMNS = ['time_valid', 'id']
+
+# watermark columns of an incremental ('since') GET of a fact table
+SINCE_CREATED_AT = 'created_at'
+SINCE_ID = 'id'
+SINCE_KEYS = [SINCE_CREATED_AT, SINCE_ID]
+
+# the 'since' watermark trails the database clock by this many seconds,
+# it must exceed the longest ingest transaction (and the replica lag)
+SINCE_SAFETY_LAG_ENV = 'SCORE_DB_SINCE_SAFETY_LAG_SECONDS'
+DEFAULT_SINCE_SAFETY_LAG_SECONDS = 300
+
 HERA = 'hera'
 ORION = 'orion'
 PW_AZV1 = 'pw_azv1'
@@ -51,13 +75,113 @@ PW_AWV2 = 'pw_awv2'
 
 VALID_PLATFORMS = [HERA, ORION, PW_AZV1, PW_AZV2, PW_AWV1, PW_AWV2]
 
+def validate_chunk_size(chunk_size):
+    if chunk_size is None:
+        return DEFAULT_CHUNK_SIZE
+
+    if isinstance(chunk_size, bool) or not isinstance(chunk_size, int) or \
+        chunk_size <= 0:
+        msg = f'chunk_size must be a positive int, was: {chunk_size}'
+        raise ValueError(msg)
+    return chunk_size
+
+
+def iter_chunks(iterable, chunk_size):
+    """ yield lists of at most 'chunk_size' items from 'iterable' """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+def get_stream_response(request_dict, chunks, chunk_size, message):
+    """
+    Response of a streaming GET request, the records are not read until
+    the caller iterates over details['chunks'] (a generator of chunks in the
+    request's output_format, DataFrames by default).
+    The database session stays open until the generator is exhausted or
+    closed.
+    """
+    return DbActionResponse(
+        request_dict,
+        True,
+        message,
+        {
+            'chunks': chunks,
+            'chunk_size': chunk_size
+        },
+        None
+    )
+
+
+async def submit_in_thread(request):
+    """ run a request's blocking submit without blocking the event loop """
+    return await asyncio.to_thread(request.submit)
+
+
+async def gather_requests(requests):
+    """
+    Await the submit_async of every request concurrently, the responses
+    are returned in the order of 'requests'.
+    """
+    return await asyncio.gather(
+        *[request.submit_async() for request in requests])
+
+
+def submit_all(requests):
+    """
+    Submit independent requests (e.g. one expt_metrics GET per experiment)
+    concurrently over the async engine and return their responses in
+    order.  Runs its own event loop, so it must not be called from a
+    coroutine (await gather_requests instead).  Falls back to submitting
+    the requests one after the other when the async driver is not
+    installed.
+    """
+    if not db_connection.has_async_driver():
+        logger.debug(
+            '%s is not installed, submitting %s requests sequentially',
+            db_connection.ASYNC_DRIVER, len(requests))
+        return [request.submit() for request in requests]
+
+    async def submit():
+        try:
+            return await gather_requests(requests)
+        finally:
+            # the pooled connections belong to this event loop
+            await db_connection.dispose_async_engine()
+
+    return asyncio.run(submit())
+
+
+def get_latest_records_filter(query, cls, natural_key):
+    """
+    Returns a filter which keeps only the newest row (by created_at, then
+    id) of each natural key among the rows matched by 'query'.  The newest
+    rows are picked by PostgreSQL with 'DISTINCT ON' so superseded
+    duplicates never leave the server.
+    """
+    latest_ids = query.with_entities(
+        cls.id
+    ).distinct(
+        *natural_key
+    ).order_by(
+        *natural_key,
+        cls.created_at.desc().nullslast(),
+        cls.id.desc()
+    ).subquery()
+
+    return cls.id.in_(db.select(latest_ids.c.id))
+
+
 def validate_column_name(cls, value):
     if not isinstance(value, str):
         raise TypeError(f'Column name must be a str, was {type(value)}')
 
     try:
         column_obj = getattr(cls, value)
-        print(f'column: {column_obj}, type(key): {type(column_obj)}')
+        logger.debug('column: %s, type(key): %s', column_obj, type(column_obj))
     except Exception as err:
         msg = f'Column does not exist - err: {err}'
         raise ValueError(msg)
@@ -105,7 +229,7 @@ def build_column_ordering(cls, ordering):
 
     constructed_ordering = []
     for value in ordering:
-        print(f'value: {value}')
+        logger.debug('value: %s', value)
 
         if type(value) != dict:
             msg = f'List items must be a type-dict - was {type(value)}'
@@ -119,13 +243,228 @@ def build_column_ordering(cls, ordering):
         else:
             constructed_ordering.append(desc(col_obj))
     
-    print(f'constructed_ordering: {constructed_ordering}')
+    logger.debug('constructed_ordering: %s', constructed_ordering)
     return constructed_ordering
 
+
+def get_page_direction(ordering):
+    """
+    Returns the direction (ASCENDING or DESCENDING) of the keyset pages for
+    the requested 'ordering' or None if the ordering is not on the page key
+    (time_valid, id), in which case the results cannot be paged.
+    """
+    if ordering is None or len(ordering) == 0:
+        return ASCENDING
+
+    names = [value.get('name') for value in ordering]
+    if names != PAGE_KEY_COLUMNS[:len(names)]:
+        return None
+
+    directions = {validate_order_dir(value.get('order_by')) for value in ordering}
+    if len(directions) > 1:
+        return None
+    return directions.pop()
+
+
+def encode_page_cursor(record):
+    """ opaque cursor pointing after 'record' (a row with the page key) """
+    time_valid = record['time_valid']
+    if time_valid is not None and time_valid == time_valid:
+        time_valid = time_valid.isoformat()
+    else:
+        time_valid = None
+    values = [time_valid, int(record['id'])]
+    return base64.urlsafe_b64encode(
+        json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_page_cursor(cursor):
+    try:
+        time_valid, record_id = json.loads(
+            base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if time_valid is not None:
+            time_valid = datetime.fromisoformat(time_valid)
+        return time_valid, int(record_id)
+    except Exception as err:
+        msg = f'Invalid page cursor: {cursor}'
+        raise ValueError(msg) from err
+
+
+def get_page_filter(cls, cursor, direction):
+    """
+    Filter selecting the rows after 'cursor' in (time_valid, id) order.
+    PostgreSQL sorts NULL time_valid values last in ascending (first in
+    descending) order, so they are handled separately when the column is
+    nullable.
+    """
+    time_valid, record_id = decode_page_cursor(cursor)
+    nullable = cls.__table__.c.time_valid.nullable
+    page_key = tuple_(cls.time_valid, cls.id)
+
+    if direction == ASCENDING:
+        if time_valid is None:
+            return and_(cls.time_valid.is_(None), cls.id > record_id)
+        page_filter = page_key > tuple_(time_valid, record_id)
+        if nullable:
+            page_filter = or_(page_filter, cls.time_valid.is_(None))
+        return page_filter
+
+    if time_valid is None:
+        return or_(
+            and_(cls.time_valid.is_(None), cls.id < record_id),
+            cls.time_valid.isnot(None)
+        )
+    return page_key < tuple_(time_valid, record_id)
+
+
+def apply_ordering_and_limit(query, cls, ordering, record_limit, cursor=None):
+    """
+    Add the ORDER BY and LIMIT clauses to 'query'.  When 'record_limit' is
+    set and the ordering is on the page key (or not given) the rows are
+    ordered by (time_valid, id) so that the next page can be fetched by
+    passing the 'next_cursor' of the response as 'cursor' - this seeks on
+    the key instead of scanning the skipped rows like OFFSET would.
+    """
+    direction = get_page_direction(ordering)
+    if cursor is not None:
+        if record_limit is None or direction is None:
+            msg = 'A page \'cursor\' requires a \'record_limit\' and an ' \
+                f'ordering on {PAGE_KEY_COLUMNS}, ordering: {ordering}'
+            raise ValueError(msg)
+        query = query.filter(get_page_filter(cls, cursor, direction))
+
+    if record_limit is not None and direction is not None:
+        ordering = [
+            {'name': name, 'order_by': direction} for name in PAGE_KEY_COLUMNS
+        ]
+
+    column_ordering = build_column_ordering(cls, ordering)
+    if column_ordering is not None and len(column_ordering) > 0:
+        for ordering_item in column_ordering:
+            query = query.order_by(ordering_item)
+
+    if record_limit is not None:
+        query = query.limit(record_limit)
+
+    return query
+
+
+def get_next_page_cursor(records, ordering, record_limit):
+    """
+    Cursor of the page after 'records' (a DataFrame or a list of named
+    tuples) or None when 'records' is the last page.
+    """
+    if record_limit is None or get_page_direction(ordering) is None:
+        return None
+    if records is None or len(records) < record_limit:
+        return None
+    if isinstance(records, DataFrame):
+        return encode_page_cursor(records.iloc[-1])
+
+    last_record = records[-1]
+    return encode_page_cursor({
+        'time_valid': last_record.time_valid,
+        'id': last_record.id
+    })
+
+def validate_since(since):
+    """
+    Normalize the 'since' param of a fact table GET: a dict holding a
+    'created_at' watermark (a datetime or an ISO format string) and/or the
+    last seen 'id'.  An empty dict selects every row, which is how a client
+    gets its first watermark.  Returns None if 'since' is None.
+    """
+    if since is None:
+        return None
+
+    if not isinstance(since, dict):
+        msg = f'\'since\' must be a dict with keys in {SINCE_KEYS}, ' \
+            f'was: {type(since)}'
+        raise TypeError(msg)
+
+    unknown_keys = set(since.keys()) - set(SINCE_KEYS)
+    if len(unknown_keys) > 0:
+        msg = f'\'since\' keys must be in {SINCE_KEYS}, was: {unknown_keys}'
+        raise ValueError(msg)
+
+    created_at = since.get(SINCE_CREATED_AT)
+    if isinstance(created_at, str):
+        try:
+            created_at = datetime.fromisoformat(created_at)
+        except ValueError as err:
+            msg = f'Invalid \'since\' created_at: {created_at}'
+            raise ValueError(msg) from err
+    elif created_at is not None and not isinstance(created_at, datetime):
+        msg = f'\'since\' created_at must be a datetime or a str, ' \
+            f'was: {type(created_at)}'
+        raise TypeError(msg)
+
+    record_id = since.get(SINCE_ID)
+    if record_id is not None:
+        if isinstance(record_id, bool) or not isinstance(record_id, int):
+            msg = f'\'since\' id must be an int, was: {type(record_id)}'
+            raise TypeError(msg)
+
+    return {SINCE_CREATED_AT: created_at, SINCE_ID: record_id}
+
+
+def get_since_filter(cls, since):
+    """
+    Filter selecting the rows of 'cls' written after the 'since'
+    watermark: rows created (or re-written by an upsert, which sets a new
+    created_at) after its created_at, or inserted after its id.  Returns
+    None if the watermark is empty.
+    """
+    conditions = []
+    if since.get(SINCE_CREATED_AT) is not None:
+        conditions.append(cls.created_at > since[SINCE_CREATED_AT])
+    if since.get(SINCE_ID) is not None:
+        conditions.append(cls.id > since[SINCE_ID])
+
+    if len(conditions) == 0:
+        return None
+    return or_(*conditions)
+
+
+def get_since_safety_lag():
+    return db_connection.get_int_setting(
+        SINCE_SAFETY_LAG_ENV, DEFAULT_SINCE_SAFETY_LAG_SECONDS)
+
+
+def get_safe_watermark(server_time, since, lag_seconds):
+    """
+    The watermark of an incremental GET read at 'server_time': the
+    database clock less 'lag_seconds' (never earlier than the 'since'
+    watermark it replaces).  created_at is stamped while a row is written
+    but the row only becomes visible when its transaction commits, a
+    transaction which is still open when the rows are read can't have
+    stamped its rows later than the lag before the read as long as it is
+    shorter than the lag.  Rows stamped within the lag are returned again
+    by the next GET (at least once delivery).  The id watermark is dropped,
+    ids are taken from their sequence before commit so a larger id does
+    not mean a later commit.
+    """
+    created_at = server_time - timedelta(seconds=lag_seconds)
+    if since.get(SINCE_CREATED_AT) is not None and \
+        since[SINCE_CREATED_AT] > created_at:
+        created_at = since[SINCE_CREATED_AT]
+    return {SINCE_CREATED_AT: created_at, SINCE_ID: None}
+
+
+def get_since_watermark(session, since):
+    """
+    The watermark to pass as 'since' on the next incremental GET, read from
+    the database clock before the rows themselves (see get_safe_watermark)
+    """
+    server_time = session.execute(
+        db.select(stm.get_server_utcnow())).scalar()
+    return get_safe_watermark(server_time, since, get_since_safety_lag())
+
+
 def validate_method(method):
     if method not in VALID_METHODS:
         msg = f'Request type must be one of: {VALID_METHODS}, actually: {method}'
-        print(msg)
+        logger.error(msg)
         raise ValueError(msg)
     
     return method
@@ -0,0 +1,197 @@
+"""
+Copyright 2024 NOAA
+All rights reserved.
+
+In-process cache of the small dimension tables (regions, metric_types,
+array_metric_types, sat_meta, instrument_meta, file_types and
+storage_locations) used to resolve names to ids while ingesting fact
+table rows.  Each table is read once with a single query and kept as a
+name -> id index until its time to live expires, the table is explicitly
+invalidated (the dimension PUT handlers do this after writing) or a
+lookup misses, in which case the table is reloaded once before the key is
+reported as unknown.  The time to live (seconds) can be set from the
+environment (or .env file), e.g.
+
+SCORE_DB_DIMENSION_CACHE_TTL = 600
+
+A value of 0 disables the cache (every lookup reads the table).
+
+"""
+from dataclasses import dataclass, field
+import threading
+import time
+
+from sqlalchemy import select
+
+from score_db import db_connection
+from score_db import log_utils
+import score_db.score_table_models as stm
+
+logger = log_utils.get_logger(__name__)
+
+DIMENSION_CACHE_TTL_ENV = 'SCORE_DB_DIMENSION_CACHE_TTL'
+DEFAULT_TTL_SECONDS = 300
+
+
+class DimensionCacheError(Exception):
+    def __init__(self, m):
+        self.message = m
+    def __str__(self):
+        return self.message
+
+
+@dataclass
+class DimensionCache:
+    """
+    Cached rows of one dimension table: its id plus the 'key_columns'
+    which are used to find it.  The index maps the values of the
+    'key_columns' to the id, when several rows share a key the one with
+    the highest id (the last row read) wins, as the name -> id dicts the
+    ingest handlers built from the dimension GETs did.
+    """
+    cls: type
+    key_columns: list
+    ttl: float = DEFAULT_TTL_SECONDS
+    rows: list = field(default_factory=list, init=False)
+    index: dict = field(default_factory=dict, init=False)
+    loaded_at: float = field(default=None, init=False)
+    lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False)
+
+    def is_expired(self):
+        return self.loaded_at is None or \
+            time.monotonic() - self.loaded_at >= self.ttl
+
+    def load(self):
+        columns = [self.cls.id] + [
+            getattr(self.cls, name) for name in self.key_columns
+        ]
+        with stm.session_scope() as session:
+            rows = session.execute(
+                select(*columns).order_by(self.cls.id)).all()
+
+        index = {}
+        for row in rows:
+            index[self.get_key(row[1:])] = row[0]
+
+        with self.lock:
+            self.rows = [tuple(row) for row in rows]
+            self.index = index
+            self.loaded_at = time.monotonic()
+        logger.debug(
+            'loaded %s %s rows', len(rows), self.cls.__tablename__)
+
+    def get_key(self, values):
+        if len(self.key_columns) == 1:
+            return values[0]
+        return tuple(values)
+
+    def invalidate(self):
+        with self.lock:
+            self.loaded_at = None
+
+    def get_index(self):
+        if self.is_expired():
+            self.load()
+        return self.index
+
+    def get_ids(self, keys):
+        """
+        Returns a dict of the ids of the 'keys' which exist, the table is
+        reloaded once if any key is missing from the cached index.
+        """
+        keys = set(keys)
+        reloaded = self.is_expired()
+        index = self.get_index()
+        if not reloaded and not keys.issubset(index.keys()):
+            self.load()
+            index = self.index
+        return {key: index[key] for key in keys if key in index}
+
+    def get_id(self, key):
+        return self.get_ids([key]).get(key)
+
+    def find_id(self, **values):
+        """
+        Returns the id of the first row whose key columns equal the given
+        (not None) values, or None.  Mirrors a GET request filtering on
+        the same columns with a record_limit of 1.
+        """
+        values = {
+            name: value for name, value in values.items() if value is not None
+        }
+        positions = {
+            self.key_columns.index(name) + 1: value
+            for name, value in values.items()
+        }
+
+        reloaded = self.is_expired()
+        self.get_index()
+        while True:
+            for row in self.rows:
+                if all(row[pos] == value for pos, value in positions.items()):
+                    return row[0]
+            if reloaded:
+                return None
+            self.load()
+            reloaded = True
+
+
+DIMENSION_KEY_COLUMNS = {
+    stm.REGIONS_TABLE: (stm.Region, ['name']),
+    stm.METRIC_TYPES_TABLE: (stm.MetricType, ['name']),
+    stm.ARRAY_METRIC_TYPES_TABLE: (stm.ArrayMetricType, ['name']),
+    stm.SAT_META_TABLE: (
+        stm.SatMeta, ['name', 'sat_id', 'sat_name', 'short_name']),
+    stm.INSTRUMENT_META_TABLE: (stm.InstrumentMeta, ['name']),
+    stm.FILE_TYPES_TABLE: (stm.FileType, ['name']),
+    stm.STORAGE_LOCATION_TABLE: (
+        stm.StorageLocation, ['bucket_name', 'platform', 'key']),
+}
+
+_caches = {}
+_lock = threading.Lock()
+
+
+def get_ttl():
+    return db_connection.get_int_setting(
+        DIMENSION_CACHE_TTL_ENV, DEFAULT_TTL_SECONDS)
+
+
+def get_cache(table_name):
+    """ returns the (process-wide) cache of a dimension table """
+    cache = _caches.get(table_name)
+    if cache is not None:
+        return cache
+
+    if table_name not in DIMENSION_KEY_COLUMNS:
+        msg = f'No dimension cache for table \'{table_name}\', must be ' \
+            f'one of {list(DIMENSION_KEY_COLUMNS.keys())}'
+        raise DimensionCacheError(msg)
+
+    with _lock:
+        if table_name not in _caches:
+            cls, key_columns = DIMENSION_KEY_COLUMNS[table_name]
+            _caches[table_name] = DimensionCache(cls, key_columns, get_ttl())
+        return _caches[table_name]
+
+
+def get_ids(table_name, keys):
+    return get_cache(table_name).get_ids(keys)
+
+
+def get_id(table_name, key):
+    return get_cache(table_name).get_id(key)
+
+
+def find_id(table_name, **values):
+    return get_cache(table_name).find_id(**values)
+
+
+def invalidate(table_name=None):
+    """ drop the cached rows of one (or, by default, every) table """
+    with _lock:
+        caches = list(_caches.values()) if table_name is None else \
+            [_caches[table_name]] if table_name in _caches else []
+    for cache in caches:
+        cache.invalidate()
@@ -0,0 +1,98 @@
+"""
+Copyright 2024 NOAA
+All rights reserved.
+
+Resolves an experiment key (name, wallclock_start) to the experiment's id
+for the fact table handlers (expt_metrics, expt_array_metrics and
+expt_file_counts).  The id is read with a single 'SELECT id' statement,
+no ExperimentRequest or DataFrame is built, and every key which is found
+is memoized for the life of the process.  Experiments are written with an
+upsert on their (name, wallclock_start) unique constraint so the id of a
+key never changes once it exists, misses are never memoized so an
+experiment registered later is found on the next lookup.
+
+"""
+from datetime import datetime
+import threading
+
+from sqlalchemy import select
+
+from score_db import log_utils
+from score_db import time_utils
+import score_db.score_table_models as stm
+from score_db.score_table_models import Experiment as exp
+
+logger = log_utils.get_logger(__name__)
+
+_experiment_ids = {}
+_lock = threading.Lock()
+
+
+class ExperimentIdError(Exception):
+    def __init__(self, m):
+        self.message = m
+    def __str__(self):
+        return self.message
+
+
+def get_wallclock_start(wallclock_start):
+    if wallclock_start is None or isinstance(wallclock_start, datetime):
+        return wallclock_start
+    return time_utils.get_time(wallclock_start)
+
+
+def get_experiment_statement(name, wallclock_start):
+    statement = select(exp.id)
+    if name is not None:
+        statement = statement.where(exp.name == name)
+    if wallclock_start is not None:
+        statement = statement.where(exp.wallclock_start == wallclock_start)
+    return statement.order_by(exp.wallclock_start.desc()).limit(1)
+
+
+def get_experiment_id(name, wallclock_start):
+    """
+    Returns the id of the experiment named 'name' which started at
+    'wallclock_start' (a datetime or a '%Y-%m-%d %H:%M:%S' string).  Same
+    as a GET experiment request with an exact filter on both columns, when
+    either is None the filter is dropped and the latest matching experiment
+    is returned (such lookups are not memoized).
+
+    Raises ExperimentIdError if no experiment matches.
+    """
+    try:
+        wallclock_start = get_wallclock_start(wallclock_start)
+    except ValueError as err:
+        msg = f'Invalid experiment wallclock_start: {wallclock_start} - ' \
+            f'err: {err}'
+        raise ExperimentIdError(msg) from err
+
+    key = (name, wallclock_start)
+    memoize = name is not None and wallclock_start is not None
+    if memoize:
+        experiment_id = _experiment_ids.get(key)
+        if experiment_id is not None:
+            return experiment_id
+
+    with stm.session_scope() as session:
+        experiment_id = session.execute(
+            get_experiment_statement(name, wallclock_start)).scalar()
+
+    if experiment_id is None:
+        msg = f'No experiment record found for name: {name}, ' \
+            f'wallclock_start: {wallclock_start}'
+        raise ExperimentIdError(msg)
+
+    logger.debug(
+        'resolved experiment (%s, %s) to id: %s',
+        name, wallclock_start, experiment_id)
+    if memoize:
+        with _lock:
+            _experiment_ids[key] = experiment_id
+    return experiment_id
+
+
+def invalidate():
+    """ forget every memoized experiment id """
+    with _lock:
+        _experiment_ids.clear()
@@ -24,6 +24,8 @@ import score_db.score_table_models as stm
 from score_db.score_table_models import Experiment as exp
 from score_db import time_utils
 from score_db import db_utils
+from score_db import log_utils
+from score_db import result_formats
 
 from pandas import DataFrame
 import sqlalchemy as db
@@ -33,6 +35,8 @@ from sqlalchemy import and_, or_, not_
 from sqlalchemy import asc, desc
 from sqlalchemy.sql import func
 
+logger = log_utils.get_logger(__name__)
+
 ExperimentData = namedtuple(
     'ExperimentData',
     [
@@ -65,7 +69,7 @@ class Experiment:
     experiment_data: ExperimentData = field(init=False)
 
     def __post_init__(self):
-        print(f'in post init name: {self.name}')
+        logger.debug('in post init name: %s', self.name)
         if self.cycle_start > self.cycle_stop:
             msg = f'start time must be before end time - start: {self.cycle_start}, ' \
                 f'end: {self.cycle_stop}'
@@ -75,7 +79,7 @@ class Experiment:
                 f'\'{self.platform}\''
             raise ValueError(msg)
         
-        print(f'description: {self.description}')
+        logger.debug('description: %s', self.description)
         self.experiment_data = ExperimentData(
             self.name,
             self.cycle_start,
@@ -183,11 +187,11 @@ def get_time_filter(filters, cls, key, constructed_filter):
 
     bounds = filters.get(key)
     if bounds is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
         return constructed_filter
 
     exact_datetime = time_utils.get_time(bounds.get(db_utils.EXACT_DATETIME))
-    print(f'exact_datetime: {exact_datetime}')
+    logger.debug('exact_datetime: %s', exact_datetime)
     if exact_datetime is not None:
         constructed_filter[key] = (
             getattr(cls, key) == exact_datetime
@@ -198,7 +202,7 @@ def get_time_filter(filters, cls, key, constructed_filter):
     to_datetime = time_utils.get_time(bounds.get(db_utils.TO_DATETIME))
     
     
-    print(f'Column \'{key}\' is of type {type(getattr(cls, key).type)}.')
+    logger.debug('Column \'%s\' is of type %s.', key, type(getattr(cls, key).type))
 
     if from_datetime is not None and to_datetime is not None:
         if to_datetime < from_datetime:
@@ -217,7 +221,7 @@ def get_time_filter(filters, cls, key, constructed_filter):
             getattr(cls, key) <= to_datetime
         )
 
-    print(f'constructed_filter: {constructed_filter}')
+    logger.debug('constructed_filter: %s', constructed_filter)
     return constructed_filter
 
 
@@ -227,11 +231,11 @@ def get_string_filter(filters, cls, key, constructed_filter):
             f'type: {type(filters)}'
         raise TypeError(msg)
 
-    print(f'Column \'{key}\' is of type {type(getattr(cls, key).type)}.')
+    logger.debug('Column \'%s\' is of type %s.', key, type(getattr(cls, key).type))
     string_flt = filters.get(key)
 
     if string_flt is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
         return constructed_filter
 
     like_filter = string_flt.get('like')
@@ -328,6 +332,7 @@ class ExperimentRequest:
     filters: dict = field(default_factory=dict, init=False)
     ordering: list = field(default_factory=list, init=False)
     record_limit: int = field(default_factory=int, init=False)
+    output_format: str = field(default=None, init=False)
     body: dict = field(default_factory=dict, init=False)
     experiment: Experiment = field(init=False)
     experiment_data: namedtuple = field(init=False)
@@ -337,6 +342,7 @@ class ExperimentRequest:
         method = self.request_dict.get('method')
         self.method = db_utils.validate_method(method)
         self.params = self.request_dict.get('params')
+        self.output_format = result_formats.get_output_format(self.params)
         self.filters = None
         self.ordering = None
         self.record_limit = None
@@ -348,7 +354,7 @@ class ExperimentRequest:
             if not type(self.record_limit) == int or self.record_limit <= 0:
                 self.record_limit = None
                 
-        print(f'filters: {self.filters}')
+        logger.debug('filters: %s', self.filters)
         self.body = self.request_dict.get('body')
         if self.method == db_utils.HTTP_PUT:
             self.experiment = get_experiment_from_body(self.body)
@@ -356,7 +362,7 @@ class ExperimentRequest:
             self.experiment_data = self.experiment.get_experiment_data()
             for k, v in zip(self.experiment_data._fields, self.experiment_data):
                 val = pprint.pformat(v, indent=4)
-                print(f'exp_data: k: {k}, v: {val}')
+                logger.debug('exp_data: k: %s, v: %s', k, val)
         
 
     def submit(self):
@@ -369,9 +375,6 @@ class ExperimentRequest:
 
     
     def put_experiment(self):
-        engine = stm.get_engine_from_settings()
-        session = stm.get_session()
-
         record = exp(
             name=self.experiment_data.name,
             cycle_start=self.experiment_data.cycle_start,
@@ -401,7 +404,7 @@ class ExperimentRequest:
             created_at=datetime.utcnow(),
             updated_at=None
         ).returning(exp)
-        print(f'insert_stmt: {insert_stmt}')
+        logger.debug('insert_stmt: %s', insert_stmt)
 
         time_now = datetime.utcnow()
 
@@ -414,7 +417,7 @@ class ExperimentRequest:
             )
         )
 
-        print(f'do_update_stmt: {do_update_stmt}')
+        logger.debug('do_update_stmt: %s', do_update_stmt)
 
         
         # temp = vars(result._metadata)
@@ -422,27 +425,29 @@ class ExperimentRequest:
         # for item in temp:
         #     print(item, ':', temp[item])
 
-        try:
-            result = session.execute(do_update_stmt)
-            session.flush()
-            result_row = result.fetchone()
-            action = db_utils.INSERT
-            if result_row.updated_at is not None:
-                action = db_utils.UPDATE
-            # print(f'result.fetchone(): {result_row}')
-            # print(f'updated_at: {result_row.updated_at}')
-            # print(f'result.fetchone().keys(): {result_row._mapping}')
-
-            session.commit()
-            session.close()
-        except Exception as err:
-            action = db_utils.INSERT
-            message = f'Attempt to {action} experiment record FAILED'
-            error_msg = f'Failed to insert/update record - err: {err}'
-            print(f'error_msg: {error_msg}')
-        else:
-            message = f'Attempt to {action} experiment record SUCCEEDED'
-            error_msg = None
+        with stm.session_scope() as session:
+            try:
+                result = session.execute(do_update_stmt)
+                session.flush()
+                result_row = result.fetchone()
+                action = db_utils.INSERT
+                if result_row.updated_at is not None:
+                    action = db_utils.UPDATE
+                # print(f'result.fetchone(): {result_row}')
+                # print(f'updated_at: {result_row.updated_at}')
+                # print(f'result.fetchone().keys(): {result_row._mapping}')
+
+                session.commit()
+            except Exception as err:
+                session.rollback()
+                result_row = None
+                action = db_utils.INSERT
+                message = f'Attempt to {action} experiment record FAILED'
+                error_msg = f'Failed to insert/update record - err: {err}'
+                logger.error('error_msg: %s', error_msg)
+            else:
+                message = f'Attempt to {action} experiment record SUCCEEDED'
+                error_msg = None
         
         results = {}
         if result_row is not None:
@@ -458,62 +463,60 @@ class ExperimentRequest:
             error_msg
         )
 
-        print(f'response: {response}')
+        logger.debug('response: %s', response)
         return response
 
     
     def get_experiments(self):
-        engine = stm.get_engine_from_settings()
-        session = stm.get_session()
-
-        q = session.query(
-            exp.id,
-            exp.name,
-            exp.cycle_start,
-            exp.cycle_stop,
-            exp.owner_id,
-            exp.group_id,
-            exp.experiment_type,
-            exp.platform,
-            exp.wallclock_start,
-            exp.wallclock_end,
-            exp.created_at,
-            exp.updated_at
-        ).select_from(
-            exp
-        )
+        with stm.read_session_scope() as session:
+            q = session.query(
+                exp.id,
+                exp.name,
+                exp.cycle_start,
+                exp.cycle_stop,
+                exp.owner_id,
+                exp.group_id,
+                exp.experiment_type,
+                exp.platform,
+                exp.wallclock_start,
+                exp.wallclock_end,
+                exp.created_at,
+                exp.updated_at
+            ).select_from(
+                exp
+            )
 
-        if self.filters is not None and len(self.filters) > 0:
-            for key, value in self.filters.items():
-                q = q.filter(value)
+            if self.filters is not None and len(self.filters) > 0:
+                for key, value in self.filters.items():
+                    q = q.filter(value)
         
-        # add column ordering
-        column_ordering = db_utils.build_column_ordering(exp, self.ordering)
-        if column_ordering is not None and len(column_ordering) > 0:
-            for ordering_item in column_ordering:
-                q = q.order_by(ordering_item)
+            # add column ordering
+            column_ordering = db_utils.build_column_ordering(exp, self.ordering)
+            if column_ordering is not None and len(column_ordering) > 0:
+                for ordering_item in column_ordering:
+                    q = q.order_by(ordering_item)
 
-        # limit number of returned records
-        if self.record_limit is not None:
-            q = q.limit(self.record_limit)
+            # limit number of returned records
+            if self.record_limit is not None:
+                q = q.limit(self.record_limit)
 
-        experiments = q.all()
+            experiments = q.all()
 
-        results = DataFrame()
+        results = None
         error_msg = None
         record_count = 0
         try:
             if len(experiments) > 0:
-                results = DataFrame(experiments, columns = experiments[0]._fields)
+                results = result_formats.format_records(
+                    experiments, experiments[0]._fields, self.output_format)
             
         except Exception as err:
             message = 'Request for experiment records FAILED'
             error_msg = f'Failed to get experiment records - err: {err}'
         else:
             message = 'Request for experiment records SUCCEEDED'
-            for idx, row in results.iterrows():
-                print(f'idx: {idx}, row: {row}')
-            record_count = len(results.index)
+            logger.debug('records: %s', results)
+            record_count = len(experiments)
         
         details = {}
         # details['filters'] = self.filters
@@ -530,6 +533,6 @@ class ExperimentRequest:
             error_msg
         )
 
-        print(f'response: {response}')
+        logger.debug('response: %s', response)
 
         return response
@@ -16,6 +16,8 @@ import numpy as np
 import psycopg2
 from pandas import DataFrame
 from sqlalchemy import and_, or_, not_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import contains_eager
 
 from score_db.db_action_response import DbActionResponse
 import score_db.score_table_models as stm
@@ -31,6 +33,13 @@ import score_db.regions as rg
 import score_db.array_metric_types as amts
 from score_db import time_utils
 from score_db import db_utils
+from score_db import dimension_cache
+from score_db import experiment_ids
+from score_db.experiment_ids import ExperimentIdError
+from score_db import log_utils
+from score_db import result_formats
+
+logger = log_utils.get_logger(__name__)
 
 psycopg2.extensions.register_adapter(np.int64, psycopg2._psycopg.AsIs)
 psycopg2.extensions.register_adapter(np.float32, psycopg2._psycopg.AsIs)
@@ -89,6 +98,10 @@ ExptArrayMetricsData = namedtuple(
     ],
 )
 
+# columns overwritten when an array metric with the same natural key is
+# re-inserted
+EXPT_ARRAY_METRICS_UPDATE_COLUMNS = ['value', 'assimilated', 'created_at']
+
 class ExptArrayMetricsError(Exception):
     def __init__(self, m):
         self.message = m
@@ -103,7 +116,7 @@ def get_time_filter(filter_dict, cls, key, constructed_filter):
 
     value = filter_dict.get(key)
     if value is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
         return constructed_filter
 
     exact_datetime = time_utils.get_time(value.get(db_utils.EXACT_DATETIME))
@@ -162,12 +175,12 @@ def get_string_filter(filter_dict, cls, key, constructed_filter, key_name):
             f'type: {type(filter_dict)}'
         raise TypeError(msg)
 
-    print(f'Column \'{key}\' is of type {type(getattr(cls, key).type)}.')
+    logger.debug('Column \'%s\' is of type %s.', key, type(getattr(cls, key).type))
     string_flt = filter_dict.get(key_name)
-    print(f'string_flt: {string_flt}')
+    logger.debug('string_flt: %s', string_flt)
 
     if string_flt is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
         return constructed_filter
 
     like_filter = string_flt.get('like')
@@ -188,11 +201,11 @@ def get_float_filter(filter_dict, cls, key, constructed_filter):
             f'type: {type(filter_dict)}'
         raise TypeError(msg)
 
-    print(f'Column \'{key}\' is of type {type(getattr(cls, key).type)}.')
+    logger.debug('Column \'%s\' is of type %s.', key, type(getattr(cls, key).type))
     float_flt = filter_dict.get(key)
 
     if float_flt is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
         return constructed_filter
 
     constructed_filter[f'{cls.__name__}.{key}'] = ( getattr(cls, key) == float_flt )
@@ -205,11 +218,11 @@ def get_boolean_filter(filter_dict, cls, key, constructed_filter):
             f'type: {type(filter_dict)}'
         raise TypeError(msg)
 
-    print(f'Column \'{key}\' is of type {type(getattr(cls, key).type)}.')
+    logger.debug('Column \'%s\' is of type %s.', key, type(getattr(cls, key).type))
     bool_flt = filter_dict.get(key)
 
     if bool_flt is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
         return constructed_filter
 
     constructed_filter[f'{cls.__name__}.{key}'] = ( getattr(cls, key) == bool_flt )
@@ -222,11 +235,11 @@ def get_int_filter(filters, cls, key, constructed_filter):
             f'type: {type(filters)}'
         raise TypeError(msg)
 
-    print(f'Column \'{key}\' is of type {type(getattr(cls, key).type)}.')
+    logger.debug('Column \'%s\' is of type %s.', key, type(getattr(cls, key).type))
     int_flt = filters.get(key)
 
     if int_flt is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
     else:
         constructed_filter[f'{cls.__name__}.{key}'] = ( getattr(cls, key) == int_flt )
     
@@ -340,64 +353,12 @@ def get_sat_meta_filter(filter_dict, constructed_filter):
 
 
 def get_expt_record_id(body):
-    expt_name = body.get('expt_name')
-    wlclk_strt_str = body.get('expt_wallclock_start')
-    
-    expt_request = {
-        'name': 'experiment',
-        'method': db_utils.HTTP_GET,
-        'params': {
-            'filters': {
-                'name': {
-                    'exact': expt_name
-                },
-                'wallclock_start': {
-                    'exact': wlclk_strt_str
-                },
-            },
-            'ordering': [
-                {'name': 'wallclock_start', 'order_by': 'desc'}
-            ],
-            'record_limit': 1
-        }
-    }
-
-    print(f'expt_request: {expt_request}')
-
-    er = ExperimentRequest(expt_request)
-
-    results = er.submit()
-    print(f'results: {results}')
-
-    record_cnt = 0
     try:
-        if results.success is True:
-            records = results.details.get('records')
-            if records is None:
-                msg = 'Request for experiment record did not return a record'
-                raise ExptArrayMetricsError(msg)
-            record_cnt = records.shape[0]
-        else:
-            msg = f'Problems encountered requesting experiment data.'
-            # create error return db_action_response
-            raise ExptArrayMetricsError(msg)
-        if record_cnt <= 0:
-            msg = 'Request for experiment record did not return a record'
-            raise ExptArrayMetricsError(msg)
-        
-    except Exception as err:
+        return experiment_ids.get_experiment_id(
+            body.get('expt_name'), body.get('expt_wallclock_start'))
+    except ExperimentIdError as err:
         msg = f'Problems encountered requesting experiment data. err - {err}'
-        raise ExptArrayMetricsError(msg)
-    
-    try:
-        experiment_id = records[exp.id.name].iat[0]
-    except Exception as err:
-        error_msg = f'Problem finding experiment id from record: {records} ' \
-            f'- err: {err}'
-        print(f'error_msg: {error_msg}')
-        raise ExptArrayMetricsError(error_msg) 
-        
-    return experiment_id
+        raise ExptArrayMetricsError(msg) from err
 
 def get_sat_meta_id_from_metric(metric):
     sat_meta_id = -1
@@ -407,68 +368,79 @@ def get_sat_meta_id_from_metric(metric):
         sat_name = metric.sat_name
         sat_short_name = metric.sat_short_name
     except Exception as err:
-        print(f'Required sat meta input value not found: {err}')
+        logger.warning('Required sat meta input value not found: %s', err)
         return sat_meta_id
     
     if sat_meta_name is None and sat_id is None and sat_name is None and sat_short_name is None:
         return sat_meta_id
     
-    sat_meta_request = {
-        'name': 'sat_meta',
-        'method': db_utils.HTTP_GET,
-        'params': {
-            'filters': {
-                'name': {
-                    'exact': sat_meta_name
-                },
-                'sat_name': {
-                    'exact': sat_name
-                },
-                'short_name': {
-                    'exact': sat_short_name
-                },
-                'sat_id': sat_id
-            },
-            'record_limit': 1
-        }
-    }
-
-    print(f'sat_meta_request: {sat_meta_request}')
-
-    smr = SatMetaRequest(sat_meta_request)
-
-    results = smr.submit()
-    print(f'results: {results}')
-
-    record_cnt = 0
-    try:
-        if results.success is True:
-            records = results.details.get('records')
-            if records is None:
-                msg = 'Request for sat meta record did not return a record'
-                raise ExptArrayMetricsError(msg)
-            record_cnt = records.shape[0]
-        else:
-            msg = f'Problems encountered requesting sat meta data.'
-            # create error return db_action_response
-            raise ExptArrayMetricsError(msg)
-        if record_cnt <= 0:
-            msg = 'Request for sat meta record did not return a record'
-            raise ExptArrayMetricsError(msg)
-        
-    except Exception as err:
-        msg = f'Problems encountered requesting sat meta data. err - {err}'
-        raise ExptArrayMetricsError(msg) from err
-        
-    try:
-        sat_meta_id = records[sm.id.name].iat[0]
-    except Exception as err:
-        error_msg = f'Problem finding sat meta id from record: {records} ' \
-            f'- err: {err}'
-        print(f'error_msg: {error_msg}')
-        raise ExptArrayMetricsError(error_msg) from err
+    sat_meta_id = dimension_cache.find_id(
+        stm.SAT_META_TABLE,
+        name=sat_meta_name,
+        sat_id=sat_id,
+        sat_name=sat_name,
+        short_name=sat_short_name
+    )
+    if sat_meta_id is None:
+        msg = 'Problems encountered requesting sat meta data. err - ' \
+            'Request for sat meta record did not return a record'
+        raise ExptArrayMetricsError(msg)
     return sat_meta_id
 
+def to_expt_array_metrics_data(metric):
+    """ convert an ExptArrayMetric (with its relationships) to a record """
+    #handle potential nulls from outer joins
+    sat_meta_id=None
+    sat_meta_name=None
+    sat_id=None
+    sat_name=None
+    sat_short_name=None
+    metric_instrument_name=None
+    metric_instrument_num_channels=None
+    if metric.sat_meta is not None:
+        sat_meta_id=metric.sat_meta.id
+        sat_meta_name=metric.sat_meta.name
+        sat_id=metric.sat_meta.sat_id
+        sat_name=metric.sat_meta.sat_name
+        sat_short_name=metric.sat_meta.short_name
+    if metric.array_metric_type.instrument_meta is not None:
+        metric_instrument_name=metric.array_metric_type.instrument_meta.name
+        metric_instrument_num_channels=metric.array_metric_type.instrument_meta.num_channels
+
+    return ExptArrayMetricsData(
+        id=metric.id,
+        value=metric.value,
+        assimilated=metric.assimilated,
+        time_valid=metric.time_valid,
+        forecast_hour=metric.forecast_hour,
+        ensemble_member=metric.ensemble_member,
+        expt_id=metric.experiment.id,
+        expt_name=metric.experiment.name,
+        wallclock_start=metric.experiment.wallclock_start,
+        metric_id=metric.array_metric_type.id,
+        metric_name=metric.array_metric_type.name,
+        metric_long_name=metric.array_metric_type.long_name,
+        metric_type=metric.array_metric_type.measurement_type,
+        metric_unit=metric.array_metric_type.measurement_units,
+        metric_stat_type=metric.array_metric_type.stat_type,
+        metric_instrument_meta_id=metric.array_metric_type.instrument_meta_id,
+        metric_instrument_name=metric_instrument_name,
+        metric_instrument_num_channels=metric_instrument_num_channels,
+        metric_obs_platform=metric.array_metric_type.obs_platform,
+        array_coord_labels=metric.array_metric_type.array_coord_labels,
+        array_coord_units=metric.array_metric_type.array_coord_units,
+        array_index_values=metric.array_metric_type.array_index_values,
+        array_dimensions=metric.array_metric_type.array_dimensions,
+        region_id=metric.region.id,
+        region=metric.region.name,
+        sat_meta_id=sat_meta_id,
+        sat_meta_name=sat_meta_name,
+        sat_id=sat_id,
+        sat_name=sat_name,
+        sat_short_name=sat_short_name,
+        created_at=metric.created_at
+    )
+
 @dataclass 
 class ExptArrayMetricRequest:
     request_dict: dict
@@ -477,6 +449,13 @@ class ExptArrayMetricRequest:
     filters: dict = field(default_factory=dict, init=False)
     ordering: list = field(default_factory=list, init=False)
     record_limit: int = field(default_factory=int, init=False)
+    cursor: str = field(default=None, init=False)
+    since: dict = field(default=None, init=False)
+    watermark: dict = field(default=None, init=False)
+    latest_only: bool = field(default=False, init=False)
+    stream: bool = field(default=False, init=False)
+    chunk_size: int = field(default_factory=int, init=False)
+    output_format: str = field(default=None, init=False)
     body: dict = field(default_factory=dict, init=False)
     array_metric_type_id: int = field(default_factory=int, init=False)
     expt_id: int = field(default_factory=int, init=False)
@@ -489,10 +468,24 @@ class ExptArrayMetricRequest:
         self.filters = None
         self.ordering = None
         self.record_limit = None
+        self.cursor = None
+        self.since = None
+        self.latest_only = False
+        self.stream = False
+        self.chunk_size = None
         if self.params is not None:
             self.filters = self.params.get('filters')
             self.ordering = self.params.get('ordering')
             self.record_limit = self.params.get('record_limit')
+            if not type(self.record_limit) == int or self.record_limit <= 0:
+                self.record_limit = None
+            self.cursor = self.params.get('cursor')
+            self.since = db_utils.validate_since(self.params.get('since'))
+            self.latest_only = self.params.get('latest_only', False)
+            self.stream = self.params.get('stream', False)
+            self.chunk_size = self.params.get('chunk_size')
+        self.chunk_size = db_utils.validate_chunk_size(self.chunk_size)
+        self.output_format = result_formats.get_output_format(self.params)
 
         if self.method == db_utils.HTTP_PUT:
             try:
@@ -501,20 +494,20 @@ class ExptArrayMetricRequest:
                 trcbk = traceback.format_exc()
                 error_msg = 'Failed to locate experiment record id necessary to insert experiment array metric record -' \
                     f' trcbk: {trcbk}'
-                print(f'Submit PUT error: {error_msg}')
-                print(f'Error: {err}')
+                logger.error('Submit PUT error: %s', error_msg)
                 return self.failed_request(error_msg)
 
     def submit(self):
         if self.method == db_utils.HTTP_GET:
             try:
+                if self.stream:
+                    return self.stream_expt_array_metrics()
                 return self.get_expt_array_metrics()
             except Exception as err:
                 trcbk = traceback.format_exc()
                 error_msg = 'Failed to get experiment array metric records -' \
                     f' trcbk: {trcbk}'
-                print(f'Submit GET error: {error_msg}')
-                print(f'Error: {err}')
+                logger.error('Submit GET error: %s', error_msg)
                 return self.failed_request(error_msg)
         elif self.method == db_utils.HTTP_PUT:
             try:
@@ -523,10 +516,26 @@ class ExptArrayMetricRequest:
                 trcbk = traceback.format_exc()
                 error_msg = 'Failed to insert experiment array metric records -' \
                     f' trcbk: {trcbk}'
-                print(f'Submit PUT error: {error_msg}')
-                print(f'Error: {err}')
+                logger.error('Submit PUT error: %s', error_msg)
                 return self.failed_request(error_msg)
     
+    async def submit_async(self):
+        """
+        Asyncio counterpart of submit, a GET runs on the shared async
+        engine, streamed GETs and PUTs run submit in a worker thread.
+        """
+        if self.method != db_utils.HTTP_GET or self.stream:
+            return await db_utils.submit_in_thread(self)
+
+        try:
+            return await self.get_expt_array_metrics_async()
+        except Exception as err:
+            trcbk = traceback.format_exc()
+            error_msg = 'Failed to get experiment array metric records -' \
+                f' trcbk: {trcbk}'
+            logger.error('Submit GET error: %s', error_msg)
+            return self.failed_request(error_msg)
+    
     def failed_request(self, error_msg):
         return DbActionResponse(
             request=self.request_dict,
@@ -568,7 +577,7 @@ class ExptArrayMetricRequest:
         if len(constructed_filter) > 0:
             try:
                 for key, value in constructed_filter.items():
-                    print(f'adding filter: {value}')
+                    logger.debug('adding filter: %s', value)
                     query = query.filter(value)
             except Exception as err:
                 msg = f'Problems adding filter to query - query: {query}, ' \
@@ -589,37 +598,35 @@ class ExptArrayMetricRequest:
             if not isinstance(metric, ExptArrayMetricInputData):
                 msg = 'Each array metric must be a type ' \
                     f'\'{type(ExptArrayMetricInputData)}\' was \'{metric}\''
-                print(f'metric: {metric}, msg: {msg}')
+                logger.debug('metric: %s, msg: %s', metric, msg)
                 raise ExptArrayMetricsError(msg)
             
             unique_regions.add(metric.region_name)
             unique_array_metric_types.add(metric.name)
 
-        regions = rg.get_regions_from_name_list(list(unique_regions))
-        array_metric_types = amts.get_all_array_metric_types()
-
-        rg_df = regions.details.get('records')
-        if rg_df.shape[0] != len(unique_regions):
+        # the name -> id indexes come from the (in-process) dimension cache
+        rg_df_dict = dimension_cache.get_ids(
+            stm.REGIONS_TABLE, unique_regions)
+        if len(rg_df_dict) != len(unique_regions):
             msg = 'Did not find all unique_regions in regions table ' \
                 f'unique_regions: {len(unique_regions)}, found regions: ' \
-                f'{rg_df.shape[0]}.'
-            print(f'region counts do not match: {msg}')
+                f'{len(rg_df_dict)}.'
+            logger.debug('region counts do not match: %s', msg)
             raise ExptArrayMetricsError(msg)
 
-        rg_df_dict = dict(zip(rg_df.name, rg_df.id))
-
-        amt_df = array_metric_types.details.get('records')
-        amt_df_nm_id = amt_df[['id', 'name']].copy()
-        amt_df_dict = dict(zip(amt_df_nm_id.name, amt_df_nm_id.id))
+        amt_df_dict = dimension_cache.get_ids(
+            stm.ARRAY_METRIC_TYPES_TABLE, unique_array_metric_types)
 
-        records = []
+        # records are keyed by their natural key so that a metric repeated
+        # in the input is written once (the last one wins)
+        records = {}
         for row in metrics:
             
             value = row.value
             sat_meta_id = get_sat_meta_id_from_metric(row)
             sat_meta_input_id = sat_meta_id if sat_meta_id > 0 else None
             
-            item = ex_arr_mt(
+            item = dict(
                 experiment_id=self.expt_id,
                 array_metric_type_id=amt_df_dict[row.name],
                 region_id=rg_df_dict[row.region_name],
@@ -631,15 +638,17 @@ class ExptArrayMetricRequest:
                 ensemble_member=row.ensemble_member
             )
 
-            records.append(item)
+            key = tuple(
+                item[name] for name in stm.EXPT_ARRAY_METRICS_KEY_COLUMNS)
+            records[key] = item
 
-        return records
+        return list(records.values())
     
     def get_expt_array_metrics_from_body(self, body):
         if not isinstance(body, dict):
             error_msg = 'The \'body\' key must be a type dict, was ' \
                 f'{type(body)}'
-            print(f'Array Metrics key not found: {error_msg}')
+            logger.debug('Array Metrics key not found: %s', error_msg)
             raise ExptArrayMetricsError(error_msg)
         
         array_metrics = body.get('array_metrics')
@@ -649,8 +658,6 @@ class ExptArrayMetricRequest:
     
     def put_expt_array_metrics(self):
         records = self.get_expt_array_metrics_from_body(self.body)
-        session = stm.get_session()
-
 
         if len(records) > 0:
             #This section of print statements can be uncommented for debugging
@@ -667,9 +674,19 @@ class ExptArrayMetricRequest:
             #     msg += f'record.created_at: {record.created_at}'
             #     print(f'record: {msg}')
 
-            session.bulk_save_objects(records)
-            session.commit()
-            session.close()
+            # created_at is stamped by the database
+            insert_stmt = insert(ex_arr_mt).values(
+                created_at=stm.get_server_utcnow())
+            upsert_stmt = insert_stmt.on_conflict_do_update(
+                index_elements=stm.EXPT_ARRAY_METRICS_NATURAL_KEY,
+                set_={
+                    name: getattr(insert_stmt.excluded, name)
+                    for name in EXPT_ARRAY_METRICS_UPDATE_COLUMNS
+                }
+            )
+            with stm.session_scope() as session:
+                stm.check_natural_key(session, ex_arr_mt.__tablename__)
+                session.execute(upsert_stmt, records)
 
         else:
             return self.failed_request('No expt array metric records were discovered to be inserted')
@@ -678,13 +695,11 @@ class ExptArrayMetricRequest:
             request=self.request_dict,
             success=True,
             message="Attempt to insert expt array metrics SUCCEEDED",
-            details=records,
+            details={'record_count': len(records)},
             errors=None
         )
 
-    def get_expt_array_metrics(self):
-        session = stm.get_session()
-
+    def get_filtered_query(self, session):
         q = session.query(
             ex_arr_mt
         ).join(
@@ -701,96 +716,87 @@ class ExptArrayMetricRequest:
 
         q = self.construct_filters(q)
 
-        column_ordering = db_utils.build_column_ordering(ex_arr_mt, self.ordering)
-        if column_ordering is not None and len(column_ordering) > 0:
-            for ordering_item in column_ordering:
-                q = q.order_by(ordering_item)
-
-        array_metrics = q.all()
-
-        parsed_metrics = []
-        for metric in array_metrics:
-            #handle potential nulls from outer joins
-            sat_meta_id=None
-            sat_meta_name=None
-            sat_id=None
-            sat_name=None
-            sat_short_name=None
-            metric_instrument_name=None
-            metric_instrument_num_channels=None
-            if metric.sat_meta is not None:
-                sat_meta_id=metric.sat_meta.id
-                sat_meta_name=metric.sat_meta.name
-                sat_id=metric.sat_meta.sat_id
-                sat_name=metric.sat_meta.sat_name
-                sat_short_name=metric.sat_meta.short_name
-            if metric.array_metric_type.instrument_meta is not None:
-                metric_instrument_name=metric.array_metric_type.instrument_meta.name
-                metric_instrument_num_channels=metric.array_metric_type.instrument_meta.num_channels
-
-            record = ExptArrayMetricsData(
-                id=metric.id,
-                value=metric.value,
-                assimilated=metric.assimilated,
-                time_valid=metric.time_valid,
-                forecast_hour=metric.forecast_hour,
-                ensemble_member=metric.ensemble_member,
-                expt_id=metric.experiment.id,
-                expt_name=metric.experiment.name,
-                wallclock_start=metric.experiment.wallclock_start,
-                metric_id=metric.array_metric_type.id,
-                metric_name=metric.array_metric_type.name,
-                metric_long_name=metric.array_metric_type.long_name,
-                metric_type=metric.array_metric_type.measurement_type,
-                metric_unit=metric.array_metric_type.measurement_units,
-                metric_stat_type=metric.array_metric_type.stat_type,
-                metric_instrument_meta_id=metric.array_metric_type.instrument_meta_id,
-                metric_instrument_name=metric_instrument_name,
-                metric_instrument_num_channels=metric_instrument_num_channels,
-                metric_obs_platform=metric.array_metric_type.obs_platform,
-                array_coord_labels=metric.array_metric_type.array_coord_labels,
-                array_coord_units=metric.array_metric_type.array_coord_units,
-                array_index_values=metric.array_metric_type.array_index_values,
-                array_dimensions=metric.array_metric_type.array_dimensions,
-                region_id=metric.region.id,
-                region=metric.region.name,
-                sat_meta_id=sat_meta_id,
-                sat_meta_name=sat_meta_name,
-                sat_id=sat_id,
-                sat_name=sat_name,
-                sat_short_name=sat_short_name,
-                created_at=metric.created_at
-            )
-           
-            parsed_metrics.append(record)
-        
+        # only the rows written after the 'since' watermark
+        if self.since is not None:
+            since_filter = db_utils.get_since_filter(ex_arr_mt, self.since)
+            if since_filter is not None:
+                q = q.filter(since_filter)
+
+        return q
+
+    def get_array_metrics_query(self, session):
+        # the many-to-one relationships are populated from the joined
+        # rows so reading them never triggers a lazy load per record
+        q = self.get_filtered_query(session).options(
+            contains_eager(ex_arr_mt.experiment),
+            contains_eager(ex_arr_mt.region),
+            contains_eager(ex_arr_mt.sat_meta),
+            contains_eager(ex_arr_mt.array_metric_type).contains_eager(
+                amt.instrument_meta)
+        )
+
+        # drop superseded duplicates of a natural key on the server, a
+        # table without its natural key may hold duplicates so they're
+        # always dropped there
+        if self.latest_only or not stm.has_natural_key(
+            session, ex_arr_mt.__tablename__):
+            q = q.filter(db_utils.get_latest_records_filter(
+                q, ex_arr_mt, stm.EXPT_ARRAY_METRICS_NATURAL_KEY))
+
+        # add column ordering and the record limit (keyset pagination)
+        q = db_utils.apply_ordering_and_limit(
+            q, ex_arr_mt, self.ordering, self.record_limit, self.cursor)
+
+        return q
+
+    def fetch_expt_array_metrics(self, session):
+        if self.since is not None:
+            self.watermark = db_utils.get_since_watermark(
+                session, self.since)
+        q = self.get_array_metrics_query(session)
+        return [to_expt_array_metrics_data(metric) for metric in q.all()]
+
+    def get_expt_array_metrics(self):
+        with stm.read_session_scope() as session:
+            parsed_metrics = self.fetch_expt_array_metrics(session)
+
+        return self.get_array_metrics_response(parsed_metrics)
+
+    async def get_expt_array_metrics_async(self):
+        async with stm.async_read_session_scope() as session:
+            parsed_metrics = await session.run_sync(
+                self.fetch_expt_array_metrics)
+
+        return self.get_array_metrics_response(parsed_metrics)
+
+    def get_array_metrics_response(self, parsed_metrics):
         try:
-            arr_metrics_df = DataFrame(
+            arr_metrics_records = result_formats.format_records(
                 parsed_metrics,
-                columns=ExptArrayMetricsData._fields
+                ExptArrayMetricsData._fields,
+                self.output_format
             )
         except Exception as err:
             trcbk = traceback.format_exc()
-            msg = f'Problem casting array exeriment metrics query output into pandas ' \
-                f'DataFrame - err: {trcbk}'
+            msg = f'Problem casting array exeriment metrics query output into ' \
+                f'{self.output_format} - err: {trcbk}'
             raise TypeError(msg) from err
         
-        unique_metrics = self.remove_metric_duplicates(arr_metrics_df)
 
-        results = DataFrame()   
+        results = None
         error_msg = None
         record_count = 0
         try:
             if len(parsed_metrics) > 0:
-                results = unique_metrics    
+                results = arr_metrics_records
         except Exception as err:
             message = 'Request for experiment array metric records FAILED'
             trcbk = traceback.format_exc()
             error_msg = f'Failed to get any experiment array metrics - err: {trcbk}'
-            print(f'error_msg: {error_msg}')
+            logger.error('error_msg: %s', error_msg)
         else:
             message = 'Request for experiment array metrics SUCCEEDED'
-            record_count = len(results.index)
+            record_count = len(parsed_metrics)
         
         details = {}
         details['record_count'] = record_count
@@ -798,6 +804,13 @@ class ExptArrayMetricRequest:
         if record_count > 0:
             details['records'] = results
 
+        if self.record_limit is not None:
+            details['next_cursor'] = db_utils.get_next_page_cursor(
+                parsed_metrics, self.ordering, self.record_limit)
+
+        if self.since is not None:
+            details['watermark'] = self.watermark
+
         response = DbActionResponse(
             self.request_dict,
             (error_msg is None),
@@ -806,38 +819,36 @@ class ExptArrayMetricRequest:
             error_msg
         )
 
-        print(f'response: {response}')
+        logger.debug('response: %s', response)
 
-        session.close()
         return response
 
-    def remove_metric_duplicates(self, m_df):
-        
-        start_records = m_df.shape[0]
-        print(f'starting records: {start_records}')
-
-        try:
-
-            uf = m_df.sort_values(
-                'created_at'
-            ).drop_duplicates(
-                [
-                    'time_valid',
-                    'forecast_hour',
-                    'ensemble_member',
-                    'expt_id',
-                    'metric_id',
-                    'region_id',
-                ],
-                keep='last'
-            )
-
-        except Exception as err:
-            trcbk = traceback.format_exc()
-            msg = f'Failed to drop duplicates - err: {trcbk}'
-            print(err)
-            raise ValueError(msg)
-        
-        end_records = uf.shape[0]
-        print(f'ending records: {end_records}')
-        return uf                   
+    def iter_expt_array_metrics(self):
+        """
+        Yield the requested records in chunks of at most 'chunk_size'
+        rows, the ORM objects are fetched 'chunk_size' at a time through a
+        server side cursor (yield_per).
+        """
+        with stm.read_session_scope() as session:
+            q = self.get_array_metrics_query(session).yield_per(
+                self.chunk_size)
+            for metrics in db_utils.iter_chunks(q, self.chunk_size):
+                logger.debug('streamed %s array metrics', len(metrics))
+                yield result_formats.format_records(
+                    [to_expt_array_metrics_data(metric) for metric in metrics],
+                    ExptArrayMetricsData._fields,
+                    self.output_format
+                )
+
+    def stream_expt_array_metrics(self):
+        response = db_utils.get_stream_response(
+            self.request_dict,
+            self.iter_expt_array_metrics(),
+            self.chunk_size,
+            'Request for experiment array metrics stream SUCCEEDED'
+        )
+        if self.since is not None:
+            with stm.read_session_scope() as session:
+                response.details['watermark'] = \
+                    db_utils.get_since_watermark(session, self.since)
+        return response
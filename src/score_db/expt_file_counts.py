@@ -26,7 +26,7 @@ from sqlalchemy.inspection import inspect
 from sqlalchemy import and_, or_, not_
 from sqlalchemy import asc, desc
 from sqlalchemy.sql import func
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import contains_eager, joinedload
 
 
 from score_db.db_action_response import DbActionResponse
@@ -43,6 +43,14 @@ import score_db.regions as rg
 import score_db.metric_types as mt
 from score_db import time_utils
 from score_db import db_utils
+from score_db import dimension_cache
+from score_db import experiment_ids
+from score_db.experiment_ids import ExperimentIdError
+from score_db import log_utils
+from score_db import result_cache
+from score_db import result_formats
+
+logger = log_utils.get_logger(__name__)
 
 psycopg2.extensions.register_adapter(np.int64, psycopg2._psycopg.AsIs)
 psycopg2.extensions.register_adapter(np.float32, psycopg2._psycopg.AsIs)
@@ -155,7 +163,7 @@ def get_time_filter(filter_dict, cls, key, constructed_filter):
 
     value = filter_dict.get(key)
     if value is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
         return constructed_filter
 
     exact_datetime = time_utils.get_time(value.get(db_utils.EXACT_DATETIME))
@@ -212,12 +220,12 @@ def get_string_filter(filter_dict, cls, key, constructed_filter, key_name):
             f'type: {type(filter_dict)}'
         raise TypeError(msg)
 
-    print(f'Column \'{key}\' is of type {type(getattr(cls, key).type)}.')
+    logger.debug('Column \'%s\' is of type %s.', key, type(getattr(cls, key).type))
     string_flt = filter_dict.get(key_name)
-    print(f'string_flt: {string_flt}')
+    logger.debug('string_flt: %s', string_flt)
 
     if string_flt is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
         return constructed_filter
 
     like_filter = string_flt.get('like')
@@ -238,11 +246,11 @@ def get_float_filter(filter_dict, cls, key, constructed_filter):
             f'type: {type(filter_dict)}'
         raise TypeError(msg)
 
-    print(f'Column \'{key}\' is of type {type(getattr(cls, key).type)}.')
+    logger.debug('Column \'%s\' is of type %s.', key, type(getattr(cls, key).type))
     float_flt = filter_dict.get(key)
 
     if float_flt is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
         return constructed_filter
 
     constructed_filter[f'{cls.__name__}.{key}'] = ( getattr(cls, key) == float_flt )
@@ -251,13 +259,13 @@ def get_float_filter(filter_dict, cls, key, constructed_filter):
 
 def get_experiments_filter(filter_dict, constructed_filter):
     if filter_dict is None:
-        print('No experiment filters provided')
+        logger.debug('No experiment filters provided')
         return constructed_filter
     
     if not isinstance(filter_dict, dict):
         msg = f'Invalid type for experiment filter, must be \'dict\', was ' \
             f'type: {type(filter_dict)}. No experiment filters will be added.'
-        print(msg)
+        logger.warning(msg)
         return constructed_filter
     
     if not isinstance(constructed_filter, dict):
@@ -281,13 +289,13 @@ def get_experiments_filter(filter_dict, constructed_filter):
 
 def get_file_types_filter(filter_dict, constructed_filter):
     if filter_dict is None:
-        print('No file type filters provided')
+        logger.debug('No file type filters provided')
         return constructed_filter
     
     if not isinstance(filter_dict, dict):
         msg = f'Invalid type for file type filter, must be \'dict\', was ' \
             f'type: {type(filter_dict)}. No file type filters will be added.'
-        print(msg)
+        logger.warning(msg)
         return constructed_filter
     
     if not isinstance(constructed_filter, dict):
@@ -308,13 +316,13 @@ def get_file_types_filter(filter_dict, constructed_filter):
 
 def get_storage_locations_filter(filter_dict, constructed_filter):
     if filter_dict is None:
-        print('No storage location filters provided')
+        logger.debug('No storage location filters provided')
         return constructed_filter
     
     if not isinstance(filter_dict, dict):
         msg = f'Invalid type for storage location filter, must be \'dict\', was ' \
             f'type: {type(filter_dict)}. No storage location filters will be added.'
-        print(msg)
+        logger.warning(msg)
         return constructed_filter
     
     if not isinstance(constructed_filter, dict):
@@ -341,151 +349,60 @@ def get_storage_locations_filter(filter_dict, constructed_filter):
 
 
 def get_experiment_id(experiment_name, wallclock_start):
-    expt_request = {
-        'name': 'experiment',
-        'method': db_utils.HTTP_GET,
-        'params': {
-            'filters': {
-                'name': {
-                    'exact': experiment_name
-                },
-                'wallclock_start': {
-                    'exact': wallclock_start
-                },
-            },
-            'ordering': [
-                {'name': 'wallclock_start', 'order_by': 'desc'}
-            ],
-            'record_limit': 1
-        }
-    }
-    print(f'expt_request: {expt_request}')
-    er = ExperimentRequest(expt_request)
-    results = er.submit()
-    print(f'results: {results}')
-
-    record_cnt = 0
     try:
-        if results.success is True:
-            records = results.details.get('records')
-            record_cnt = records.shape[0]
-        else:
-            msg = f'Problems encountered requesting experiment data.'
-            # create error return db_action_response
-            raise ExptFileCountsError(msg)
-        if record_cnt <= 0:
-            msg = 'Request for experiment record did not return a record'
-            raise ExptFileCountsError(msg)
-        
-    except Exception as err:
+        return experiment_ids.get_experiment_id(
+            experiment_name, wallclock_start)
+    except ExperimentIdError as err:
         msg = f'Problems encountered requesting experiment data. err - {err}'
-        raise ExptFileCountsError(msg)
-    
-    try:
-        # record = records[0]
-        expt_id = records[exp.id.name].iat[0]
-    except Exception as err:
-        error_msg = f'Problem finding experiment id from request: {expt_request} '\
-            f'- err: {err}'
-        print(f'error_msg: {error_msg}')
-        raise ExptFileCountsError(error_msg)
-    return expt_id
+        raise ExptFileCountsError(msg) from err
 
 
 def get_file_type_id(file_type_name):
-    type_request = {
-        'name': 'file_types',
-        'method': db_utils.HTTP_GET,
-        'params': {
-            'filters': {
-                'name': {
-                    'exact': file_type_name
-                },
-            },
-            'record_limit': 1
-        }
-    }
-    print(f'type_request: {type_request}')
-    ftr = FileTypeRequest(type_request)
-    results = ftr.submit()
-    print(f'results: {results}')
-    
-    record_cnt = 0
-    try:
-        if results.success is True:
-            records = results.details.get('records')
-            record_cnt = records.shape[0]
-        else:
-            msg = f'Problems encountered requesting file type data.'
-            raise ExptFileCountsError(msg)
-        if record_cnt <= 0:
-            msg = 'Request for file type record did not return a record'
-            raise ExptFileCountsError(msg)
-        
-    except Exception as err:
-        msg = f'Problems encountered requesting file type data. err - {err}'
+    file_type_id = dimension_cache.find_id(
+        stm.FILE_TYPES_TABLE, name=file_type_name)
+    if file_type_id is None:
+        msg = 'Problems encountered requesting file type data. err - ' \
+            'Request for file type record did not return a record'
         raise ExptFileCountsError(msg)
-    
-    try:
-        file_type_id = records[ft.id.name].iat[0]
-    except Exception as err:
-        error_msg = f'Problem finding file type id from request: {type_request} '\
-            f'- err: {err}'
-        print(f'error_msg: {error_msg}')
-        raise ExptFileCountsError(error_msg)
 
     return file_type_id
 
 def get_storage_location_id(bucket_name, platform, key):
-    storage_loc_request = {
-        'name': 'storage_locations',
-        'method': db_utils.HTTP_GET,
-        'params': {
-            'filters': {
-                'bucket_name': {
-                    'exact': bucket_name
-                },
-                'platform': {
-                    'exact': platform
-                },
-                'key': {
-                    'exact': key
-                }
-            },
-            'record_limit': 1
-        }
-    }
-    print(f'storage_loc_request: {storage_loc_request}')
-    slr = StorageLocationRequest(storage_loc_request)
-    results = slr.submit()
-    print(f'results: {results}')
-
-    record_cnt = 0
-    try:
-        if results.success is True:
-            records = results.details.get('records')
-            record_cnt = records.shape[0]
-        else:
-            msg = f'Problems encountered requesting storage location data.'
-            raise ExptFileCountsError(msg)
-        if record_cnt <= 0:
-            msg = 'Request for storage location record did not return a record'
-            raise ExptFileCountsError(msg)
-        
-    except Exception as err:
-        msg = f'Problems encountered requesting storage location data. err - {err}'
+    storage_loc_id = dimension_cache.find_id(
+        stm.STORAGE_LOCATION_TABLE,
+        bucket_name=bucket_name,
+        platform=platform,
+        key=key
+    )
+    if storage_loc_id is None:
+        msg = 'Problems encountered requesting storage location data. ' \
+            'err - Request for storage location record did not return a ' \
+            'record'
         raise ExptFileCountsError(msg)
-    
-    try:
-        storage_loc_id = records[sl.id.name].iat[0]
-    except Exception as err:
-        error_msg = f'Problem finding storage location id from request: {storage_loc_request} '\
-            f'- err: {err}'
-        print(f'error_msg: {error_msg}')
-        raise ExptFileCountsError(error_msg)
 
     return storage_loc_id
 
+
+def to_expt_file_count_data(count):
+    """ convert an ExptStoredFileCount (with its relationships) to a record """
+    return ExptFileCountData(
+        id=count.id,
+        count=count.count,
+        folder_path=count.folder_path,
+        cycle=count.cycle,
+        time_valid=count.time_valid,
+        forecast_hour=count.forecast_hour,
+        file_size_bytes=count.file_size_bytes,
+        experiment_id=count.experiment.id,
+        experiment_name=count.experiment.name,
+        wallclock_start=count.experiment.wallclock_start,
+        file_type_id=count.file_type.id,
+        file_type_name=count.file_type.name,
+        storage_location_id=count.storage_location.id,
+        storage_location_name=count.storage_location.name,
+        created_at=count.created_at
+    )
+
 """
 This class handles interaction requests with the expt_stored_file_counts table.
 For calls to the database regarding inputing and reading experiment file counts. 
@@ -498,6 +415,12 @@ class ExptFileCountRequest:
     filters: dict = field(default_factory=dict, init=False)
     ordering: list = field(default_factory=list, init=False)
     record_limit: int = field(default_factory=int, init=False)
+    since: dict = field(default=None, init=False)
+    watermark: dict = field(default=None, init=False)
+    stream: bool = field(default=False, init=False)
+    chunk_size: int = field(default_factory=int, init=False)
+    output_format: str = field(default=None, init=False)
+    cache: bool = field(default=False, init=False)
     body: dict = field(default_factory=dict, init=False)
     expt_file_count: ExptFileCount = field(init=False)
     expt_file_count_data: namedtuple = field(init=False)
@@ -507,6 +430,10 @@ class ExptFileCountRequest:
         self.method = db_utils.validate_method(self.request_dict.get('method'))
         self.params = self.request_dict.get('params')
         self.body = self.request_dict.get('body')
+        self.since = None
+        self.stream = False
+        self.chunk_size = db_utils.DEFAULT_CHUNK_SIZE
+        self.output_format = result_formats.get_output_format(self.params)
 
         if self.method == db_utils.HTTP_PUT:
             self.expt_file_count = get_file_count_from_body(self.body)
@@ -515,9 +442,9 @@ class ExptFileCountRequest:
                 self.expt_file_count_data._fields, self.expt_file_count_data
             ):
                 val = pprint.pformat(v, indent=4)
-                print(f'exp_data: k: {k}, v: {val}')
+                logger.debug('exp_data: k: %s, v: %s', k, val)
         else:
-            print(f'In ExptFileCountRequest - params: {self.params}')
+            logger.debug('In ExptFileCountRequest - params: %s', self.params)
             if isinstance(self.params, dict):
                 self.filters = self.params.get('filters')
                 self.ordering = self.params.get('ordering')
@@ -525,10 +452,20 @@ class ExptFileCountRequest:
 
                 if not type(self.record_limit) == int or self.record_limit <= 0:
                     self.record_limit = None
+
+                self.since = db_utils.validate_since(
+                    self.params.get('since'))
+                self.stream = self.params.get('stream', False)
+                self.chunk_size = db_utils.validate_chunk_size(
+                    self.params.get('chunk_size'))
             else:
                 self.filters = None
                 self.ordering = None
                 self.record_limit = None
+
+        self.cache = result_cache.is_cache_requested(self.params) and \
+            self.output_format == result_formats.PANDAS_DATAFRAME and \
+            self.since is None
     
     def failed_request(self, error_msg):
         return DbActionResponse(
@@ -586,7 +523,7 @@ class ExptFileCountRequest:
         if len(constructed_filter) > 0:
             try: 
                 for key,value in constructed_filter.items():
-                    print(f'adding filter: {value}')
+                    logger.debug('adding filter: %s', value)
                     query = query.filter(value)
             except Exception as err:
                 msg = f'Problems adding filter to query - query: {query}, ' \
@@ -597,6 +534,8 @@ class ExptFileCountRequest:
 
     def submit(self):
         if self.method == db_utils.HTTP_GET:
+            if self.stream:
+                return self.stream_expt_file_counts()
             return self.get_expt_file_counts()
         elif self.method == db_utils.HTTP_PUT:
             try:
@@ -604,12 +543,19 @@ class ExptFileCountRequest:
             except Exception as err:
                 error_msg = 'Failed to insert expt file count record -' \
                     f' err: {err}'
-                print(f'Submit PUT error: {error_msg}')
+                logger.error('Submit PUT error: %s', error_msg)
                 return self.failed_request(error_msg)
 
-    def put_expt_file_counts(self):
-        session = stm.get_session()
+    async def submit_async(self):
+        """
+        Asyncio counterpart of submit, a GET runs on the shared async
+        engine, streamed GETs and PUTs run submit in a worker thread.
+        """
+        if self.method != db_utils.HTTP_GET or self.stream:
+            return await db_utils.submit_in_thread(self)
+        return await self.get_expt_file_counts_async()
 
+    def put_expt_file_counts(self):
         insert_stmt = insert(esfc).values(
             count=self.expt_file_count_data.count,
             folder_path=self.expt_file_count_data.folder_path,
@@ -620,27 +566,52 @@ class ExptFileCountRequest:
             experiment_id=self.expt_file_count_data.experiment_id,
             file_type_id=self.expt_file_count_data.file_type_id,
             storage_location_id=self.expt_file_count_data.storage_location_id,
-            created_at=datetime.utcnow()
+            created_at=stm.get_server_utcnow()
+        )
+        logger.debug('insert_stmt: %s', insert_stmt)
+
+        # the insert only returns a row when the key is new, otherwise a
+        # re-harvested count replaces the stored one (two statements rather
+        # than RETURNING (xmax = 0), which relies on heap internals)
+        do_nothing_stmt = insert_stmt.on_conflict_do_nothing(
+            index_elements=stm.EXPT_FILE_COUNTS_NATURAL_KEY
         ).returning(esfc)
-        print(f'insert_stmt: {insert_stmt}')
+        do_update_stmt = insert_stmt.on_conflict_do_update(
+            index_elements=stm.EXPT_FILE_COUNTS_NATURAL_KEY,
+            set_=dict(
+                count=insert_stmt.excluded.count,
+                file_size_bytes=insert_stmt.excluded.file_size_bytes,
+                created_at=insert_stmt.excluded.created_at
+            )
+        ).returning(esfc)
+        logger.debug('do_update_stmt: %s', do_update_stmt)
+
         result_row = None
+        action = db_utils.INSERT
+        # the scope commits (or, if the upsert raises, rolls back) the
+        # transaction, a failure is reported in the response
         try:
-            result = session.execute(insert_stmt)
-            session.flush()
-            result_row = result.fetchone()
-            session.commit()
-            session.close()
+            with stm.session_scope() as session:
+                stm.check_natural_key(session, esfc.__tablename__)
+                result_row = session.execute(do_nothing_stmt).fetchone()
+                if result_row is None:
+                    action = db_utils.UPDATE
+                    result_row = session.execute(do_update_stmt).fetchone()
+                if result_row is None:
+                    msg = 'The upsert returned no expt stored file count row'
+                    raise ExptFileCountsError(msg)
         except Exception as err:
-            message = f'Attempt to insert experiment stored file counts record FAILED'
-            error_msg = f'Failed to insert record - err: {err}'
-            print(f'error_msg: {error_msg}')
+            result_row = None
+            message = f'Attempt to {action} experiment stored file counts record FAILED'
+            error_msg = f'Failed to insert/update record - err: {err}'
+            logger.error('error_msg: %s', error_msg)
         else:
-            message = f'Attempt to insert experiment stored file counts record SUCCEEDED'
+            message = f'Attempt to {action} experiment stored file counts record SUCCEEDED'
             error_msg = None
-        
+
         results = {}
         if result_row is not None:
-            results['action'] = db_utils.INSERT
+            results['action'] = action
             results['data'] = [result_row._mapping]
             results['id'] = result_row.id
 
@@ -652,12 +623,10 @@ class ExptFileCountRequest:
             error_msg
         )
 
-        print(f'response: {response}')
+        logger.debug('response: %s', response)
         return response
     
-    def get_expt_file_counts(self):
-        session = stm.get_session()
-
+    def get_filtered_query(self, session):
         q = session.query(
             esfc
         ).join(
@@ -668,10 +637,26 @@ class ExptFileCountRequest:
             sl, esfc.storage_location
         )
 
-        print('Before adding filters to the expt file counts request####')
+        logger.debug('Before adding filters to the expt file counts request####')
         if self.filters is not None and len(self.filters) > 0:
             q = self.construct_filters(self.filters, q)
-        print('After adding filters to the expt file counts request####')
+        logger.debug('After adding filters to the expt file counts request####')
+
+        # only the rows written after the 'since' watermark
+        if self.since is not None:
+            since_filter = db_utils.get_since_filter(esfc, self.since)
+            if since_filter is not None:
+                q = q.filter(since_filter)
+
+        return q
+
+    def get_file_counts_query(self, session):
+        # populate the many-to-one relationships from the joined rows
+        q = self.get_filtered_query(session).options(
+            contains_eager(esfc.experiment),
+            contains_eager(esfc.file_type),
+            contains_eager(esfc.storage_location)
+        )
 
         # add column ordering
         column_ordering = db_utils.build_column_ordering(ft, self.ordering)
@@ -683,43 +668,88 @@ class ExptFileCountRequest:
         if self.record_limit is not None and self.record_limit > 0:
             q = q.limit(self.record_limit)
 
-        file_counts = q.all()
-
-        parsed_counts = []
-        for count in file_counts:
-            record = ExptFileCountData(
-                id=count.id,
-                count=count.count, 
-                folder_path=count.folder_path,
-                cycle=count.cycle,
-                time_valid=count.time_valid,
-                forecast_hour=count.forecast_hour,
-                file_size_bytes=count.file_size_bytes,
-                experiment_id=count.experiment.id,
-                experiment_name=count.experiment.name,
-                wallclock_start=count.experiment.wallclock_start,
-                file_type_id=count.file_type.id,
-                file_type_name=count.file_type.name,
-                storage_location_id=count.storage_location.id,
-                storage_location_name=count.storage_location.name,
-                created_at=count.created_at
+        return q
+
+    def fetch_expt_file_counts(self, session):
+        if self.since is not None:
+            self.watermark = db_utils.get_since_watermark(
+                session, self.since)
+        q = self.get_file_counts_query(session)
+        return [to_expt_file_count_data(count) for count in q.all()]
+
+    def get_file_counts_watermark(self, session):
+        """
+        Count and latest created_at of the rows matching the filters, used
+        to validate a cached result.
+        """
+        row_count, created_at = self.get_filtered_query(
+            session
+        ).with_entities(
+            func.count(esfc.id),
+            func.max(esfc.created_at)
+        ).one()
+        return [row_count, created_at]
+
+    def get_expt_file_counts(self):
+        if self.cache:
+            return self.get_cached_expt_file_counts()
+
+        with stm.read_session_scope() as session:
+            parsed_counts = self.fetch_expt_file_counts(session)
+
+        return self.get_file_counts_response(parsed_counts)
+
+    def get_cached_expt_file_counts(self):
+        cache = result_cache.get_result_cache()
+        key = result_cache.get_request_key(
+            stm.EXPT_STORED_FILE_COUNTS_TABLE, self.params)
+
+        with stm.read_session_scope() as session:
+            watermark = self.get_file_counts_watermark(session)
+            records = cache.get(key, watermark)
+            if records is None:
+                parsed_counts = self.fetch_expt_file_counts(session)
+
+        if records is not None:
+            return DbActionResponse(
+                self.request_dict,
+                True,
+                'Request for expt file counts records SUCCEEDED (cached)',
+                {
+                    'record_count': records.shape[0],
+                    'records': records,
+                    'cached': True
+                },
+                None
             )
-            parsed_counts.append(record)
-    
 
-        results = DataFrame()
+        response = self.get_file_counts_response(parsed_counts)
+        if response.success and response.details.get('records') is not None:
+            cache.put(key, watermark, response.details['records'])
+        return response
+
+    async def get_expt_file_counts_async(self):
+        async with stm.async_read_session_scope() as session:
+            parsed_counts = await session.run_sync(
+                self.fetch_expt_file_counts)
+
+        return self.get_file_counts_response(parsed_counts)
+
+    def get_file_counts_response(self, parsed_counts):
+        results = None
         error_msg = None
         record_count = 0
         try:
-            if len(file_counts) > 0:
-                results = DataFrame(parsed_counts, columns = ExptFileCountData._fields)
+            if len(parsed_counts) > 0:
+                results = result_formats.format_records(
+                    parsed_counts, ExptFileCountData._fields, self.output_format)
             
         except Exception as err:
             message = 'Request for expt file counts records FAILED'
             error_msg = f'Failed to get expt file counts records - err: {err}'
         else:
             message = 'Request for expt file counts records SUCCEEDED'
-            record_count = len(results.index)
+            record_count = len(parsed_counts)
         
         details = {}
         details['record_count'] = record_count
@@ -727,6 +757,9 @@ class ExptFileCountRequest:
         if record_count > 0:
             details['records'] = results
 
+        if self.since is not None:
+            details['watermark'] = self.watermark
+
         response = DbActionResponse(
             self.request_dict,
             (error_msg is None),
@@ -735,6 +768,35 @@ class ExptFileCountRequest:
             error_msg
         )
 
-        print(f'response: {response}')
+        logger.debug('response: %s', response)
 
         return response
+
+    def iter_expt_file_counts(self):
+        """
+        Yield the requested records in chunks of at most 'chunk_size'
+        rows, fetched through a server side cursor (yield_per).
+        """
+        with stm.read_session_scope() as session:
+            q = self.get_file_counts_query(session).yield_per(
+                self.chunk_size)
+            for counts in db_utils.iter_chunks(q, self.chunk_size):
+                logger.debug('streamed %s expt file counts', len(counts))
+                yield result_formats.format_records(
+                    [to_expt_file_count_data(count) for count in counts],
+                    ExptFileCountData._fields,
+                    self.output_format
+                )
+
+    def stream_expt_file_counts(self):
+        response = db_utils.get_stream_response(
+            self.request_dict,
+            self.iter_expt_file_counts(),
+            self.chunk_size,
+            'Request for expt file counts stream SUCCEEDED'
+        )
+        if self.since is not None:
+            with stm.read_session_scope() as session:
+                response.details['watermark'] = \
+                    db_utils.get_since_watermark(session, self.since)
+        return response
@@ -13,8 +13,8 @@ import copy
 from dataclasses import dataclass, field
 from datetime import datetime
 import json
-import math
 import pprint
+import re
 import traceback
 
 import numpy as np
@@ -26,9 +26,9 @@ from pandas import DataFrame
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.inspection import inspect
 from sqlalchemy import and_, or_, not_
-from sqlalchemy import asc, desc
-from sqlalchemy.sql import func
-from sqlalchemy.orm import joinedload
+from sqlalchemy import asc, desc, literal, select, union_all
+from sqlalchemy.sql import func, literal_column
+from sqlalchemy.orm import aliased, joinedload
 
 
 from score_db.db_action_response import DbActionResponse
@@ -42,7 +42,17 @@ from score_db.experiments import ExperimentRequest
 import score_db.regions as rg
 import score_db.metric_types as mt
 from score_db import time_utils
+from score_db import db_connection
+from score_db import db_copy
+from score_db import dimension_cache
+from score_db import experiment_ids
+from score_db.experiment_ids import ExperimentIdError
 from score_db import db_utils
+from score_db import log_utils
+from score_db import result_cache
+from score_db import result_formats
+
+logger = log_utils.get_logger(__name__)
 
 psycopg2.extensions.register_adapter(np.int64, psycopg2._psycopg.AsIs)
 psycopg2.extensions.register_adapter(np.float32, psycopg2._psycopg.AsIs)
@@ -88,6 +98,88 @@ ExptMetricsData = namedtuple(
 )
 
 
+# column order of the rows streamed into the expt_metrics table on PUT
+EXPT_METRICS_COPY_COLUMNS = [
+    'experiment_id',
+    'metric_type_id',
+    'region_id',
+    'elevation',
+    'elevation_unit',
+    'value',
+    'time_valid',
+    'forecast_hour',
+    'ensemble_member'
+]
+
+
+# columns overwritten when a metric with the same natural key is re-inserted
+EXPT_METRICS_UPDATE_COLUMNS = ['value', 'created_at']
+
+# ExptMetricInputData fields which may be null or left out of the input
+NULLABLE_INPUT_COLUMNS = ['elevation_unit', 'forecast_hour', 'ensemble_member']
+
+# aggregate functions of the 'value' column available to GET requests, the
+# aggregated columns are named 'value_<function>' (e.g. value_mean)
+AGGREGATE_FUNCTIONS = {
+    'mean': func.avg,
+    'min': func.min,
+    'max': func.max,
+    'std': func.stddev_samp,
+    'count': func.count,
+    'sum': func.sum
+}
+
+# calendar time buckets of an aggregate request (date_trunc fields), any
+# other bucket must be a fixed interval such as '6 hours' (date_bin)
+CALENDAR_TIME_BUCKETS = ['hour', 'day', 'week', 'month', 'year']
+TIME_BUCKET_INTERVAL_PATTERN = re.compile(
+    r'^\d+ (minute|hour|day|week)s?$')
+TIME_BUCKET_ORIGIN = datetime(2000, 1, 1)
+
+# column of a batch GET (filter_sets) holding the tag of each row's filter set
+QUERY_TAG_COLUMN = 'query_tag'
+
+# ExperimentMetric mapped onto the expt_metrics_latest materialized view
+# (the newest row of each natural key), queried with 'latest_view': True
+latest_ex_mt = aliased(
+    ex_mt, stm.EXPT_METRICS_LATEST_TABLE, adapt_on_names=True)
+
+
+def get_expt_metrics_data_columns(cls=ex_mt):
+    """
+    Returns the columns of the joined expt_metrics (or 'cls', e.g. the
+    latest values view), experiments, metric_types and regions tables
+    which make up an ExptMetricsData record, labeled with the
+    ExptMetricsData field names.
+    """
+    columns = [
+        cls.id,
+        mts.name,
+        cls.elevation,
+        cls.elevation_unit,
+        cls.value,
+        cls.time_valid,
+        cls.forecast_hour,
+        cls.ensemble_member,
+        exp.id,
+        exp.name,
+        exp.wallclock_start,
+        mts.id,
+        mts.long_name,
+        mts.measurement_type,
+        mts.measurement_units,
+        mts.stat_type,
+        rgs.id,
+        rgs.name,
+        cls.created_at
+    ]
+
+    return [
+        column.label(field_name)
+        for column, field_name in zip(columns, ExptMetricsData._fields)
+    ]
+
+
 class ExptMetricsError(Exception):
     def __init__(self, m):
         self.message = m
@@ -95,6 +187,207 @@ class ExptMetricsError(Exception):
         return self.message
 
 
+def get_time_bucket_column(time_bucket, cls=ex_mt):
+    """
+    time_valid truncated to the start of its 'time_bucket', the validated
+    bucket is rendered inline so that the SELECT and GROUP BY expressions
+    are identical.
+    """
+    if time_bucket in CALENDAR_TIME_BUCKETS:
+        bucket = func.date_trunc(
+            literal_column(f"'{time_bucket}'"), cls.time_valid)
+    elif isinstance(time_bucket, str) and \
+        TIME_BUCKET_INTERVAL_PATTERN.match(time_bucket):
+        origin = TIME_BUCKET_ORIGIN.strftime('%Y-%m-%d %H:%M:%S')
+        bucket = func.date_bin(
+            literal_column(f"interval '{time_bucket}'"),
+            cls.time_valid,
+            literal_column(f"timestamp '{origin}'")
+        )
+    else:
+        msg = f'Invalid \'time_bucket\': {time_bucket}, must be one of ' \
+            f'{CALENDAR_TIME_BUCKETS} or an interval such as \'6 hours\''
+        raise ExptMetricsError(msg)
+
+    return bucket.label('time_valid')
+
+
+def get_aggregate_columns(aggregate, cls=ex_mt):
+    """
+    Parse the 'aggregate' GET param, e.g.
+
+    'aggregate': {
+        'group_by': ['expt_name', 'elevation', 'region'],
+        'functions': ['mean', 'count']
+    }
+
+    and return the labeled group by columns (ExptMetricsData fields) and
+    the labeled aggregates of the 'value' column.
+
+    An optional 'time_bucket' ('hour', 'day', 'week', 'month', 'year' or
+    a fixed interval such as '6 hours') downsamples the time series, the
+    time_valid column is then the start of each bucket and is always
+    grouped on.
+    """
+    if not isinstance(aggregate, dict):
+        msg = f'\'aggregate\' must be a dict, was: {type(aggregate)}'
+        raise ExptMetricsError(msg)
+
+    time_bucket = aggregate.get('time_bucket')
+    group_by = aggregate.get('group_by', [])
+    if isinstance(group_by, str):
+        group_by = [group_by]
+    if time_bucket is not None and 'time_valid' not in group_by:
+        group_by = ['time_valid'] + group_by
+    if not isinstance(group_by, list) or len(group_by) == 0:
+        msg = '\'aggregate\' must have a non empty \'group_by\' list of ' \
+            f'columns, was: {group_by}'
+        raise ExptMetricsError(msg)
+
+    data_columns = {
+        column.name: column for column in get_expt_metrics_data_columns(cls)
+    }
+    if time_bucket is not None:
+        data_columns['time_valid'] = get_time_bucket_column(time_bucket, cls)
+    group_columns = []
+    for name in group_by:
+        if name not in data_columns:
+            msg = f'Invalid \'group_by\' column: {name}, must be one of ' \
+                f'{list(data_columns.keys())}'
+            raise ExptMetricsError(msg)
+        group_columns.append(data_columns[name])
+
+    functions = aggregate.get('functions', ['mean'])
+    if isinstance(functions, str):
+        functions = [functions]
+    if not isinstance(functions, list) or len(functions) == 0:
+        msg = f'\'functions\' must be a non empty list, was: {functions}'
+        raise ExptMetricsError(msg)
+
+    aggregate_columns = []
+    for function in functions:
+        if function not in AGGREGATE_FUNCTIONS:
+            msg = f'Invalid aggregate function: {function}, must be one ' \
+                f'of {list(AGGREGATE_FUNCTIONS.keys())}'
+            raise ExptMetricsError(msg)
+        aggregate_columns.append(
+            AGGREGATE_FUNCTIONS[function](cls.value).label(
+                f'value_{function}'))
+
+    return group_columns, aggregate_columns
+
+
+def get_aggregate_ordering(group_columns, aggregate_columns, ordering):
+    """
+    ORDER BY clause of an aggregate query, 'ordering' may only refer to
+    the output columns (group by columns or aggregates), by default the
+    rows are ordered by the group by columns.
+    """
+    if ordering is None:
+        return [asc(column) for column in group_columns]
+
+    columns = {
+        column.name: column for column in group_columns + aggregate_columns
+    }
+
+    if not isinstance(ordering, list):
+        msg = f'\'order_by\' must be a list - was: {type(ordering)}'
+        raise TypeError(msg)
+
+    constructed_ordering = []
+    for value in ordering:
+        name = value.get('name')
+        if name not in columns:
+            msg = f'Invalid aggregate ordering column: {name}, must be ' \
+                f'one of {list(columns.keys())}'
+            raise ExptMetricsError(msg)
+        if db_utils.validate_order_dir(value.get('order_by')) == \
+            db_utils.ASCENDING:
+            constructed_ordering.append(asc(columns[name]))
+        else:
+            constructed_ordering.append(desc(columns[name]))
+
+    return constructed_ordering
+
+
+def get_filter_sets(filter_sets, filters=None):
+    """
+    Parse the 'filter_sets' GET param, either a dict of tag -> filters or
+    a list of filters (tagged by their position).  The keys of each set
+    replace the same keys of the common 'filters'.
+
+    Returns a dict of tag -> merged filters.
+    """
+    if isinstance(filter_sets, list):
+        filter_sets = dict(enumerate(filter_sets))
+    if not isinstance(filter_sets, dict) or len(filter_sets) == 0:
+        msg = '\'filter_sets\' must be a non empty dict or list, was: ' \
+            f'{filter_sets}'
+        raise ExptMetricsError(msg)
+
+    if filters is None:
+        filters = {}
+    if not isinstance(filters, dict):
+        msg = f'Filters must be of the form dict, filters: {type(filters)}'
+        raise ExptMetricsError(msg)
+
+    merged_sets = {}
+    for tag, filter_set in filter_sets.items():
+        if not isinstance(filter_set, dict):
+            msg = f'Each filter set must be a dict, filter set \'{tag}\' ' \
+                f'was: {type(filter_set)}'
+            raise ExptMetricsError(msg)
+        merged_sets[tag] = {**filters, **filter_set}
+
+    return merged_sets
+
+
+def get_batch_ordering(batch, ordering):
+    """
+    ORDER BY clause of a batch (UNION ALL) query, the rows are ordered by
+    their tag and then by 'ordering', which may only refer to the output
+    columns.
+    """
+    constructed_ordering = [asc(batch.c[QUERY_TAG_COLUMN])]
+    if ordering is None:
+        return constructed_ordering
+
+    if not isinstance(ordering, list):
+        msg = f'\'order_by\' must be a list - was: {type(ordering)}'
+        raise TypeError(msg)
+
+    for value in ordering:
+        name = value.get('name')
+        if name not in batch.c:
+            msg = f'Invalid filter_sets ordering column: {name}, must be ' \
+                f'one of {list(batch.c.keys())}'
+            raise ExptMetricsError(msg)
+        if db_utils.validate_order_dir(value.get('order_by')) == \
+            db_utils.ASCENDING:
+            constructed_ordering.append(asc(batch.c[name]))
+        else:
+            constructed_ordering.append(desc(batch.c[name]))
+
+    return constructed_ordering
+
+
+def get_filter_set_frames(records, tags):
+    """
+    Split the records of a batch GET (a DataFrame with a 'query_tag'
+    column, or None if nothing matched) into a DataFrame per filter set
+    tag, sets without any rows get an empty DataFrame.
+    """
+    if records is None:
+        return {tag: DataFrame() for tag in tags}
+
+    columns = [name for name in records.columns if name != QUERY_TAG_COLUMN]
+    frames = {tag: DataFrame(columns=columns) for tag in tags}
+    for tag, frame in records.groupby(QUERY_TAG_COLUMN, sort=False):
+        frames[tag] = frame[columns].reset_index(drop=True)
+
+    return frames
+
+
 def get_time_filter(filter_dict, cls, key, constructed_filter):
     if not isinstance(filter_dict, dict):
         msg = f'Invalid type for filters, must be \'dict\', was ' \
@@ -103,7 +396,7 @@ def get_time_filter(filter_dict, cls, key, constructed_filter):
 
     value = filter_dict.get(key)
     if value is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
         return constructed_filter
 
     exact_datetime = time_utils.get_time(value.get(db_utils.EXACT_DATETIME))
@@ -162,12 +455,12 @@ def get_string_filter(filter_dict, cls, key, constructed_filter, key_name):
             f'type: {type(filter_dict)}'
         raise TypeError(msg)
 
-    print(f'Column \'{key}\' is of type {type(getattr(cls, key).type)}.')
+    logger.debug('Column \'%s\' is of type %s.', key, type(getattr(cls, key).type))
     string_flt = filter_dict.get(key)
-    print(f'string_flt: {string_flt}')
+    logger.debug('string_flt: %s', string_flt)
 
     if string_flt is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
         return constructed_filter
 
     like_filter = string_flt.get('like')
@@ -188,11 +481,11 @@ def get_float_filter(filter_dict, cls, key, constructed_filter):
             f'type: {type(filter_dict)}'
         raise TypeError(msg)
 
-    print(f'Column \'{key}\' is of type {type(getattr(cls, key).type)}.')
+    logger.debug('Column \'%s\' is of type %s.', key, type(getattr(cls, key).type))
     float_flt = filter_dict.get(key)
 
     if float_flt is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
         return constructed_filter
 
     constructed_filter[key] = ( getattr(cls, key) == float_flt )
@@ -306,62 +599,96 @@ def get_regions_filter(filter_dict, constructed_filter):
 
     return constructed_filter
 
-def get_expt_record(body):
+def get_metrics_frame(metrics):
+    """
+    Returns the metrics to be inserted as a DataFrame with one column per
+    ExptMetricInputData field.  'metrics' may be a list of
+    ExptMetricInputData, a DataFrame or a dict of (numpy) arrays keyed by
+    the ExptMetricInputData field names.  The nullable columns
+    (elevation_unit, forecast_hour and ensemble_member) may be left out.
+    All conversions and checks are done on whole columns.
+    """
+    if isinstance(metrics, list):
+        for metric in metrics:
+            if not isinstance(metric, ExptMetricInputData):
+                msg = 'Each metric must be a type ' \
+                    f'\'{type(ExptMetricInputData)}\' was \'{metric}\''
+                logger.debug('metric: %s, msg: %s', metric, msg)
+                raise ExptMetricsError(msg)
+        metrics_df = DataFrame(metrics, columns=ExptMetricInputData._fields)
+    elif isinstance(metrics, DataFrame):
+        metrics_df = metrics.reset_index(drop=True)
+    elif isinstance(metrics, dict):
+        try:
+            metrics_df = DataFrame(metrics)
+        except ValueError as err:
+            msg = f'Invalid \'metrics\' arrays - err: {err}'
+            raise ExptMetricsError(msg) from err
+    else:
+        msg = '\'metrics\' must be a list, a DataFrame or a dict of ' \
+            f'arrays - was a \'{type(metrics)}\''
+        raise ExptMetricsError(msg)
 
-    # get experiment name
-    session = stm.get_session()
+    for column in NULLABLE_INPUT_COLUMNS:
+        if column not in metrics_df.columns:
+            metrics_df[column] = None
 
-    expt_name = body.get('expt_name')
-    datestr_format = body.get('datestr_format')
-    wlclk_strt_str = body.get('expt_wallclock_start')
-    
-    expt_request = {
-        'name': 'experiment',
-        'method': db_utils.HTTP_GET,
-        'params': {
-            'filters': {
-                'name': {
-                    'exact': expt_name
-                },
-                'wallclock_start': {
-                    'exact': wlclk_strt_str
-                },
-            },
-            'ordering': [
-                {'name': 'wallclock_start', 'order_by': 'desc'}
-            ],
-            'record_limit': 1
-        }
-    }
+    missing_columns = [
+        column for column in ExptMetricInputData._fields
+        if column not in metrics_df.columns
+    ]
+    if len(missing_columns) > 0:
+        msg = f'\'metrics\' is missing required columns: {missing_columns}'
+        raise ExptMetricsError(msg)
 
-    print(f'expt_request: {expt_request}')
+    for column in ['name', 'region_name', 'time_valid']:
+        if metrics_df[column].isna().any():
+            msg = f'\'metrics\' column \'{column}\' may not contain nulls'
+            raise ExptMetricsError(msg)
 
-    er = ExperimentRequest(expt_request)
+    try:
+        metrics_df = metrics_df.assign(
+            elevation=pd.to_numeric(metrics_df['elevation']),
+            value=pd.to_numeric(metrics_df['value']),
+            time_valid=pd.to_datetime(metrics_df['time_valid']),
+            forecast_hour=pd.to_numeric(metrics_df['forecast_hour']),
+            ensemble_member=pd.to_numeric(
+                metrics_df['ensemble_member']).astype('Int64')
+        )
+    except (ValueError, TypeError) as err:
+        msg = f'Invalid \'metrics\' values - err: {err}'
+        raise ExptMetricsError(msg) from err
 
-    results = er.submit()
-    print(f'results: {results}')
+    return metrics_df
 
-    record_cnt = 0
+
+def get_expt_record_id(body):
     try:
-        if results.success is True:
-            records = results.details.get('records')
-            if records is None:
-                msg = 'Request for experiment record did not return a record'
-                raise ExptMetricsError(msg)
-            record_cnt = records.shape[0]
-        else:
-            msg = f'Problems encountered requesting experiment data.'
-            # create error return db_action_response
-            raise ExptMetricsError(msg)
-        if record_cnt <= 0:
-            msg = 'Request for experiment record did not return a record'
-            raise ExptMetricsError(msg)
-        
-    except Exception as err:
+        return experiment_ids.get_experiment_id(
+            body.get('expt_name'), body.get('expt_wallclock_start'))
+    except ExperimentIdError as err:
         msg = f'Problems encountered requesting experiment data. err - {err}'
-        raise ExptMetricsError(msg)
-        
-    return records
+        raise ExptMetricsError(msg) from err
+
+
+def refresh_latest_values():
+    """
+    Refresh the latest values view after a batch of expt_metrics has been
+    ingested, unless disabled with SCORE_DB_REFRESH_LATEST_VIEWS = false.
+    The ingested rows are already committed so a failed refresh is only
+    logged, the view then catches up on the next refresh.
+    """
+    if not db_connection.get_bool_setting(stm.REFRESH_LATEST_VIEWS_ENV, True):
+        return []
+
+    try:
+        refreshed = stm.refresh_latest_views()
+    except Exception as err:
+        logger.warning('Failed to refresh the latest values views: %s', err)
+        return []
+
+    logger.info('refreshed latest values views: %s', refreshed)
+    return refreshed
 
 
 @dataclass
@@ -372,6 +699,19 @@ class ExptMetricRequest:
     filters: dict = field(default_factory=dict, init=False)
     ordering: list = field(default_factory=dict, init=False)
     record_limit: int = field(default_factory=dict, init=False)
+    cursor: str = field(default=None, init=False)
+    since: dict = field(default=None, init=False)
+    watermark: dict = field(default=None, init=False)
+    latest_only: bool = field(default=False, init=False)
+    latest_view: bool = field(default=False, init=False)
+    aggregate: dict = field(default=None, init=False)
+    filter_sets: dict = field(default=None, init=False)
+    output_format: str = field(default=None, init=False)
+    cache: bool = field(default=False, init=False)
+    copy_format: str = field(default_factory=str, init=False)
+    batch_size: int = field(default_factory=int, init=False)
+    stream: bool = field(default=False, init=False)
+    chunk_size: int = field(default_factory=int, init=False)
     body: dict = field(default_factory=dict, init=False)
     experiment: Experiment = field(init=False)
     expt_id: int = field(default_factory=int, init=False)
@@ -385,37 +725,92 @@ class ExptMetricRequest:
         self.filters = None
         self.ordering = None
         self.record_limit = None
+        self.cursor = None
+        self.since = None
+        self.latest_only = False
+        self.latest_view = False
+        self.aggregate = None
+        self.filter_sets = None
+        self.copy_format = None
+        self.batch_size = None
+        self.stream = False
+        self.chunk_size = None
         if self.params is not None:
             self.filters = self.params.get('filters')
             self.ordering = self.params.get('ordering')
             self.record_limit = self.params.get('record_limit')
+            if not type(self.record_limit) == int or self.record_limit <= 0:
+                self.record_limit = None
+            self.cursor = self.params.get('cursor')
+            self.since = db_utils.validate_since(self.params.get('since'))
+            self.latest_only = self.params.get('latest_only', False)
+            self.latest_view = self.params.get('latest_view', False)
+            self.aggregate = self.params.get('aggregate')
+            self.filter_sets = self.params.get('filter_sets')
+            self.copy_format = self.params.get('copy_format')
+            self.batch_size = self.params.get('batch_size')
+            self.stream = self.params.get('stream', False)
+            self.chunk_size = self.params.get('chunk_size')
+        self.copy_format = db_copy.validate_copy_format(self.copy_format)
+        self.batch_size = db_copy.validate_batch_size(self.batch_size)
+        self.chunk_size = db_utils.validate_chunk_size(self.chunk_size)
+        self.output_format = result_formats.get_output_format(self.params)
+        self.cache = result_cache.is_cache_requested(self.params) and \
+            self.output_format == result_formats.PANDAS_DATAFRAME and \
+            self.since is None
+        if self.aggregate is not None:
+            get_aggregate_columns(self.aggregate)
+        if self.filter_sets is not None:
+            self.filter_sets = get_filter_sets(self.filter_sets, self.filters)
 
 
     def submit(self):
         if self.method == db_utils.HTTP_GET:
             try:
+                if self.stream:
+                    return self.stream_experiment_metrics()
                 return self.get_experiment_metrics()
             except Exception as err:
                 trcbk = traceback.format_exc()
                 error_msg = 'Failed to get experiment metric records -' \
                     f' trcbk: {trcbk}'
-                print(f'Submit GET error: {error_msg}')
+                logger.error('Submit GET error: %s', error_msg)
                 return self.failed_request(error_msg)
         elif self.method == db_utils.HTTP_PUT:
             # becomes an update if record exists
-            print(f'in PUT method')
+            logger.debug('in PUT method')
             try:
                 response = self.put_expt_metrics_data()
             except Exception as err:
                 trcbk = traceback.format_exc()
                 error_msg = 'Failed to insert experiment metric records -' \
                     f' trcbk: {trcbk}'
-                print(f'Submit PUT error: {error_msg}')
+                logger.error('Submit PUT error: %s', error_msg)
                 return self.failed_request(error_msg)
 
             return response
 
 
+    async def submit_async(self):
+        """
+        Asyncio counterpart of submit, a GET runs on the shared async
+        engine so many requests can be awaited concurrently (e.g. with
+        db_utils.gather_requests).  Streamed GETs and PUTs run the blocking
+        submit in a worker thread.
+        """
+        if self.method != db_utils.HTTP_GET or self.stream:
+            return await db_utils.submit_in_thread(self)
+
+        try:
+            return await self.get_experiment_metrics_async()
+        except Exception as err:
+            trcbk = traceback.format_exc()
+            error_msg = 'Failed to get experiment metric records -' \
+                f' trcbk: {trcbk}'
+            logger.error('Submit GET error: %s', error_msg)
+            return self.failed_request(error_msg)
+
+
     def failed_request(self, error_msg):
         return DbActionResponse(
             request=self.request_dict,
@@ -426,43 +821,46 @@ class ExptMetricRequest:
         )
 
 
-    def construct_filters(self, query):
-        if not isinstance(self.filters, dict):
-            msg = f'Filters must be of the form dict, filters: {type(self.filters)}'
+    def construct_filters(self, query, filters=None):
+        if filters is None:
+            filters = self.filters
+        if not isinstance(filters, dict):
+            msg = f'Filters must be of the form dict, filters: {type(filters)}'
             raise ExptMetricsError(msg)
 
         constructed_filter = {}
 
         # filter experiment metrics table for all matching experiments
         constructed_filter = get_experiments_filter(
-            self.filters.get('experiment'), constructed_filter)
+            filters.get('experiment'), constructed_filter)
 
         # get only those records related to certain experiment
         constructed_filter = get_metric_types_filter(
-            self.filters.get('metric_types'), constructed_filter)
+            filters.get('metric_types'), constructed_filter)
         
         constructed_filter = get_regions_filter(
-            self.filters.get('regions'), constructed_filter)
+            filters.get('regions'), constructed_filter)
 
+        cls = self.get_metrics_cls()
         constructed_filter = get_time_filter(
-            self.filters, ex_mt, 'time_valid', constructed_filter)
+            filters, cls, 'time_valid', constructed_filter)
 
         constructed_filter = get_string_filter(
-            self.filters,
-            ex_mt,
+            filters,
+            cls,
             'elevation_unit',
             constructed_filter,
             'elevation_unit'
         )
 
-        constructed_filter = get_float_filter(self.filters, ex_mt, 'forecast_hour', constructed_filter)
+        constructed_filter = get_float_filter(filters, cls, 'forecast_hour', constructed_filter)
 
-        constructed_filter = get_float_filter(self.filters, ex_mt, 'ensemble_member', constructed_filter)
+        constructed_filter = get_float_filter(filters, cls, 'ensemble_member', constructed_filter)
 
         if len(constructed_filter) > 0:
             try:
                 for key, value in constructed_filter.items():
-                    print(f'adding filter: {value}')
+                    logger.debug('adding filter: %s', value)
                     query = query.filter(value)
             except Exception as err:
                 msg = f'Problems adding filter to query - query: {query}, ' \
@@ -472,73 +870,46 @@ class ExptMetricRequest:
         return query
 
 
-    def get_first_expt_id_from_df(self, record):
-        try:
-            self.expt_id = record[exp.id.name].iat[0]
-        except Exception as err:
-            error_msg = f'Problem finding experiment id from record: {record} ' \
-                f'- err: {err}'
-            print(f'error_msg: {error_msg}')
-            raise ExptMetricsError(error_msg) 
-        return self.expt_id
-    
-
     def parse_metrics_data(self, metrics):
-        if not isinstance(metrics, list):
-            msg = f'\'metrics\' must be a list - was a \'{type(metrics)}\''
-            raise ExptMetricsError(msg)
-        
-        unique_regions = set()
-        unique_metric_types = set()
-        for metric in metrics:
+        metrics_df = get_metrics_frame(metrics)
 
-            if not isinstance(metric, ExptMetricInputData):
-                msg = 'Each metric must be a type ' \
-                    f'\'{type(ExptMetricInputData)}\' was \'{metric}\''
-                print(f'metric: {metric}, msg: {msg}')
-                raise ExptMetricsError(msg)
-            
-            unique_regions.add(metric.region_name)
-            unique_metric_types.add(metric.name)
-
-        regions = rg.get_regions_from_name_list(list(unique_regions))
-        metric_types = mt.get_all_metric_types()
-
-        rg_df = regions.details.get('records')
-        if rg_df.shape[0] != len(unique_regions):
+        # the name -> id indexes come from the (in-process) dimension cache
+        unique_regions = metrics_df['region_name'].unique()
+        region_index = dimension_cache.get_ids(
+            stm.REGIONS_TABLE, unique_regions)
+        if len(region_index) != len(unique_regions):
             msg = 'Did not find all unique_regions in regions table ' \
                 f'unique_regions: {len(unique_regions)}, found regions: ' \
-                f'{rg_df.shape[0]}.'
-            print(f'region counts do not match: {msg}')
+                f'{len(region_index)}.'
+            logger.debug('region counts do not match: %s', msg)
             raise ExptMetricsError(msg)
 
-        rg_df_dict = dict(zip(rg_df.name, rg_df.id))
+        metric_type_index = dimension_cache.get_ids(
+            stm.METRIC_TYPES_TABLE, metrics_df['name'].unique())
 
-        mt_df = metric_types.details.get('records')
-        mt_df_nm_id = mt_df[['id', 'name']].copy()
-        mt_df_dict = dict(zip(mt_df_nm_id.name, mt_df_nm_id.id))
+        # map names to ids for the whole column at once
+        region_ids = metrics_df['region_name'].map(region_index)
+        metric_type_ids = metrics_df['name'].map(metric_type_index)
 
-        records = []
-        for row in metrics:
-            
-            value = row.value
-
-            if math.isnan(value):
-                value = None
-            
-            item = ex_mt(
-                experiment_id=self.expt_id,
-                metric_type_id=mt_df_dict[row.name],
-                region_id=rg_df_dict[row.region_name],
-                elevation=row.elevation,
-                elevation_unit=row.elevation_unit,
-                value=value,
-                time_valid=row.time_valid,
-                forecast_hour=row.forecast_hour,
-                ensemble_member=row.ensemble_member
-            )
+        unknown_metric_types = metrics_df['name'][metric_type_ids.isna()]
+        if len(unknown_metric_types) > 0:
+            msg = 'Did not find metric types in metric types table: ' \
+                f'{list(unknown_metric_types.unique())}'
+            raise ExptMetricsError(msg)
 
-            records.append(item)
+        # columns are ordered as EXPT_METRICS_COPY_COLUMNS, NaN values
+        # are written as NULL, created_at is stamped by the database
+        records = DataFrame({
+            'experiment_id': self.expt_id,
+            'metric_type_id': metric_type_ids.astype('int64'),
+            'region_id': region_ids.astype('int64'),
+            'elevation': metrics_df['elevation'],
+            'elevation_unit': metrics_df['elevation_unit'],
+            'value': metrics_df['value'],
+            'time_valid': metrics_df['time_valid'],
+            'forecast_hour': metrics_df['forecast_hour'],
+            'ensemble_member': metrics_df['ensemble_member']
+        }, columns=EXPT_METRICS_COPY_COLUMNS)
 
         return records
 
@@ -547,7 +918,7 @@ class ExptMetricRequest:
         if not isinstance(body, dict):
             error_msg = 'The \'body\' key must be a type dict, was ' \
                 f'{type(body)}'
-            print(f'Metrics key not found: {error_msg}')
+            logger.debug('Metrics key not found: %s', error_msg)
             raise ExptMetricsError(error_msg)
 
         metrics = body.get('metrics')
@@ -560,122 +931,260 @@ class ExptMetricRequest:
 
         # we need to determine the primary key id from the experiment
         # all calls to this function must return a DbActionResponse object
-        expt_record = get_expt_record(self.body)
-        expt_id = self.get_first_expt_id_from_df(expt_record)
+        self.expt_id = get_expt_record_id(self.body)
         records = self.get_expt_metrics_from_body(self.body)
-        session = stm.get_session()
-
 
         if len(records) > 0:
-            for record in records:
-                msg = f'record.experiment_id: {record.experiment_id}, '
-                msg += f'record.metric_type_id: {record.metric_type_id}, '
-                msg += f'record.region_id: {record.region_id}, '
-                msg += f'record.elevation: {record.elevation}, '
-                msg += f'record.elevation_unit: {record.elevation_unit}, '
-                msg += f'record.value: {record.value}, '
-                msg += f'record.time_valid: {record.time_valid}, '
-                msg += f'record.forecast_hour: {record.forecast_hour},'
-                msg += f'record.ensemble_member: {record.ensemble_member},'
-                msg += f'record.created_at: {record.created_at}'
-                print(f'record: {msg}')
-
-            session.bulk_save_objects(records)
-            session.commit()
-            session.close()
+            logger.debug('records: %s', records)
+
+            logger.info(
+                'upserting %s expt metric records (copy_format: %s, '
+                'batch_size: %s)', len(records), self.copy_format,
+                self.batch_size)
+            with stm.session_scope() as session:
+                stm.check_natural_key(session, ex_mt.__tablename__)
+                record_count = db_copy.upsert_frame(
+                    session,
+                    ex_mt.__table__,
+                    records,
+                    stm.EXPT_METRICS_NATURAL_KEY,
+                    stm.EXPT_METRICS_KEY_COLUMNS,
+                    EXPT_METRICS_UPDATE_COLUMNS,
+                    self.copy_format,
+                    self.batch_size,
+                    server_values={'created_at': stm.get_server_utcnow()}
+                )
         else:
-            session.close()
             return self.failed_request('No expt metric records were discovered to be inserted')
 
         return DbActionResponse(
             request=self.request_dict,
             success=True,
             message="Attempt to insert expt metrics SUCCEEDED",
-            details=records,
+            details={'record_count': record_count},
             errors=None
         )
 
     
-    def get_experiment_metrics(self):
-        engine = stm.get_engine_from_settings()
-        session = stm.get_session()
+    def get_metrics_cls(self):
+        """ the expt_metrics table or its latest values view """
+        if self.latest_view:
+            return latest_ex_mt
+        return ex_mt
+
 
-        # set basic query
+    def get_filtered_query(self, session, columns, filters=None):
+        cls = self.get_metrics_cls()
         q = session.query(
-            ex_mt
+            *columns
+        ).select_from(
+            cls
         ).join(
-            exp, ex_mt.experiment
+            exp, exp.id == cls.experiment_id
         ).join(
-            mts, ex_mt.metric_type
+            mts, mts.id == cls.metric_type_id
         ).join(
-            rgs, ex_mt.region
+            rgs, rgs.id == cls.region_id
         )
 
         # add filters
-        q = self.construct_filters(q)
+        q = self.construct_filters(q, filters)
 
-        # # add column ordering
-        column_ordering = db_utils.build_column_ordering(ex_mt, self.ordering)
-        if column_ordering is not None and len(column_ordering) > 0:
-            for ordering_item in column_ordering:
-                q = q.order_by(ordering_item)
+        # only the rows written after the 'since' watermark
+        if self.since is not None:
+            since_filter = db_utils.get_since_filter(cls, self.since)
+            if since_filter is not None:
+                q = q.filter(since_filter)
 
-        metrics = q.all()
+        return q
 
-        print(f'len(metrics): {len(metrics)}')
-        parsed_metrics = []
-        for metric in metrics:
-            record = ExptMetricsData(
-                id=metric.id,
-                name=metric.metric_type.name,
-                elevation=metric.elevation,
-                elevation_unit=metric.elevation_unit,
-                value=metric.value,
-                time_valid=metric.time_valid,
-                forecast_hour=metric.forecast_hour,
-                ensemble_member=metric.ensemble_member,
-                expt_id=metric.experiment.id,
-                expt_name=metric.experiment.name,
-                wallclock_start=metric.experiment.wallclock_start,
-                metric_id=metric.metric_type.id,
-                metric_long_name=metric.metric_type.long_name,
-                metric_type=metric.metric_type.measurement_type,
-                metric_unit=metric.metric_type.measurement_units,
-                metric_stat_type=metric.metric_type.stat_type,
-                region_id=metric.region.id,
-                region=metric.region.name,
-                created_at=metric.created_at
+
+    def get_metrics_query(self, session, filters=None):
+        # select only the ExptMetricsData columns (or the aggregated
+        # columns), no ORM entities
+        cls = self.get_metrics_cls()
+        if self.aggregate is not None:
+            group_columns, aggregate_columns = get_aggregate_columns(
+                self.aggregate, cls)
+            columns = group_columns + aggregate_columns
+        else:
+            columns = get_expt_metrics_data_columns(cls)
+
+        q = self.get_filtered_query(session, columns, filters)
+
+        # drop superseded duplicates of a natural key on the server (the
+        # latest values view holds no duplicates), a table without its
+        # natural key may hold duplicates so they're always dropped there
+        if self.is_dedup_needed(session):
+            q = q.filter(db_utils.get_latest_records_filter(
+                q, ex_mt, stm.EXPT_METRICS_NATURAL_KEY))
+
+        if self.aggregate is not None:
+            # only the aggregated rows are returned, these can't be paged
+            if self.cursor is not None:
+                msg = 'A page \'cursor\' can not be used with \'aggregate\''
+                raise ExptMetricsError(msg)
+            q = q.group_by(*[column.element for column in group_columns])
+            q = q.order_by(*get_aggregate_ordering(
+                group_columns, aggregate_columns, self.ordering))
+            if self.record_limit is not None:
+                q = q.limit(self.record_limit)
+            return q
+
+        # add column ordering and the record limit (keyset pagination)
+        q = db_utils.apply_ordering_and_limit(
+            q, cls, self.ordering, self.record_limit, self.cursor)
+
+        return q
+
+
+    def is_dedup_needed(self, session):
+        if self.latest_view:
+            return False
+        return self.latest_only or not stm.has_natural_key(
+            session, ex_mt.__tablename__)
+
+
+    def get_batch_statement(self, session):
+        """
+        One statement answering every filter set of a batch GET: the
+        query of each set, tagged with its key in the 'query_tag' column,
+        combined with UNION ALL.  'record_limit' applies to each set.
+        """
+        if self.cursor is not None:
+            msg = 'A page \'cursor\' can not be used with \'filter_sets\''
+            raise ExptMetricsError(msg)
+
+        selects = []
+        for tag, filters in self.filter_sets.items():
+            q = self.get_metrics_query(session, filters)
+            q = q.add_columns(literal(tag).label(QUERY_TAG_COLUMN))
+            selects.append(q.statement)
+
+        batch = union_all(*selects).subquery('batch')
+        return select(batch).order_by(
+            *get_batch_ordering(batch, self.ordering))
+
+
+    def get_metrics_statement(self, session):
+        if self.filter_sets is not None:
+            return self.get_batch_statement(session)
+        return self.get_metrics_query(session).statement
+
+
+    def get_filter_sets_list(self):
+        if self.filter_sets is None:
+            return [self.filters]
+        return list(self.filter_sets.values())
+
+
+    def fetch_experiment_metrics(self, session):
+        if self.since is not None:
+            self.watermark = db_utils.get_since_watermark(
+                session, self.since)
+        result = session.execute(self.get_metrics_statement(session))
+        return list(result.keys()), result.fetchall()
+
+
+    def get_metrics_watermark(self, session):
+        """
+        Count and latest created_at of the rows matching the filters (of
+        each filter set), used to validate a cached result.
+        """
+        cls = self.get_metrics_cls()
+        watermark = []
+        for filters in self.get_filter_sets_list():
+            q = self.get_filtered_query(
+                session,
+                [func.count(cls.id), func.max(cls.created_at)],
+                filters
             )
-            parsed_metrics.append(record)
-        
-        try:
-            metrics_df = DataFrame(
-                parsed_metrics,
-                columns=ExptMetricsData._fields
+            row_count, created_at = q.one()
+            watermark.append([row_count, created_at])
+
+        return watermark
+
+
+    def get_experiment_metrics(self):
+        if self.cache:
+            return self.get_cached_experiment_metrics()
+
+        with stm.read_session_scope() as session:
+            columns, metrics = self.fetch_experiment_metrics(session)
+
+        return self.get_metrics_response(columns, metrics)
+
+
+    def get_cached_experiment_metrics(self):
+        cache = result_cache.get_result_cache()
+        key = result_cache.get_request_key(
+            stm.EXPERIMENT_METRICS_TABLE, self.params)
+
+        with stm.read_session_scope() as session:
+            watermark = self.get_metrics_watermark(session)
+            records = cache.get(key, watermark)
+            if records is None:
+                columns, metrics = self.fetch_experiment_metrics(session)
+
+        if records is not None:
+            details = {
+                'record_count': records.shape[0],
+                'records': records,
+                'cached': True
+            }
+            if self.record_limit is not None and self.aggregate is None and \
+                self.filter_sets is None:
+                details['next_cursor'] = db_utils.get_next_page_cursor(
+                    records, self.ordering, self.record_limit)
+            return DbActionResponse(
+                self.request_dict,
+                True,
+                'Request for experiment metrics SUCCEEDED (cached)',
+                details,
+                None
             )
+
+        response = self.get_metrics_response(columns, metrics)
+        if response.success and response.details.get('records') is not None:
+            cache.put(key, watermark, response.details['records'])
+        return response
+
+
+    async def get_experiment_metrics_async(self):
+        async with stm.async_read_session_scope() as session:
+            columns, metrics = await session.run_sync(
+                self.fetch_experiment_metrics)
+
+        return self.get_metrics_response(columns, metrics)
+
+
+    def get_metrics_response(self, columns, metrics):
+        logger.debug('len(metrics): %s', len(metrics))
+        try:
+            metrics_records = result_formats.format_records(
+                metrics, columns, self.output_format)
         except Exception as err:
             trcbk = traceback.format_exc()
-            msg = f'Problem casting exeriment metrics query output into pandas ' \
-                f'DataFrame - err: {trcbk}'
+            msg = f'Problem casting exeriment metrics query output into ' \
+                f'{self.output_format} - err: {trcbk}'
             raise TypeError(msg) from err
         
-        unique_metrics = self.remove_metric_duplicates(metrics_df)
 
-        results = DataFrame()   
+        results = None
         error_msg = None
         record_count = 0
         try:
-            if len(parsed_metrics) > 0:
-                results = unique_metrics
+            if len(metrics) > 0:
+                results = metrics_records
             
         except Exception as err:
             message = 'Request for experiment metric records FAILED'
             trcbk = traceback.format_exc()
             error_msg = f'Failed to get any experiment metrics - err: {trcbk}'
-            print(f'error_msg: {error_msg}')
+            logger.error('error_msg: %s', error_msg)
         else:
             message = 'Request for experiment metrics SUCCEEDED'
-            record_count = len(results.index)
+            record_count = len(metrics)
         
         details = {}
         details['record_count'] = record_count
@@ -683,6 +1192,14 @@ class ExptMetricRequest:
         if record_count > 0:
             details['records'] = results
 
+        if self.record_limit is not None and self.aggregate is None and \
+            self.filter_sets is None:
+            details['next_cursor'] = db_utils.get_next_page_cursor(
+                metrics, self.ordering, self.record_limit)
+
+        if self.since is not None:
+            details['watermark'] = self.watermark
+
         response = DbActionResponse(
             self.request_dict,
             (error_msg is None),
@@ -691,40 +1208,41 @@ class ExptMetricRequest:
             error_msg
         )
 
-        print(f'response: {response}')
+        logger.debug('response: %s', response)
 
         return response
 
 
-    def remove_metric_duplicates(self, m_df):
-        
-        start_records = m_df.shape[0]
-        print(f'starting records: {start_records}')
-
-        try:
-
-            uf = m_df.sort_values(
-                'created_at'
-            ).drop_duplicates(
-                [
-                    'name',
-                    'elevation',
-                    'elevation_unit',
-                    'time_valid',
-                    'forecast_hour',
-                    'ensemble_member',
-                    'expt_id',
-                    'metric_id',
-                    'region_id'
-                ],
-                keep='last'
+    def iter_experiment_metrics(self):
+        """
+        Yield the requested records in chunks of at most 'chunk_size'
+        rows.  The rows are fetched through a server side cursor so only
+        one chunk is held in memory at a time.
+        """
+        with stm.read_session_scope() as session:
+            result = session.execute(
+                self.get_metrics_statement(session),
+                execution_options={
+                    'stream_results': True,
+                    'max_row_buffer': self.chunk_size
+                }
             )
+            columns = list(result.keys())
+            for rows in result.partitions(self.chunk_size):
+                logger.debug('streamed %s metrics', len(rows))
+                yield result_formats.format_records(
+                    rows, columns, self.output_format)
 
-        except Exception as err:
-            trcbk = traceback.format_exc()
-            msg = f'Failed to drop duplicates - err: {trcbk}'
-            raise ValueError(msg)
-        
-        end_records = uf.shape[0]
-        print(f'ending records: {end_records}')
-        return uf
+
+    def stream_experiment_metrics(self):
+        response = db_utils.get_stream_response(
+            self.request_dict,
+            self.iter_experiment_metrics(),
+            self.chunk_size,
+            'Request for experiment metrics stream SUCCEEDED'
+        )
+        if self.since is not None:
+            with stm.read_session_scope() as session:
+                response.details['watermark'] = \
+                    db_utils.get_since_watermark(session, self.since)
+        return response
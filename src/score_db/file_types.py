@@ -17,6 +17,9 @@ import score_db.score_table_models as stm
 from score_db.score_table_models import FileType as ft
 from score_db import time_utils
 from score_db import db_utils
+from score_db import dimension_cache
+from score_db import log_utils
+from score_db import result_formats
 
 from pandas import DataFrame
 import sqlalchemy as db
@@ -26,6 +29,8 @@ from sqlalchemy import and_, or_, not_
 from sqlalchemy import asc, desc
 from sqlalchemy.sql import func
 
+logger = log_utils.get_logger(__name__)
+
 FileTypeData = namedtuple(
     'FileTypeData',
     [
@@ -46,8 +51,8 @@ class FileType:
     file_type_data: FileTypeData = field(init=False)
 
     def __post_init__(self):
-        print(f'in post init name: {self.name}')
-        print(f'description: {self.description}')
+        logger.debug('in post init name: %s', self.name)
+        logger.debug('description: %s', self.description)
         self.file_type_data = FileTypeData(
             self.name,
             self.file_template,
@@ -90,11 +95,11 @@ def get_string_filter(filters, cls, key, constructed_filter):
             f'type: {type(filters)}'
         raise TypeError(msg)
 
-    print(f'Column \'{key}\' is of type {type(getattr(cls, key).type)}.')
+    logger.debug('Column \'%s\' is of type %s.', key, type(getattr(cls, key).type))
     string_flt = filters.get(key)
 
     if string_flt is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
         return constructed_filter
 
     like_filter = string_flt.get('like')
@@ -140,6 +145,7 @@ class FileTypeRequest:
     filters: dict = field(default_factory=dict, init=False)
     ordering: list = field(default_factory=list, init=False)
     record_limit: int = field(default_factory=int, init=False)
+    output_format: str = field(default=None, init=False)
     body: dict = field(default_factory=dict, init=False)
     file_type: FileType = field(init=False)
     file_type_data: namedtuple = field(init=False)
@@ -148,6 +154,7 @@ class FileTypeRequest:
     def __post_init__(self):
         self.method = db_utils.validate_method(self.request_dict.get('method'))
         self.params = self.request_dict.get('params')
+        self.output_format = result_formats.get_output_format(self.params)
 
         self.body = self.request_dict.get('body')
         if self.method == db_utils.HTTP_PUT:
@@ -157,9 +164,9 @@ class FileTypeRequest:
                 self.file_type_data._fields, self.file_type_data
             ):
                 val = pprint.pformat(v, indent=4)
-                print(f'exp_data: k: {k}, v: {val}')
+                logger.debug('exp_data: k: %s, v: %s', k, val)
         else:
-            print(f'In FileTypeRequest - params: {self.params}')
+            logger.debug('In FileTypeRequest - params: %s', self.params)
             if isinstance(self.params, dict):
                 self.filters = construct_filters(self.params.get('filters'))
                 self.ordering = self.params.get('ordering')
@@ -193,13 +200,11 @@ class FileTypeRequest:
             except Exception as err:
                 error_msg = 'Failed to insert file type record -' \
                     f' err: {err}'
-                print(f'Submit PUT error: {error_msg}')
+                logger.error('Submit PUT error: %s', error_msg)
                 return self.failed_request(error_msg)
 
     
     def put_file_type(self):
-        session = stm.get_session()
-
         insert_stmt = insert(ft).values(
             name=self.file_type_data.name,
             file_template=self.file_type_data.file_template,
@@ -208,7 +213,7 @@ class FileTypeRequest:
             created_at=datetime.utcnow(),
             updated_at=None
         ).returning(ft)
-        print(f'insert_stmt: {insert_stmt}')
+        logger.debug('insert_stmt: %s', insert_stmt)
 
         time_now = datetime.utcnow()
 
@@ -222,25 +227,27 @@ class FileTypeRequest:
             )
         )
 
-        print(f'do_update_stmt: {do_update_stmt}')
+        logger.debug('do_update_stmt: %s', do_update_stmt)
 
-        try:
-            result = session.execute(do_update_stmt)
-            session.flush()
-            result_row = result.fetchone()
-            action = db_utils.INSERT
-            if result_row.updated_at is not None:
-                action = db_utils.UPDATE
-
-            session.commit()
-            session.close()
-        except Exception as err:
-            message = f'Attempt to {action} file type record FAILED'
-            error_msg = f'Failed to insert/update record - err: {err}'
-            print(f'error_msg: {error_msg}')
-        else:
-            message = f'Attempt to {action} file type record SUCCEEDED'
-            error_msg = None
+        with stm.session_scope() as session:
+            try:
+                result = session.execute(do_update_stmt)
+                session.flush()
+                result_row = result.fetchone()
+                action = db_utils.INSERT
+                if result_row.updated_at is not None:
+                    action = db_utils.UPDATE
+
+                session.commit()
+            except Exception as err:
+                session.rollback()
+                result_row = None
+                message = f'Attempt to {action} file type record FAILED'
+                error_msg = f'Failed to insert/update record - err: {err}'
+                logger.error('error_msg: %s', error_msg)
+            else:
+                message = f'Attempt to {action} file type record SUCCEEDED'
+                error_msg = None
         
         results = {}
         if result_row is not None:
@@ -248,6 +255,9 @@ class FileTypeRequest:
             results['data'] = [result_row._mapping]
             results['id'] = result_row.id
 
+        # the next id lookup during ingest reloads the table
+        dimension_cache.invalidate(stm.FILE_TYPES_TABLE)
+
         response = DbActionResponse(
             self.request_dict,
             (error_msg is None),
@@ -256,59 +266,58 @@ class FileTypeRequest:
             error_msg
         )
 
-        print(f'response: {response}')
+        logger.debug('response: %s', response)
         return response
 
     
     def get_file_types(self):
-        session = stm.get_session()
-
-        q = session.query(
-            ft.id,
-            ft.name,
-            ft.file_template,
-            ft.file_format,
-            ft.description,
-            ft.created_at,
-            ft.updated_at
-        ).select_from(
-            ft
-        )
+        with stm.read_session_scope() as session:
+            q = session.query(
+                ft.id,
+                ft.name,
+                ft.file_template,
+                ft.file_format,
+                ft.description,
+                ft.created_at,
+                ft.updated_at
+            ).select_from(
+                ft
+            )
 
-        print('Before adding filters to file types request########################')
-        if self.filters is not None and len(self.filters) > 0:
-            for key, value in self.filters.items():
-                q = q.filter(value)
+            logger.debug('Before adding filters to file types request########################')
+            if self.filters is not None and len(self.filters) > 0:
+                for key, value in self.filters.items():
+                    q = q.filter(value)
         
-        print('After adding filters to file types request########################')
+            logger.debug('After adding filters to file types request########################')
         
-        # add column ordering
-        column_ordering = db_utils.build_column_ordering(ft, self.ordering)
-        if column_ordering is not None and len(column_ordering) > 0:
-            for ordering_item in column_ordering:
-                q = q.order_by(ordering_item)
+            # add column ordering
+            column_ordering = db_utils.build_column_ordering(ft, self.ordering)
+            if column_ordering is not None and len(column_ordering) > 0:
+                for ordering_item in column_ordering:
+                    q = q.order_by(ordering_item)
 
-        # limit number of returned records
-        if self.record_limit is not None and self.record_limit > 0:
-            q = q.limit(self.record_limit)
+            # limit number of returned records
+            if self.record_limit is not None and self.record_limit > 0:
+                q = q.limit(self.record_limit)
 
-        file_types = q.all()
+            file_types = q.all()
 
-        results = DataFrame()
+        results = None
         error_msg = None
         record_count = 0
         try:
             if len(file_types) > 0:
-                results = DataFrame(file_types, columns = file_types[0]._fields)
+                results = result_formats.format_records(
+                    file_types, file_types[0]._fields, self.output_format)
             
         except Exception as err:
             message = 'Request for file type records FAILED'
             error_msg = f'Failed to get file type  records - err: {err}'
         else:
             message = 'Request for file type records SUCCEEDED'
-            for idx, row in results.iterrows():
-                print(f'idx: {idx}, row: {row}')
-            record_count = len(results.index)
+            logger.debug('records: %s', results)
+            record_count = len(file_types)
         
         details = {}
         details['record_count'] = record_count
@@ -324,6 +333,6 @@ class FileTypeRequest:
             error_msg
         )
 
-        print(f'response: {response}')
+        logger.debug('response: %s', response)
 
         return response
@@ -9,6 +9,10 @@ import os
 from pathlib import Path
 import re
 
+from score_db import log_utils
+
+logger = log_utils.get_logger(__name__)
+
 
 def is_valid_readable_file(filepath):
     """
@@ -19,7 +23,7 @@ def is_valid_readable_file(filepath):
     try:
         m_search = re.search(r'[^A-Za-z0-9\._\-\/]', filepath)
         if m_search is not None and m_search.group(0) is not None:
-            print(
+            logger.error(
                 'Only a-z A-Z 0-9 and - . / _ characters allowed in filepath')
             raise ValueError(
                 f'Invalid characters found in file path: {filepath}')
@@ -36,9 +40,9 @@ def is_valid_readable_file(filepath):
 
     # check permissions on file
     status = os.stat(filepath, follow_symlinks=True)
-    print(f'status.st_size: {status.st_size}')
+    logger.debug('status.st_size: %s', status.st_size)
     if status.st_size == 0:
-        print(f'if block caught 0 byte file {status}')
+        logger.debug('if block caught 0 byte file %s', status)
         raise ValueError(f'Invalid file. File {filepath} is empty.')
 
     permissions = oct(status.st_mode)[-3:]
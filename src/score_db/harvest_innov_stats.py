@@ -19,7 +19,11 @@ from score_db import time_utils
 from score_db.time_utils import DateRange
 from score_hv.harvester_base import harvest
 from score_db.expt_metrics import ExptMetricInputData, ExptMetricRequest
+from score_db.expt_metrics import refresh_latest_values
 from score_db.db_action_response import DbActionResponse
+from score_db import log_utils
+
+logger = log_utils.get_logger(__name__)
 
 # import aws_s3_interface as s3
 # from aws_s3_interface import AwsS3CommandRawResponse
@@ -80,7 +84,7 @@ class FileData:
 
     def __post_init__(self):
         self.cycles = self.file_dict.get('cycles')
-        print(f'self.cycles: {self.cycles}')
+        logger.debug('self.cycles: %s', self.cycles)
         self.filepath_frmt_str = self.file_dict.get('filepath')
         self.filename_frmt_str = self.file_dict.get('filename')
         self.harvester = self.file_dict.get('harvester')
@@ -96,7 +100,7 @@ class FileData:
             trcbk = traceback.format_exc()
             msg = f'Problem formatting filename: {file_format_str}, ' \
                 f'cycle_time: {self.cycle_time}, err: {trcbk}'
-            print(f'{msg}')
+            logger.error(msg)
 
         return self.filename
 
@@ -123,7 +127,7 @@ class HarvestInnovStatsRequest(object):
             trcbk = traceback.format_exc()
             msg = f'Problem parsing date range: {date_range_dict}, ' \
                 f'err: {trcbk}'
-            print(f'{msg}')
+            logger.error(msg)
             raise ValueError(msg) from err
 
         self.date_range = DateRange(start, end)
@@ -144,7 +148,7 @@ class HarvestInnovStatsRequest(object):
 
             self.hv_files.append(FileData(file_dict))
         
-        print(f'hv_files: {self.hv_files}')
+        logger.debug('hv_files: %s', self.hv_files)
         self.output_format = self.config_dict.get('output_format')
         self.expt_name = self.config_dict.get('expt_name')
         self.expt_wallclk_strt = self.config_dict.get('expt_wallclk_strt')
@@ -161,10 +165,11 @@ class HarvestInnovStatsRequest(object):
         details = {}
         error_msg = ""
         success = True
+        ingested = False
         messages = ""
         while not finished:
-            print(
-                f'loop {loop_count} of while loop, finished: {finished}')
+            logger.debug(
+                'loop %s of while loop, finished: %s', loop_count, finished)
             loop_count += 1
 
             for file_dict in self.hv_files:
@@ -189,7 +194,7 @@ class HarvestInnovStatsRequest(object):
                     'output_format': self.output_format
                 }
 
-                print(f'harvest config: {harvest_config}')
+                logger.debug('harvest config: %s', harvest_config)
                 harvested_data = harvest(harvest_config)
 
                 # harvest data from diagnostics file
@@ -198,7 +203,7 @@ class HarvestInnovStatsRequest(object):
 
                 expt_metrics = []
 
-                print(f'harvested_data: type: {type(harvested_data)}')
+                logger.debug('harvested_data: type: %s', type(harvested_data))
                 for row in harvested_data:
                     item = ExptMetricInputData(
                         row.name,
@@ -230,12 +235,17 @@ class HarvestInnovStatsRequest(object):
                 details[loop_count] = result.details
                 messages += result.message
                 success = (success and result.success)
+                ingested = (ingested or result.success)
                 error_msg += result.errors
 
             self.date_range.increment(days=n_days, hours=n_hours)
 
             if self.date_range.at_end():
                 finished = True
+
+        # one refresh of the latest values view for the whole batch
+        if ingested:
+            refresh_latest_values()
                 
         #add db action response 
         response = DbActionResponse(
@@ -246,6 +256,6 @@ class HarvestInnovStatsRequest(object):
             error_msg
         ) 
 
-        print(f'response: {response}')
+        logger.debug('response: %s', response)
         return response 
         
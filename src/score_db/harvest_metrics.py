@@ -21,7 +21,11 @@ from score_db import time_utils
 from score_db.time_utils import DateRange
 from score_hv.harvester_base import harvest
 from score_db.expt_metrics import ExptMetricInputData, ExptMetricRequest
+from score_db.expt_metrics import refresh_latest_values
 from score_db.expt_array_metrics import ExptArrayMetricInputData, ExptArrayMetricRequest
+from score_db import log_utils
+
+logger = log_utils.get_logger(__name__)
 
 @dataclass
 class HarvestMetricsRequest(object):
@@ -64,11 +68,11 @@ class HarvestMetricsRequest(object):
     #function for harvesting and saving to expt metrics table
     def submit_single_metrics(self):
         # get harvested data
-        print(f'harvest config: {self.hv_config}')
+        logger.debug('harvest config: %s', self.hv_config)
         harvested_data = harvest(self.hv_config)
 
         expt_metrics = []
-        print(f'harvested_data: type: {type(harvested_data)}')
+        logger.debug('harvested_data: type: %s', type(harvested_data))
         for row in harvested_data:
             data = ""
             #Call appropriate translator if one is provided
@@ -109,16 +113,18 @@ class HarvestMetricsRequest(object):
 
         emr = ExptMetricRequest(request_dict)
         result = emr.submit()
+        if result.success:
+            refresh_latest_values()
         return result
     
     #function for harvesting and saving values to expt array metrics
     def submit_array_metrics(self):
         # get harvested data
-        print(f'harvest config: {self.hv_config}')
+        logger.debug('harvest config: %s', self.hv_config)
         harvested_data = harvest(self.hv_config)
 
         expt_array_metrics = []
-        print(f'harvested_data: type: {type(harvested_data)}')
+        logger.debug('harvested_data: type: %s', type(harvested_data))
         for row in harvested_data:
             data = ""
             #Call appropriate translator if one is provided
@@ -0,0 +1,146 @@
+"""
+Copyright 2024 NOAA
+All rights reserved.
+
+Collection of methods to set up logging for the score_db package.  Every
+module logs through a child of the 'score_db' logger (for example
+'score_db.expt_metrics') so that the verbosity of the whole package or of
+a single module can be changed without touching the code.  By default
+only warnings and errors are reported.  The levels can be set from the
+environment (or .env file), e.g.
+
+SCORE_DB_LOG_LEVEL = 'INFO'
+SCORE_DB_LOG_LEVELS = 'expt_metrics=DEBUG,regions=WARNING'
+
+Messages should be passed to the logger with %-style arguments (not
+f-strings) so that records below the active level are never formatted.
+
+"""
+import logging
+import os
+import sys
+import threading
+
+from dotenv import load_dotenv
+
+PACKAGE_LOGGER_NAME = 'score_db'
+LOG_LEVEL_ENV = 'SCORE_DB_LOG_LEVEL'
+MODULE_LOG_LEVELS_ENV = 'SCORE_DB_LOG_LEVELS'
+
+DEFAULT_LOG_LEVEL = logging.WARNING
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+_env_levels_applied = False
+_handler = None
+_lock = threading.Lock()
+
+
+def get_level(level):
+    """ convert a level name (e.g. 'debug') or number to a logging level """
+    if isinstance(level, int):
+        return level
+
+    level_value = logging.getLevelName(str(level).strip().upper())
+    if not isinstance(level_value, int):
+        msg = f'Invalid log level: \'{level}\', must be one of ' \
+            '[DEBUG, INFO, WARNING, ERROR, CRITICAL].'
+        raise ValueError(msg)
+    return level_value
+
+
+def get_logger_name(name):
+    """ map a module name to its logger under the 'score_db' logger """
+    if name == PACKAGE_LOGGER_NAME or \
+        name.startswith(f'{PACKAGE_LOGGER_NAME}.'):
+        return name
+    return f'{PACKAGE_LOGGER_NAME}.{name}'
+
+
+def parse_module_levels(module_levels):
+    """
+    Parse a 'module=LEVEL,module=LEVEL' string into a dict of logger
+    names and levels.
+    """
+    levels = {}
+    if module_levels is None or module_levels.strip() == '':
+        return levels
+
+    for item in module_levels.split(','):
+        if item.strip() == '':
+            continue
+        try:
+            module, level = item.split('=')
+        except ValueError as err:
+            msg = f'Invalid module log level: \'{item}\', expected ' \
+                'module=LEVEL'
+            raise ValueError(msg) from err
+        levels[get_logger_name(module.strip())] = get_level(level)
+
+    return levels
+
+
+def set_levels(level=None, module_levels=None):
+    """
+    Set the level of the package logger and, optionally, of individual
+    module loggers ('module_levels' is a dict or a 'module=LEVEL,...' str)
+    """
+    if level is not None:
+        logging.getLogger(PACKAGE_LOGGER_NAME).setLevel(get_level(level))
+
+    if isinstance(module_levels, str):
+        module_levels = parse_module_levels(module_levels)
+    if module_levels is None:
+        return
+
+    for name, module_level in module_levels.items():
+        logging.getLogger(get_logger_name(name)).setLevel(
+            get_level(module_level))
+
+
+def apply_env_levels():
+    """ set the logger levels from the environment, once per process """
+    global _env_levels_applied
+    if _env_levels_applied:
+        return
+
+    with _lock:
+        if _env_levels_applied:
+            return
+        load_dotenv()
+        set_levels(
+            os.getenv(LOG_LEVEL_ENV) or DEFAULT_LOG_LEVEL,
+            os.getenv(MODULE_LOG_LEVELS_ENV)
+        )
+        _env_levels_applied = True
+
+
+def get_logger(name):
+    """
+    Returns the logger for a score_db module - use as
+    logger = log_utils.get_logger(__name__)
+    """
+    apply_env_levels()
+    return logging.getLogger(get_logger_name(name))
+
+
+def configure_logging(level=None, module_levels=None, stream=None):
+    """
+    Attach a single stream handler to the package logger (used by the
+    command line entry point) and optionally override the levels taken
+    from the environment.  Library users are free to configure handlers
+    themselves instead.
+    """
+    global _handler
+    apply_env_levels()
+    set_levels(level, module_levels)
+
+    package_logger = logging.getLogger(PACKAGE_LOGGER_NAME)
+    with _lock:
+        if _handler is not None:
+            package_logger.removeHandler(_handler)
+        _handler = logging.StreamHandler(
+            stream if stream is not None else sys.stderr)
+        _handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        package_logger.addHandler(_handler)
+
+    return package_logger
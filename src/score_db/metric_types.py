@@ -17,6 +17,9 @@ import score_db.score_table_models as stm
 from score_db.score_table_models import MetricType as mt
 from score_db import time_utils
 from score_db import db_utils
+from score_db import dimension_cache
+from score_db import log_utils
+from score_db import result_formats
 
 from pandas import DataFrame
 import sqlalchemy as db
@@ -26,6 +29,8 @@ from sqlalchemy import and_, or_, not_
 from sqlalchemy import asc, desc
 from sqlalchemy.sql import func
 
+logger = log_utils.get_logger(__name__)
+
 MetricTypeData = namedtuple(
     'MetricTypeData',
     [
@@ -50,8 +55,8 @@ class MetricType:
     metric_type_data: MetricTypeData = field(init=False)
 
     def __post_init__(self):
-        print(f'in post init name: {self.name}')
-        print(f'description: {self.description}')
+        logger.debug('in post init name: %s', self.name)
+        logger.debug('description: %s', self.description)
         self.metric_type_data = MetricTypeData(
             self.name,
             self.long_name,
@@ -99,11 +104,11 @@ def get_string_filter(filters, cls, key, constructed_filter):
             f'type: {type(filters)}'
         raise TypeError(msg)
 
-    print(f'Column \'{key}\' is of type {type(getattr(cls, key).type)}.')
+    logger.debug('Column \'%s\' is of type %s.', key, type(getattr(cls, key).type))
     string_flt = filters.get(key)
 
     if string_flt is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
         return constructed_filter
 
     like_filter = string_flt.get('like')
@@ -158,6 +163,7 @@ class MetricTypeRequest:
     filters: dict = field(default_factory=dict, init=False)
     ordering: list = field(default_factory=list, init=False)
     record_limit: int = field(default_factory=int, init=False)
+    output_format: str = field(default=None, init=False)
     body: dict = field(default_factory=dict, init=False)
     metric_type: MetricType = field(init=False)
     metric_type_data: namedtuple = field(init=False)
@@ -167,6 +173,7 @@ class MetricTypeRequest:
     def __post_init__(self):
         self.method = db_utils.validate_method(self.request_dict.get('method'))
         self.params = self.request_dict.get('params')
+        self.output_format = result_formats.get_output_format(self.params)
 
         self.body = self.request_dict.get('body')
         if self.method == db_utils.HTTP_PUT:
@@ -177,9 +184,9 @@ class MetricTypeRequest:
                 self.metric_type_data._fields, self.metric_type_data
             ):
                 val = pprint.pformat(v, indent=4)
-                print(f'exp_data: k: {k}, v: {val}')
+                logger.debug('exp_data: k: %s, v: %s', k, val)
         else:
-            print(f'In MetricTypeRequest - params: {self.params}')
+            logger.debug('In MetricTypeRequest - params: %s', self.params)
             if isinstance(self.params, dict):
                 self.filters = construct_filters(self.params.get('filters'))
                 self.ordering = self.params.get('ordering')
@@ -214,14 +221,11 @@ class MetricTypeRequest:
             except Exception as err:
                 error_msg = 'Failed to insert metric type record -' \
                     f' err: {err}'
-                print(f'Submit PUT error: {error_msg}')
+                logger.error('Submit PUT error: %s', error_msg)
                 return self.failed_request(error_msg)
 
     
     def put_metric_type(self):
-        engine = stm.get_engine_from_settings()
-        session = stm.get_session()
-
         insert_stmt = insert(mt).values(
             name=self.metric_type_data.name,
             long_name = self.metric_type_data.long_name,
@@ -232,7 +236,7 @@ class MetricTypeRequest:
             created_at=datetime.utcnow(),
             updated_at=None
         ).returning(mt)
-        print(f'insert_stmt: {insert_stmt}')
+        logger.debug('insert_stmt: %s', insert_stmt)
 
         time_now = datetime.utcnow()
 
@@ -248,28 +252,30 @@ class MetricTypeRequest:
             )
         )
 
-        print(f'do_update_stmt: {do_update_stmt}')
+        logger.debug('do_update_stmt: %s', do_update_stmt)
 
-        try:
-            result = session.execute(do_update_stmt)
-            session.flush()
-            result_row = result.fetchone()
-            action = db_utils.INSERT
-            if result_row.updated_at is not None:
-                action = db_utils.UPDATE
-            # print(f'result.fetchone(): {result_row}')
-            # print(f'updated_at: {result_row.updated_at}')
-            # print(f'result.fetchone().keys(): {result_row._mapping}')
-
-            session.commit()
-            session.close()
-        except Exception as err:
-            message = f'Attempt to {action} metric type record FAILED'
-            error_msg = f'Failed to insert/update record - err: {err}'
-            print(f'error_msg: {error_msg}')
-        else:
-            message = f'Attempt to {action} metric type record SUCCEEDED'
-            error_msg = None
+        with stm.session_scope() as session:
+            try:
+                result = session.execute(do_update_stmt)
+                session.flush()
+                result_row = result.fetchone()
+                action = db_utils.INSERT
+                if result_row.updated_at is not None:
+                    action = db_utils.UPDATE
+                # print(f'result.fetchone(): {result_row}')
+                # print(f'updated_at: {result_row.updated_at}')
+                # print(f'result.fetchone().keys(): {result_row._mapping}')
+
+                session.commit()
+            except Exception as err:
+                session.rollback()
+                result_row = None
+                message = f'Attempt to {action} metric type record FAILED'
+                error_msg = f'Failed to insert/update record - err: {err}'
+                logger.error('error_msg: %s', error_msg)
+            else:
+                message = f'Attempt to {action} metric type record SUCCEEDED'
+                error_msg = None
         
         results = {}
         if result_row is not None:
@@ -277,6 +283,9 @@ class MetricTypeRequest:
             results['data'] = [result_row._mapping]
             results['id'] = result_row.id
 
+        # the next id lookup during ingest reloads the table
+        dimension_cache.invalidate(stm.METRIC_TYPES_TABLE)
+
         response = DbActionResponse(
             self.request_dict,
             (error_msg is None),
@@ -285,62 +294,60 @@ class MetricTypeRequest:
             error_msg
         )
 
-        print(f'response: {response}')
+        logger.debug('response: %s', response)
         return response
 
     
     def get_metric_types(self):
-        engine = stm.get_engine_from_settings()
-        session = stm.get_session()
-
-        q = session.query(
-            mt.id,
-            mt.name,
-            mt.long_name,
-            mt.measurement_type,
-            mt.measurement_units,
-            mt.stat_type,
-            mt.description,
-            mt.created_at,
-            mt.updated_at
-        ).select_from(
-            mt
-        )
+        with stm.read_session_scope() as session:
+            q = session.query(
+                mt.id,
+                mt.name,
+                mt.long_name,
+                mt.measurement_type,
+                mt.measurement_units,
+                mt.stat_type,
+                mt.description,
+                mt.created_at,
+                mt.updated_at
+            ).select_from(
+                mt
+            )
 
-        print('Before adding filters to metric types request########################')
-        if self.filters is not None and len(self.filters) > 0:
-            for key, value in self.filters.items():
-                q = q.filter(value)
+            logger.debug('Before adding filters to metric types request########################')
+            if self.filters is not None and len(self.filters) > 0:
+                for key, value in self.filters.items():
+                    q = q.filter(value)
         
-        print('After adding filters to metric types request########################')
+            logger.debug('After adding filters to metric types request########################')
         
-        # add column ordering
-        column_ordering = db_utils.build_column_ordering(mt, self.ordering)
-        if column_ordering is not None and len(column_ordering) > 0:
-            for ordering_item in column_ordering:
-                q = q.order_by(ordering_item)
+            # add column ordering
+            column_ordering = db_utils.build_column_ordering(mt, self.ordering)
+            if column_ordering is not None and len(column_ordering) > 0:
+                for ordering_item in column_ordering:
+                    q = q.order_by(ordering_item)
 
-        # limit number of returned records
-        if self.record_limit is not None and self.record_limit > 0:
-            q = q.limit(self.record_limit)
+            # limit number of returned records
+            if self.record_limit is not None and self.record_limit > 0:
+                q = q.limit(self.record_limit)
 
-        metric_types = q.all()
+            metric_types = q.all()
 
-        results = DataFrame()
+        results = None
         error_msg = None
         record_count = 0
         try:
             if len(metric_types) > 0:
-                results = DataFrame(metric_types, columns = metric_types[0]._fields)
+                results = result_formats.format_records(
+                    metric_types, metric_types[0]._fields, self.output_format)
             
         except Exception as err:
             message = 'Request for metric type records FAILED'
             error_msg = f'Failed to get metric type  records - err: {err}'
         else:
             message = 'Request for metric type records SUCCEEDED'
-            for idx, row in results.iterrows():
-                print(f'idx: {idx}, row: {row}')
-            record_count = len(results.index)
+            logger.debug('records: %s', results)
+            record_count = len(metric_types)
         
         details = {}
         # details['filters'] = self.filters
@@ -357,6 +364,6 @@ class MetricTypeRequest:
             error_msg
         )
 
-        print(f'response: {response}')
+        logger.debug('response: %s', response)
 
         return response
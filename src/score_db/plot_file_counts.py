@@ -21,6 +21,9 @@ from matplotlib import pyplot as plt
 from score_db.expt_file_counts import ExptFileCountRequest
 from score_db.file_counts_plot_attrs import plot_attrs
 from score_db.plot_innov_stats import PlotInnovStatsRequest
+from score_db import log_utils
+
+logger = log_utils.get_logger(__name__)
 
 # figure output directory
 WORK_DIR = os.path.join('/', 'contrib', 'shared', 'replay', 'results')
@@ -148,7 +151,7 @@ def get_experiment_file_counts(request_data):
                         }
                     }
     }
-    print(f'request_dict: {request_dict}')
+    logger.debug('request_dict: %s', request_dict)
 
     efcr = ExptFileCountRequest(request_dict)
     result = efcr.submit()
@@ -197,7 +200,7 @@ def build_fig_dest(work_dir, fig_base_fn, metric, date_range):
     return dest_full_path
 
 def save_figure(dest_full_path):
-    print(f'saving figure to {dest_full_path}')
+    logger.info('saving figure to %s', dest_full_path)
     plt.savefig(dest_full_path, dpi=600)
 
 def plot_file_counts(experiments, metric, metrics_df, work_dir, fig_base_fn,
@@ -309,6 +312,9 @@ class PlotFileCountRequest(PlotInnovStatsRequest):
 
         finished = False
         loop_count = 0
+        # the file counts request only filters on the experiment, fetch
+        # each experiment's counts once instead of once per metric
+        experiment_counts = {}
         for stat_group in self.stat_groups:
             metrics_data = []
             # gather experiment metrics data for experiment and date range
@@ -321,8 +327,12 @@ class PlotFileCountRequest(PlotInnovStatsRequest):
                         stat_group.stat_group_frmt_str,
                         metric,
                         self.date_range)
-                        
-                    e_df = get_experiment_file_counts(request_data)
+
+                    expt_name = experiment['name']['exact']
+                    if expt_name not in experiment_counts:
+                        experiment_counts[expt_name] = \
+                            get_experiment_file_counts(request_data)
+                    e_df = experiment_counts[expt_name]
                     e_df = e_df.sort_values(['cycle', 'created_at'])
                     m_df = pd.concat([m_df, e_df], axis=0)
 
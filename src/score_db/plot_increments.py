@@ -16,8 +16,12 @@ from pandas import DataFrame
 from matplotlib import pyplot as plt
 
 from score_db.expt_metrics import ExptMetricRequest
+from score_db.expt_metrics import get_filter_set_frames
 from score_db.increments_plot_attrs import plot_attrs
 from score_db.plot_innov_stats import PlotInnovStatsRequest
+from score_db import log_utils
+
+logger = log_utils.get_logger(__name__)
 
 # figure output directory
 WORK_DIR = os.path.join('/', 'contrib', 'shared', 'replay', 'results')
@@ -159,7 +163,7 @@ def unique(sequence):
     seen = set()
     return [x for x in sequence if not (x in seen or seen.add(x))]
 
-def get_experiment_increments(request_data):
+def get_experiment_increments_filters(request_data):
     
     expt_metric_name = request_data.metric_format_str.replace(
                                                         '{metric}', 
@@ -181,28 +185,48 @@ def get_experiment_increments(request_data):
 
     time_valid_to = datetime.strftime(request_data.time_valid.end, 
                                       request_data.datetime_str)
+    return {'experiment':
+              {'name': {
+                 'exact': request_data.experiment['name']['exact']},
+               'wallclock_start':
+                 {'from': request_data.experiment['wallclock_start']['from'],
+                  'to': request_data.experiment['wallclock_start']['to']}},
+            'metric_types': {'name': {'exact': [metric_measurement_name]},
+                             'measurement_type': {'exact': [metric_measurement_type]},
+                             'stat_type': {'exact': [request_data.stat]}},
+            'regions': {'rgs_name': {'exact': ['global']}},
+            'time_valid': {'from': time_valid_from,
+                           'to': time_valid_to}}
+
+def get_experiment_increments_batch(request_data_list):
+    """
+    Fetch the increments of every RequestData in one batch GET (a filter
+    set per RequestData), returns a DataFrame per RequestData.
+    """
     request_dict = {'name': 'expt_metrics', 'method': 'GET',
                     'params': {'datestr_format': '%Y-%m-%d %H:%M:%S',
-                               'filters':
-                                 {'experiment':
-                                   {'name': {
-                                      'exact': request_data.experiment['name']['exact']},
-                                    'wallclock_start':
-                                      {'from': request_data.experiment['wallclock_start']['from'],
-                                       'to': request_data.experiment['wallclock_start']['to']}},
-                                  'metric_types': {'name': {'exact': [metric_measurement_name]},
-                                                   'measurement_type': {'exact': [metric_measurement_type]},
-                                                   'stat_type': {'exact': [request_data.stat]}},
-                                  'regions': {'rgs_name': {'exact': ['global']}},
-                                  'time_valid': {'from': time_valid_from,
-                                                 'to': time_valid_to}},
-                                 'ordering': [{'name': 'time_valid', 'order_by': 'asc'}]}}
-
-    print(f'request_dict: {request_dict}')
+                               'filter_sets': [
+                                 get_experiment_increments_filters(request_data)
+                                 for request_data in request_data_list],
+                               'ordering': [{'name': 'time_valid', 'order_by': 'asc'}]}}
+
+    logger.debug('request_dict: %s', request_dict)
 
     emr = ExptMetricRequest(request_dict)
     result = emr.submit()
-    return result.details['records']
+    if not result.success:
+        msg = f'Failed to get experiment increments - err: {result.errors}'
+        raise ValueError(msg)
+
+    frames = get_filter_set_frames(
+        result.details.get('records'), range(len(request_data_list)))
+    return [frames[tag] for tag in range(len(request_data_list))]
+
+def get_experiment_increments(request_data):
+    e_df = get_experiment_increments_batch([request_data])[0]
+    if e_df.shape[0] == 0:
+        raise KeyError('records')
+    return e_df
 
 def build_base_figure():
     fig, ax = plt.subplots()
@@ -246,7 +270,7 @@ def build_fig_dest(work_dir, fig_base_fn, stat, metric, date_range):
     return dest_full_path
 
 def save_figure(dest_full_path):
-    print(f'saving figure to {dest_full_path}')
+    logger.info('saving figure to %s', dest_full_path)
     plt.savefig(dest_full_path, dpi=600)
 
 def plot_increments(experiments, stat, metric, metrics_df, work_dir, fig_base_fn,
@@ -343,35 +367,44 @@ class PlotIncrementRequest(PlotInnovStatsRequest):
         loop_count = 0
         for stat_group in self.stat_groups:
             metrics_data = []
-            # gather experiment metrics data for experiment and date range
+            # gather experiment metrics data for experiment and date range,
+            # every metric, stat and experiment of the group in one request
+            plots = []
+            request_data_list = []
             for metric in stat_group.metrics:
                 for stat in stat_group.stats:
-                    m_df = DataFrame()
+                    plots.append((metric, stat))
                     for experiment in self.experiments:
-                        request_data = RequestData(
+                        request_data_list.append(RequestData(
                             self.datetime_str,
                             experiment,
                             stat_group.stat_group_frmt_str,
                             metric, stat,
-                            self.date_range)
-                        
-                        try:
-                            e_df = get_experiment_increments(request_data)
-                            e_df = e_df.sort_values(['time_valid', 'created_at'])
-                            m_df = pd.concat([m_df, e_df], axis=0)
-                            plot_yes = True
-                        except KeyError:
-                            print('no records found for %s %s, skipping' % (stat, metric))
-                            plot_yes = False
-                    if plot_yes:
-                        plot_increments(
-                            self.experiments,
-                            stat,
-                            metric,
-                            m_df,
-                            self.work_dir,
-                            self.fig_base_fn,
-                            self.date_range)
+                            self.date_range))
+
+            frames = iter(get_experiment_increments_batch(request_data_list))
+            for metric, stat in plots:
+                m_df = DataFrame()
+                for experiment in self.experiments:
+                    e_df = next(frames)
+                    if e_df.shape[0] == 0:
+                        logger.warning(
+                            'no records found for %s %s, skipping',
+                            stat, metric)
+                        plot_yes = False
+                        continue
+                    e_df = e_df.sort_values(['time_valid', 'created_at'])
+                    m_df = pd.concat([m_df, e_df], axis=0)
+                    plot_yes = True
+                if plot_yes:
+                    plot_increments(
+                        self.experiments,
+                        stat,
+                        metric,
+                        m_df,
+                        self.work_dir,
+                        self.fig_base_fn,
+                        self.date_range)
 
 if __name__=='__main__':
     for i, plot_control_dict in enumerate([plot_control_dict1,
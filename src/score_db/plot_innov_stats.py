@@ -26,7 +26,11 @@ from score_db import time_utils
 from score_db.time_utils import DateRange
 from score_hv.harvester_base import harvest
 from score_db.expt_metrics import ExptMetricInputData, ExptMetricRequest
+from score_db.expt_metrics import get_filter_set_frames
 from score_db.innov_stats_plot_attrs import plot_attrs, region_labels
+from score_db import log_utils
+
+logger = log_utils.get_logger(__name__)
 
 
 RequestData = namedtuple(
@@ -63,7 +67,7 @@ class StatGroupData:
         self.elevation_unit = self.stat_group_dict.get('elevation_unit')
 
 
-def get_experiment_metrics(request_data):
+def get_experiment_metrics_filters(request_data):
     
     expt_metric_name = request_data.metric_format_str.replace(
         '{metric}', request_data.metric
@@ -79,47 +83,74 @@ def get_experiment_metrics(request_data):
     time_valid_to = datetime.strftime(
         request_data.time_valid.end, request_data.datetime_str)
 
+    return {
+        'experiment': request_data.experiment,    
+        'metric_types': {
+            'name': {
+                'exact': [expt_metric_name]
+            },
+            'stat_type': {
+                'exact': [request_data.stat]
+            }
+        },
+        'regions': {
+            'name': {
+                'exact': request_data.regions
+            },
+        },
+        'time_valid': {
+            'from': time_valid_from,
+            'to': time_valid_to,
+        },
+        'elevation_unit': {
+            'exact': [request_data.elevation_unit]
+        }
+    }
+
+
+def get_experiment_metrics_batch(request_data_list):
+    """
+    Fetch the experiment metrics of every RequestData in one batch GET (a
+    filter set per RequestData), returns a DataFrame per RequestData.
+    """
     request_dict = {
         'name': 'expt_metrics',
         'method': 'GET',
         'params': {
-            'datestr_format': request_data.datetime_str,
-            'filters': {
-                'experiment': request_data.experiment,    
-                'metric_types': {
-                    'name': {
-                        'exact': [expt_metric_name]
-                    },
-                    'stat_type': {
-                        'exact': [request_data.stat]
-                    }
-                },
-                'regions': {
-                    'name': {
-                        'exact': request_data.regions
-                    },
-                },
-                'time_valid': {
-                    'from': time_valid_from,
-                    'to': time_valid_to,
-                },
-                'elevation_unit': {
-                    'exact': [request_data.elevation_unit]
-                }
+            'datestr_format': request_data_list[0].datetime_str,
+            'filter_sets': [
+                get_experiment_metrics_filters(request_data)
+                for request_data in request_data_list
+            ],
+            # the profile is averaged over the cycles in the database
+            'aggregate': {
+                'group_by': ['expt_name', 'elevation', 'region'],
+                'functions': ['mean']
             },
             'ordering': [
-                {'name': 'time_valid', 'order_by': 'asc'},
                 {'name': 'elevation', 'order_by': 'desc'}
             ]
         }
     }
 
-    print(f'request_dict: {request_dict}')
+    logger.debug('request_dict: %s', request_dict)
 
     emr = ExptMetricRequest(request_dict)
     result = emr.submit()
+    if not result.success:
+        msg = f'Failed to get experiment metrics - err: {result.errors}'
+        raise ValueError(msg)
 
-    return result.details['records']
+    frames = get_filter_set_frames(
+        result.details.get('records'), range(len(request_data_list)))
+    return [
+        frames[tag].rename(columns={'value_mean': 'value'})
+        for tag in range(len(request_data_list))
+    ]
+
+
+def get_experiment_metrics(request_data):
+    return get_experiment_metrics_batch([request_data])[0]
 
 
 def build_base_figure():
@@ -208,7 +239,7 @@ def build_fig_dest(
 
 
 def save_figure(plt, dest_full_path):
-    print(f'saving figure to {dest_full_path}')
+    logger.info('saving figure to %s', dest_full_path)
     plt.savefig(dest_full_path)
 
 
@@ -333,7 +364,7 @@ class PlotInnovStatsRequest(object):
             trcbk = traceback.format_exc()
             msg = f'Problem parsing date range: {date_range_dict}, ' \
                 f'err: {trcbk}'
-            print(f'{msg}')
+            logger.debug(msg)
             raise ValueError(msg) from err
 
         self.date_range = DateRange(start, end)
@@ -400,12 +431,15 @@ class PlotInnovStatsRequest(object):
         for stat_group in self.stat_groups:
             elevation_unit = stat_group.elevation_unit
             metrics_data = []
-            # gather experiment metrics data for experiment and date range
+            # the experiment metrics of every metric, stat and experiment in
+            # the group are fetched with a single batch request
+            plots = []
+            request_data_list = []
             for metric in stat_group.metrics:
                 for stat in stat_group.stats:
-                    m_df = DataFrame()
+                    plots.append((metric, stat))
                     for experiment in self.experiments:
-                        request_data = RequestData(
+                        request_data_list.append(RequestData(
                             self.datetime_str,
                             experiment,
                             stat_group.stat_group_frmt_str,
@@ -414,18 +448,22 @@ class PlotInnovStatsRequest(object):
                             stat_group.regions,
                             stat_group.elevation_unit,
                             self.date_range
-                        )
-
-                        e_df = get_experiment_metrics(request_data)
-                        e_df = e_df.sort_values(['expt_name', 'region', 'elevation'])
-                        m_df = pd.concat([m_df, e_df], axis=0)
-
-                    plot_innov_stats(
-                        self.experiments,
-                        metric,
-                        stat,
-                        m_df,
-                        self.work_dir,
-                        self.fig_base_fn,
-                        self.date_range
-                    )
+                        ))
+
+            frames = iter(get_experiment_metrics_batch(request_data_list))
+            for metric, stat in plots:
+                m_df = DataFrame()
+                for experiment in self.experiments:
+                    e_df = next(frames)
+                    e_df = e_df.sort_values(['expt_name', 'region', 'elevation'])
+                    m_df = pd.concat([m_df, e_df], axis=0)
+
+                plot_innov_stats(
+                    self.experiments,
+                    metric,
+                    stat,
+                    m_df,
+                    self.work_dir,
+                    self.fig_base_fn,
+                    self.date_range
+                )
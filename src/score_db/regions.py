@@ -23,11 +23,28 @@ from score_db.db_action_response import DbActionResponse
 import score_db.score_table_models as stm
 from score_db.score_table_models import Region as rg
 from score_db import db_utils
+from score_db import dimension_cache
+from score_db import log_utils
+from score_db import result_formats
 
 from pandas import DataFrame
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.inspection import inspect
 
+logger = log_utils.get_logger(__name__)
+
+# columns of a region GET record
+REGION_COLUMNS = [
+    'id',
+    'name',
+    'min_lat',
+    'max_lat',
+    'east_lon',
+    'west_lon',
+    'created_at',
+    'updated_at'
+]
+
 PARAM_FILTER_TYPE = 'filter_type'
 
 FILTER__NONE = 'none'
@@ -152,7 +169,7 @@ def validate_body(method, body, filter_type=None):
     else:
         raise ValueError(f'Invalid method, must be one of {db_utils.VALID_METHODS}')
 
-    print(f'region_names: {region_names}, regions: {regions}')
+    logger.debug('region_names: %s, regions: %s', region_names, regions)
     return [region_names, regions]
 
 
@@ -186,11 +203,11 @@ def get_string_filter(filters, cls, key, constructed_filter):
                 f'type: {type(filters)}'
             raise TypeError(msg)
 
-        print(f'Column \'{key}\' is of type {type(getattr(cls, key).type)}.')
+        logger.debug('Column \'%s\' is of type %s.', key, type(getattr(cls, key).type))
         string_flt = filters.get(key)
 
         if string_flt is None:
-            print(f'No \'{key}\' filter detected')
+            logger.debug('No \'%s\' filter detected', key)
             return constructed_filter
 
         like_filter = string_flt.get('like')
@@ -212,11 +229,11 @@ def get_float_filter(filters, cls, key, constructed_filter):
             f'type: {type(filters)}'
         raise TypeError(msg)
 
-    print(f'Column \'{key}\' is of type {type(getattr(cls, key).type)}.')
+    logger.debug('Column \'%s\' is of type %s.', key, type(getattr(cls, key).type))
     float_flt = filters.get(key)
 
     if float_flt is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
         return constructed_filter
 
     constructed_filter[key] = ( getattr(cls, key) == float_flt )
@@ -244,6 +261,7 @@ class RegionRequest:
     request_dict: dict
     method: str = field(default_factory=str, init=False)
     params: dict = field(default_factory=dict, init=False)
+    output_format: str = field(default=None, init=False)
     filter_type: str = field(default_factory=str, init=False)
     body: dict = field(default_factory=dict, init=False)
     regions: list = field(default_factory=list, init=False)
@@ -253,6 +271,7 @@ class RegionRequest:
     def __post_init__(self):
         self.method = db_utils.validate_method(self.request_dict.get('method'))
         self.params = self.request_dict.get('params', {})
+        self.output_format = result_formats.get_output_format(self.params)
         self.filter_type = get_filter_type(self.params)
         self.body = self.request_dict.get('body')
         [self.region_names, self.regions] = validate_body(
@@ -265,13 +284,17 @@ class RegionRequest:
             matched_json = None
             try:
                 if self.filter_type == FILTER__NONE:
-                    matched_records = self.get_all_regions()
+                    regions = self.get_all_regions()
                 elif self.filter_type == FILTER__BY_REGION_NAME:
-                    matched_records = self.get_regions_by_name()
+                    regions = self.get_regions_by_name()
                 else: #Filter by Region Data
-                    matched_records = self.get_regions_by_data()
-                message = f'Request returned {len(matched_records)} record/s'
-                matched_json = matched_records.to_json(orient = 'records')
+                    regions = self.get_regions_by_data()
+                message = f'Request returned {len(regions)} record/s'
+                matched_records = result_formats.format_records(
+                    regions, REGION_COLUMNS, self.output_format)
+                # the json copy is only built for the default DataFrame
+                if isinstance(matched_records, DataFrame):
+                    matched_json = matched_records.to_json(orient = 'records')
             except Exception as err:
                 error_msg = f'Problems encountered requesting regions - {err}'
                 return DbActionResponse(
@@ -292,14 +315,14 @@ class RegionRequest:
                 },
                 error_msg
             )
-            print(f'response: {response}')
+            logger.debug('response: %s', response)
             return response
         elif self.method == db_utils.HTTP_PUT:
             try:
                 return self.put_regions()
             except Exception as err:
                 error_msg = f'Failed to put region record - err: {err}'
-                print(f'Submit PUT error: {error_msg}')
+                logger.error('Submit PUT error: %s', error_msg)
                 return DbActionResponse(
                     request=self.request_dict,
                     success=False,
@@ -310,59 +333,49 @@ class RegionRequest:
 
     #get regions filtered by name 
     def get_regions_by_name(self):
-        session = stm.get_session()
         try:
-            existing_regions = session.query(
-                rg.id,
-                rg.name,
-                rg.min_lat,
-                rg.max_lat,
-                rg.east_lon,
-                rg.west_lon,
-                rg.created_at,
-                rg.updated_at
-            ).select_from(
-                rg
-            ).filter(
-                rg.name.in_(self.region_names)
-            ).all()
+            with stm.read_session_scope() as session:
+                existing_regions = session.query(
+                    rg.id,
+                    rg.name,
+                    rg.min_lat,
+                    rg.max_lat,
+                    rg.east_lon,
+                    rg.west_lon,
+                    rg.created_at,
+                    rg.updated_at
+                ).select_from(
+                    rg
+                ).filter(
+                    rg.name.in_(self.region_names)
+                ).all()
         except Exception as err:
-            msg = f'Problem requesting region set - err: {err}'
-            print(msg)
-            return DataFrame()
-
-        session.close()
-        if len(existing_regions) == 0:
-            return DataFrame()
+            logger.error('Problem requesting region set - err: %s', err)
+            return []
 
-        return DataFrame(existing_regions, columns = existing_regions[0]._fields)
+        return existing_regions
 
     #get all regions in database
     def get_all_regions(self):
-        session = stm.get_session()
         try:
-            existing_regions = session.query(
-                rg.id,
-                rg.name,
-                rg.min_lat,
-                rg.max_lat,
-                rg.east_lon,
-                rg.west_lon,
-                rg.created_at,
-                rg.updated_at
-            ).select_from(
-                rg
-            ).all()
+            with stm.read_session_scope() as session:
+                existing_regions = session.query(
+                    rg.id,
+                    rg.name,
+                    rg.min_lat,
+                    rg.max_lat,
+                    rg.east_lon,
+                    rg.west_lon,
+                    rg.created_at,
+                    rg.updated_at
+                ).select_from(
+                    rg
+                ).all()
         except Exception as err:
-            msg = f'Problem requesting region set - err: {err}'
-            print(msg)
-            return DataFrame()
-
-        session.close()
-        if len(existing_regions) == 0:
-            return DataFrame()
+            logger.error('Problem requesting region set - err: %s', err)
+            return []
 
-        return DataFrame(existing_regions, columns = existing_regions[0]._fields)
+        return existing_regions
     
     #get regions based on filters on user provided restrictions on values 
     def get_regions_by_data(self):
@@ -377,94 +390,93 @@ class RegionRequest:
 
         constructed_filters = construct_filters(filters)
         
-        session = stm.get_session()
-
-        q = session.query(
-            rg.id,
-            rg.name,
-            rg.min_lat,
-            rg.max_lat,
-            rg.east_lon,
-            rg.west_lon,
-            rg.created_at,
-            rg.updated_at
-        ).select_from(
-            rg
-        )
+        with stm.read_session_scope() as session:
+            q = session.query(
+                rg.id,
+                rg.name,
+                rg.min_lat,
+                rg.max_lat,
+                rg.east_lon,
+                rg.west_lon,
+                rg.created_at,
+                rg.updated_at
+            ).select_from(
+                rg
+            )
 
-        print('Before adding filters to region request###')
-        for key, value in constructed_filters.items():
-            q = q.filter(value)
-        print('After adding regions filter')
+            logger.debug('Before adding filters to region request###')
+            for key, value in constructed_filters.items():
+                q = q.filter(value)
+            logger.debug('After adding regions filter')
 
-        regions = q.all()
-        session.close()
+            regions = q.all()
  
-        results = DataFrame()
-        if len(regions) > 0:
-            results = DataFrame(regions, columns = regions[0]._fields)
-        return results
+        return regions
     
     def put_regions(self):
-        session = stm.get_session()
         all_results = []
         error_msgs = None
-        for region in self.regions:
-            time_now = datetime.utcnow()
-
-            insert_stmt = insert(rg).values(
-                name=region.name, 
-                min_lat=region.min_lat, 
-                max_lat=region.max_lat,
-                east_lon=region.east_lon,
-                west_lon=region.west_lon,
-                created_at=time_now,
-                updated_at=None
-            ).returning(rg)
-
-            do_update_stmt = insert_stmt.on_conflict_do_update(
-                constraint='unique_region',
-                set_=dict(
-                    name=region.name,
-                    min_lat=region.min_lat,
+        with stm.session_scope() as session:
+            for region in self.regions:
+                time_now = datetime.utcnow()
+
+                insert_stmt = insert(rg).values(
+                    name=region.name, 
+                    min_lat=region.min_lat, 
                     max_lat=region.max_lat,
                     east_lon=region.east_lon,
                     west_lon=region.west_lon,
-                    updated_at=time_now
+                    created_at=time_now,
+                    updated_at=None
+                ).returning(rg)
+
+                do_update_stmt = insert_stmt.on_conflict_do_update(
+                    constraint='unique_region',
+                    set_=dict(
+                        name=region.name,
+                        min_lat=region.min_lat,
+                        max_lat=region.max_lat,
+                        east_lon=region.east_lon,
+                        west_lon=region.west_lon,
+                        updated_at=time_now
+                    )
                 )
-            )
 
-            try:
-                result =session.execute(do_update_stmt)
-                session.flush()
-                result_row = result.fetchone()
-                action = db_utils.INSERT
-                if result_row.updated_at is not None:
-                    action = db_utils.UPDATE
-                session.commit()
-                session.close()
-            except Exception as err:
-                message = f'Attempt to insert/update region record FAILED'
-                error_msg = f'Failed to insert/update record -err: {err}'
-                print(f'error_msg: {error_msg}')
-            else:
-                message = f'Attempt to {action} region record SUCCEEDED'
-                error_msg = None
+                try:
+                    result =session.execute(do_update_stmt)
+                    session.flush()
+                    result_row = result.fetchone()
+                    action = db_utils.INSERT
+                    if result_row.updated_at is not None:
+                        action = db_utils.UPDATE
+                    session.commit()
+                except Exception as err:
+                    session.rollback()
+                    result_row = None
+                    message = f'Attempt to insert/update region record FAILED'
+                    error_msg = f'Failed to insert/update record -err: {err}'
+                    logger.error('error_msg: %s', error_msg)
+                else:
+                    message = f'Attempt to {action} region record SUCCEEDED'
+                    error_msg = None
             
-            results = {}
-            if result_row is not None:
-                results['region_name'] = region.name
-                results['action'] = action
-                results['data'] = [result_row._mapping]
-                results['id'] = result_row.index
+                results = {}
+                if result_row is not None:
+                    results['region_name'] = region.name
+                    results['action'] = action
+                    results['data'] = [result_row._mapping]
+                    results['id'] = result_row.index
             
-            if len(results) > 0:
-                all_results.append(results)
+                if len(results) > 0:
+                    all_results.append(results)
 
-            if error_msg is not None:
-                error_msgs += error_msg + "\n"
+                if error_msg is not None:
+                    error_msgs = (error_msgs or '') + error_msg + "\n"
 
         
+        # the next id lookup during ingest reloads the table
+        dimension_cache.invalidate(stm.REGIONS_TABLE)
+
         response = DbActionResponse(
             self.request_dict,
             (error_msgs is None),
@@ -472,7 +484,7 @@ class RegionRequest:
             all_results,
             error_msg
         )
-        print(f'response: {response}')
+        logger.debug('response: %s', response)
         return response   
 
             
@@ -0,0 +1,182 @@
+"""
+Copyright 2024 NOAA
+All rights reserved.
+
+Opt-in on-disk cache of GET results (expt_metrics and expt_file_counts).
+A result is stored as a Parquet file named after a hash of the request
+type and its normalized params.  Next to it, a small json file records a
+watermark of the filtered rows: their count and max(created_at), read with
+one aggregate query.  A cached result is only used while the watermark is
+unchanged, so rows which are added, re-inserted (which bumps created_at)
+or deleted invalidate it.  When the cache grows over its size limit the
+least recently used results are removed.
+
+Caching is enabled per request with 'cache': True in the GET params, or
+for every GET which does not set 'cache' from the environment (or .env
+file), e.g.
+
+SCORE_DB_RESULT_CACHE = true
+SCORE_DB_RESULT_CACHE_DIR = '/scratch/score_db_cache'
+SCORE_DB_RESULT_CACHE_MAX_BYTES = 1073741824
+
+Only DataFrame results (the default output_format) are cached and writing
+Parquet files requires pyarrow (or fastparquet), without it results are
+not cached.
+
+"""
+from dataclasses import dataclass
+import hashlib
+import json
+import os
+import threading
+
+import pandas as pd
+
+from score_db import db_connection
+from score_db import log_utils
+
+logger = log_utils.get_logger(__name__)
+
+RESULT_CACHE_ENV = 'SCORE_DB_RESULT_CACHE'
+RESULT_CACHE_DIR_ENV = 'SCORE_DB_RESULT_CACHE_DIR'
+RESULT_CACHE_MAX_BYTES_ENV = 'SCORE_DB_RESULT_CACHE_MAX_BYTES'
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser('~'), '.cache', 'score_db', 'results')
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+# params which change how a result is returned but not which rows it holds
+UNCACHED_PARAMS = ['cache', 'stream', 'chunk_size', 'output_format']
+
+RESULT_SUFFIX = '.parquet'
+WATERMARK_SUFFIX = '.json'
+
+
+def normalize(value):
+    """ json text of 'value' which is the same for equal requests """
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def get_request_key(request_name, params):
+    """ hash of the request type and the params which select its rows """
+    if params is None:
+        params = {}
+    cached_params = {
+        key: value for key, value in params.items()
+        if key not in UNCACHED_PARAMS
+    }
+    text = normalize({'name': request_name, 'params': cached_params})
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def is_cache_requested(params):
+    """ the request's 'cache' param, or the environment default """
+    if isinstance(params, dict) and params.get('cache') is not None:
+        return bool(params.get('cache'))
+    return db_connection.get_bool_setting(RESULT_CACHE_ENV, False)
+
+
+@dataclass
+class ResultCache:
+    cache_dir: str
+    max_bytes: int = DEFAULT_MAX_BYTES
+
+    def get_paths(self, key):
+        path = os.path.join(self.cache_dir, key)
+        return path + RESULT_SUFFIX, path + WATERMARK_SUFFIX
+
+    def remove(self, key):
+        for path in self.get_paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def get(self, key, watermark):
+        """
+        Returns the cached DataFrame of 'key' if it was stored with the
+        same 'watermark', otherwise None (a stale entry is removed).
+        """
+        result_path, watermark_path = self.get_paths(key)
+        try:
+            with open(watermark_path, encoding='utf-8') as watermark_file:
+                cached_watermark = watermark_file.read()
+        except FileNotFoundError:
+            return None
+
+        if cached_watermark != normalize(watermark):
+            logger.debug('result cache entry %s is stale', key)
+            self.remove(key)
+            return None
+
+        try:
+            frame = pd.read_parquet(result_path)
+        except Exception as err:
+            logger.warning('Could not read result cache entry %s: %s', key, err)
+            self.remove(key)
+            return None
+
+        # the modification time orders the entries for eviction
+        os.utime(result_path)
+        logger.debug('result cache hit %s (%s rows)', key, frame.shape[0])
+        return frame
+
+    def put(self, key, watermark, frame):
+        """ store 'frame' under 'key', returns False if it was not stored """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        result_path, watermark_path = self.get_paths(key)
+        tmp_path = f'{result_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            frame.to_parquet(tmp_path, index=False)
+        except Exception as err:
+            logger.warning('Could not cache result %s: %s', key, err)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+        os.replace(tmp_path, result_path)
+        with open(watermark_path, 'w', encoding='utf-8') as watermark_file:
+            watermark_file.write(normalize(watermark))
+        logger.debug('cached result %s (%s rows)', key, frame.shape[0])
+
+        self.evict()
+        return True
+
+    def get_entries(self):
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(RESULT_SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append(
+                (stat.st_mtime, stat.st_size, name[:-len(RESULT_SUFFIX)]))
+        return entries
+
+    def evict(self):
+        """ remove the least recently used results until under max_bytes """
+        entries = sorted(self.get_entries())
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            logger.debug('evicting result cache entry %s', key)
+            self.remove(key)
+            total_bytes -= size
+
+    def clear(self):
+        for _, _, key in self.get_entries():
+            self.remove(key)
+
+
+def get_result_cache():
+    return ResultCache(
+        os.getenv(RESULT_CACHE_DIR_ENV) or DEFAULT_CACHE_DIR,
+        db_connection.get_int_setting(
+            RESULT_CACHE_MAX_BYTES_ENV, DEFAULT_MAX_BYTES)
+    )
@@ -0,0 +1,139 @@
+"""
+Copyright 2024 NOAA
+All rights reserved.
+
+Conversion of the rows fetched by a GET request into the 'output_format'
+given in its params:
+
+tuples_list - the fetched named tuples as is, no conversion cost
+pandas_dataframe - a pandas DataFrame (the default)
+numpy_structured_array - a NumPy structured array, one field per column
+arrow_table - a pyarrow Table (pyarrow is optional and only imported when
+    this format is requested)
+
+The NumPy and Arrow formats are built column by column straight from the
+rows, without going through a DataFrame.
+
+"""
+from datetime import datetime
+import numbers
+
+import numpy as np
+from pandas import DataFrame
+
+from score_db import log_utils
+from score_db.db_request_registry import NAMED_TUPLES_LIST, PANDAS_DATAFRAME
+from score_db.db_request_registry import NUMPY_STRUCTURED_ARRAY, ARROW_TABLE
+
+logger = log_utils.get_logger(__name__)
+
+VALID_OUTPUT_FORMATS = [
+    NAMED_TUPLES_LIST,
+    PANDAS_DATAFRAME,
+    NUMPY_STRUCTURED_ARRAY,
+    ARROW_TABLE
+]
+
+DEFAULT_OUTPUT_FORMAT = PANDAS_DATAFRAME
+
+
+def validate_output_format(output_format):
+    if output_format is None:
+        return DEFAULT_OUTPUT_FORMAT
+
+    if output_format not in VALID_OUTPUT_FORMATS:
+        msg = f'output_format must be one of {VALID_OUTPUT_FORMATS}, was: ' \
+            f'{output_format}'
+        raise ValueError(msg)
+    return output_format
+
+
+def get_output_format(params):
+    """ the validated 'output_format' of a request's params (may be None) """
+    if not isinstance(params, dict):
+        return DEFAULT_OUTPUT_FORMAT
+    return validate_output_format(params.get('output_format'))
+
+
+def get_column_values(rows, column_count):
+    if len(rows) == 0:
+        return [[] for _ in range(column_count)]
+    return [list(values) for values in zip(*rows)]
+
+
+def is_instance_of_all(values, types):
+    return all(
+        isinstance(value, types) and not isinstance(value, bool)
+        for value in values
+    )
+
+
+def to_numpy_column(values):
+    """
+    NumPy array of one column: numbers, strings and datetimes (without
+    nulls) get a native dtype, anything else (nulls, lists, ...) is kept
+    as objects.
+    """
+    if len(values) > 0:
+        if all(isinstance(value, bool) for value in values):
+            return np.array(values, dtype=bool)
+        if is_instance_of_all(values, numbers.Integral):
+            return np.array(values, dtype=np.int64)
+        if is_instance_of_all(values, numbers.Real):
+            return np.array(values, dtype=np.float64)
+        if is_instance_of_all(values, str):
+            return np.array(values, dtype=str)
+        if is_instance_of_all(values, datetime) and \
+            all(value.tzinfo is None for value in values):
+            return np.array(values, dtype='datetime64[us]')
+
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def to_structured_array(rows, columns):
+    arrays = [
+        to_numpy_column(values)
+        for values in get_column_values(rows, len(columns))
+    ]
+    records = np.empty(
+        len(rows),
+        dtype=[(name, array.dtype) for name, array in zip(columns, arrays)]
+    )
+    for name, array in zip(columns, arrays):
+        records[name] = array
+    return records
+
+
+def to_arrow_table(rows, columns):
+    try:
+        import pyarrow as pa
+    except ImportError as err:
+        msg = f'output_format \'{ARROW_TABLE}\' requires pyarrow, which is ' \
+            f'not installed - err: {err}'
+        raise ValueError(msg) from err
+
+    return pa.table({
+        name: pa.array(values)
+        for name, values in zip(
+            columns, get_column_values(rows, len(columns)))
+    })
+
+
+def format_records(rows, columns, output_format=None):
+    """
+    Return the fetched 'rows' (a list of tuples ordered like 'columns') in
+    the requested 'output_format'.
+    """
+    output_format = validate_output_format(output_format)
+    columns = list(columns)
+    logger.debug('formatting %s rows as %s', len(rows), output_format)
+
+    if output_format == NAMED_TUPLES_LIST:
+        return list(rows)
+    if output_format == NUMPY_STRUCTURED_ARRAY:
+        return to_structured_array(rows, columns)
+    if output_format == ARROW_TABLE:
+        return to_arrow_table(rows, columns)
+    return DataFrame.from_records(rows, columns=columns)
@@ -12,12 +12,17 @@ from score_db.db_action_response import DbActionResponse
 import score_db.score_table_models as stm
 from score_db.score_table_models import SatMeta as sm 
 from score_db import db_utils
+from score_db import dimension_cache
+from score_db import log_utils
+from score_db import result_formats
 
 import numpy as np
 import psycopg2
 from pandas import DataFrame
 from sqlalchemy.dialects.postgresql import insert
 
+logger = log_utils.get_logger(__name__)
+
 psycopg2.extensions.register_adapter(np.int64, psycopg2._psycopg.AsIs)
 psycopg2.extensions.register_adapter(np.float32, psycopg2._psycopg.AsIs)
 
@@ -74,11 +79,11 @@ def get_string_filter(filters, cls, key, constructed_filter):
             f'type: {type(filters)}'
         raise TypeError(msg)
 
-    print(f'Column \'{key}\' is of type {type(getattr(cls, key).type)}.')
+    logger.debug('Column \'%s\' is of type %s.', key, type(getattr(cls, key).type))
     string_flt = filters.get(key)
 
     if string_flt is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
         return constructed_filter
 
     like_filter = string_flt.get('like')
@@ -99,11 +104,11 @@ def get_int_filter(filters, cls, key, constructed_filter):
             f'type: {type(filters)}'
         raise TypeError(msg)
 
-    print(f'Column \'{key}\' is of type {type(getattr(cls, key).type)}.')
+    logger.debug('Column \'%s\' is of type %s.', key, type(getattr(cls, key).type))
     int_flt = filters.get(key)
 
     if int_flt is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
         return constructed_filter
 
     constructed_filter[key] = ( getattr(cls, key) == int_flt )
@@ -131,6 +136,7 @@ class SatMetaRequest:
     filters: dict = field(default_factory=dict, init=False)
     ordering: list = field(default_factory=list, init=False)
     record_limit: int = field(default_factory=int, init=False)
+    output_format: str = field(default=None, init=False)
     body: dict = field(default_factory=dict, init=False)
     sat_meta: SatMeta = field(init=False)
     response: dict = field(default_factory=dict, init=False)
@@ -138,6 +144,7 @@ class SatMetaRequest:
     def __post_init__(self):
         self.method = db_utils.validate_method(self.request_dict.get('method'))
         self.params = self.request_dict.get('params')
+        self.output_format = result_formats.get_output_format(self.params)
         self.body = self.request_dict.get('body')
         self.filters = None
         self.ordering = None
@@ -177,12 +184,10 @@ class SatMetaRequest:
             except Exception as err:
                 error_msg = 'Failed to insert sat meta record -'\
                     f' err: {err}'
-                print(f'Submit PUT sat meta error: {error_msg}')
+                logger.error('Submit PUT sat meta error: %s', error_msg)
                 return self.failed_request(error_msg)
             
     def put_sat_meta(self):
-        session = stm.get_session()
-
         insert_stmt = insert(sm).values(
             name = self.sat_meta.name,
             sat_id = self.sat_meta.sat_id,
@@ -191,7 +196,7 @@ class SatMetaRequest:
             created_at = datetime.utcnow(),
             updated_at = None
         ).returning(sm)
-        print(f'insert stmt: {insert_stmt}')
+        logger.debug('insert stmt: %s', insert_stmt)
 
         time_now = datetime.utcnow()
 
@@ -203,26 +208,27 @@ class SatMetaRequest:
             )
         )
         
-        print(f'do_update_stmt: {do_update_stmt}')
+        logger.debug('do_update_stmt: %s', do_update_stmt)
 
-        try:
-            result = session.execute(do_update_stmt)
-            session.flush()
-            result_row = result.fetchone()
-            action = db_utils.INSERT
-            if result_row.updated_at is not None:
-                action = db_utils.UPDATE
-
-            session.commit()
-            session.close()
-        except Exception as err:
-            message = f'Attempt to INSERT/UPDATE sat meta record FAILED'
-            error_msg = f'Failed to insert/update record - err: {err}'
-            print(f'error_msg: {error_msg}')
-            session.close()
-        else:
-            message = f'Attempt to {action} sat meta record SUCCEEDED'
-            error_msg = None
+        with stm.session_scope() as session:
+            try:
+                result = session.execute(do_update_stmt)
+                session.flush()
+                result_row = result.fetchone()
+                action = db_utils.INSERT
+                if result_row.updated_at is not None:
+                    action = db_utils.UPDATE
+
+                session.commit()
+            except Exception as err:
+                session.rollback()
+                result_row = None
+                message = f'Attempt to INSERT/UPDATE sat meta record FAILED'
+                error_msg = f'Failed to insert/update record - err: {err}'
+                logger.error('error_msg: %s', error_msg)
+            else:
+                message = f'Attempt to {action} sat meta record SUCCEEDED'
+                error_msg = None
         
         results = {}
         if result_row is not None:
@@ -230,6 +236,9 @@ class SatMetaRequest:
             results['data'] = [result_row._mapping]
             results['id'] = result_row.id
 
+        # the next id lookup during ingest reloads the table
+        dimension_cache.invalidate(stm.SAT_META_TABLE)
+
         response = DbActionResponse(
             self.request_dict,
             (error_msg is None),
@@ -238,58 +247,57 @@ class SatMetaRequest:
             error_msg
         )
 
-        print(f'response: {response}')
+        logger.debug('response: %s', response)
         return response
     
     def get_sat_metas(self):
-        session = stm.get_session()
-
-        q = session.query(
-            sm.id,
-            sm.name,
-            sm.sat_id,
-            sm.sat_name, 
-            sm.short_name,
-            sm.created_at,
-            sm.updated_at
-        ).select_from(
-            sm
-        )
+        with stm.read_session_scope() as session:
+            q = session.query(
+                sm.id,
+                sm.name,
+                sm.sat_id,
+                sm.sat_name, 
+                sm.short_name,
+                sm.created_at,
+                sm.updated_at
+            ).select_from(
+                sm
+            )
 
-        print('Before adding filters to sat meta request########################')
-        if self.filters is not None and len(self.filters) > 0:
-            for key, value in self.filters.items():
-                q = q.filter(value)
+            logger.debug('Before adding filters to sat meta request########################')
+            if self.filters is not None and len(self.filters) > 0:
+                for key, value in self.filters.items():
+                    q = q.filter(value)
         
-        print('After adding filters to sat meta request########################')
+            logger.debug('After adding filters to sat meta request########################')
         
-        # add column ordering
-        column_ordering = db_utils.build_column_ordering(sm, self.ordering)
-        if column_ordering is not None and len(column_ordering) > 0:
-            for ordering_item in column_ordering:
-                q = q.order_by(ordering_item)
+            # add column ordering
+            column_ordering = db_utils.build_column_ordering(sm, self.ordering)
+            if column_ordering is not None and len(column_ordering) > 0:
+                for ordering_item in column_ordering:
+                    q = q.order_by(ordering_item)
 
-        # limit number of returned records
-        if self.record_limit is not None and self.record_limit > 0:
-            q = q.limit(self.record_limit)
+            # limit number of returned records
+            if self.record_limit is not None and self.record_limit > 0:
+                q = q.limit(self.record_limit)
 
-        sat_metas = q.all()
+            sat_metas = q.all()
 
-        results = DataFrame()
+        results = None
         error_msg = None
         record_count = 0
         try:
             if len(sat_metas) > 0:
-                results = DataFrame(sat_metas, columns = sat_metas[0]._fields)
+                results = result_formats.format_records(
+                    sat_metas, sat_metas[0]._fields, self.output_format)
             
         except Exception as err:
             message = 'Request for sat meta records FAILED'
             error_msg = f'Failed to get sat meta records - err: {err}'
         else:
             message = 'Request for sat meta records SUCCEEDED'
-            for idx, row in results.iterrows():
-                print(f'idx: {idx}, row: {row}')
-            record_count = len(results.index)
+            logger.debug('records: %s', results)
+            record_count = len(sat_metas)
         
         details = {}
         details['record_count'] = record_count
@@ -305,6 +313,6 @@ class SatMetaRequest:
             error_msg
         )
 
-        print(f'response: {response}')
+        logger.debug('response: %s', response)
 
         return response
@@ -6,10 +6,14 @@ Collection of methods to facilitate handling of score db requests
 
 """
 import argparse
+from datetime import datetime
 
 from score_db.yaml_utils import YamlLoader
 import score_db.db_request_registry as dbrr
 from score_db import file_utils
+from score_db import log_utils
+
+logger = log_utils.get_logger(__name__)
 
 def handle_request(request_info):
     """
@@ -36,26 +40,27 @@ def handle_request(request_info):
         # Create dictionary from the input file
         db_request_dict = YamlLoader(request_info).load()[0]
     
-    print(f'db_request_dict: {db_request_dict}')
+    logger.debug('db_request_dict: %s', db_request_dict)
 
     # Determine which request to use: note 'request_name' must exist
     # in the db_request yaml/dict and should point to one of the
     # registered requests (each request should be registered in
     # src/db_request_registry.py, see db_request_registry.py for example registered
     # requests).
+    request_name = db_request_dict.get('db_request_name')
+    logger.debug('db_request_name: %s', request_name)
     try:
-        request_name = db_request_dict.get('db_request_name')
-        print(f'db_request_name: {request_name}')
-        print(f'db_request_registry: {dbrr.request_registry}, ' \
-                f'type(request_registry): {type(dbrr.request_registry)}')
-        db_request_handler = dbrr.request_registry.get(request_name)
+        db_request_handler = dbrr.request_registry[request_name]
     except Exception as err:
         msg = f'could not find request from request_dict: {db_request_dict}'
         raise KeyError(msg) from err
 
-    print(f'db_request_handler.description: {db_request_handler.description}')
-    db_request = db_request_handler.request(db_request_dict)
-    print(f'type(request_meta): {type(db_request)}')
+    # the handler's module is imported here, on first use
+    request_class = dbrr.get_request_class(request_name)
+
+    logger.debug('db_request_handler.description: %s', db_request_handler.description)
+    db_request = request_class(db_request_dict)
+    logger.debug('type(request_meta): %s', type(db_request))
     response = db_request.submit()
     # check type of response.  Must be a specific dataclass defined in registry
     return response
@@ -72,19 +77,96 @@ def main():
 
     Parameters
     ----------
-    args: a list of arguments - in this case only one argument is allowed
-    and must be a yaml file containing the db request
+    args: a list of arguments - a yaml file containing the db request
+    and/or the --init-schema flag which creates the database schema
     """
 
     # Arguments
     # ---------
     parser = argparse.ArgumentParser()
-    parser.add_argument('request_yaml', type=str, help='Request ' \
+    parser.add_argument('request_yaml', type=str, nargs='?', help='Request ' \
                         'YAML file for describing the request.')
+    parser.add_argument('--init-schema', action='store_true', help='Create ' \
+                        'the score-db database and any missing tables.')
+    parser.add_argument('--add-natural-keys', action='store_true', help=
+                        'Delete duplicate fact table rows and add the ' \
+                        'natural key unique indexes to existing tables.')
+    parser.add_argument('--add-indexes', action='store_true', help='Add ' \
+                        'the secondary (composite and BRIN) fact table ' \
+                        'indexes to existing tables.')
+    parser.add_argument('--concurrently', action='store_true', help='Build ' \
+                        'the --add-indexes indexes with CREATE INDEX ' \
+                        'CONCURRENTLY (does not block writes).')
+    parser.add_argument('--partition-by', type=str, default=None, help=
+                        'With --init-schema, create fact tables as ' \
+                        'partitioned tables, e.g. \'expt_metrics=range,' \
+                        'expt_array_metrics=hash\' (range: monthly ' \
+                        'time_valid, list/hash: experiment_id).')
+    parser.add_argument('--create-partitions', action='store_true', help=
+                        'Create the missing partitions of the partitioned ' \
+                        'fact tables (monthly range partitions up to ' \
+                        '--months-ahead, one list partition per experiment).')
+    parser.add_argument('--months-ahead', type=int,
+                        default=None, help='Number of future monthly ' \
+                        'partitions created by --create-partitions ' \
+                        '(default: 3).')
+    parser.add_argument('--start', type=str, default=None, help='First ' \
+                        'month (YYYY-MM-DD) of the monthly range partitions ' \
+                        'created by --init-schema or --create-partitions, ' \
+                        'e.g. the earliest time_valid to be backfilled ' \
+                        '(default: the current month).')
+    parser.add_argument('--refresh-latest-views', action='store_true', help=
+                        'Refresh the latest values materialized views ' \
+                        '(newest expt_metrics row per natural key).')
+    parser.add_argument('--log-level', type=str, default=None, help='Log ' \
+                        'level for all score_db modules (default: ' \
+                        f'${log_utils.LOG_LEVEL_ENV} or WARNING).')
+    parser.add_argument('--log-levels', type=str, default=None, help='Per ' \
+                        'module log levels, e.g. \'expt_metrics=DEBUG,' \
+                        'regions=INFO\' (default: ' \
+                        f'${log_utils.MODULE_LOG_LEVELS_ENV}).')
 
     # Get the configuation file
     args = parser.parse_args()
+    log_utils.configure_logging(args.log_level, args.log_levels)
+    if args.partition_by is not None and not args.init_schema:
+        parser.error('--partition-by can only be used with --init-schema')
+    start = None
+    if args.start is not None:
+        if not (args.init_schema or args.create_partitions):
+            parser.error('--start can only be used with --init-schema or ' \
+                         '--create-partitions')
+        try:
+            start = datetime.strptime(args.start, '%Y-%m-%d')
+        except ValueError:
+            parser.error(f'invalid --start: \'{args.start}\', expected ' \
+                         'YYYY-MM-DD')
+    if args.init_schema or args.add_natural_keys or args.add_indexes or \
+        args.create_partitions or args.refresh_latest_views:
+        # imported here so plain requests don't pay for the model imports
+        import score_db.score_table_models as stm
+        if args.init_schema:
+            stm.init_schema(
+                partitioning=args.partition_by, partition_start=start)
+        if args.add_natural_keys:
+            stm.add_natural_keys()
+        if args.add_indexes:
+            stm.add_indexes(concurrently=args.concurrently)
+        if args.create_partitions:
+            months_ahead = args.months_ahead
+            if months_ahead is None:
+                months_ahead = stm.DEFAULT_MONTHS_AHEAD
+            stm.create_partitions(months_ahead=months_ahead, start=start)
+        if args.refresh_latest_views:
+            stm.refresh_latest_views()
+        if args.request_yaml is None:
+            return None
+
     request_yaml = args.request_yaml
+    if request_yaml is None:
+        parser.error('a request yaml file is required unless ' \
+                     '--init-schema, --add-natural-keys, --add-indexes, ' \
+                     '--create-partitions or --refresh-latest-views is given')
 
     file_utils.is_valid_readable_file(request_yaml)
 
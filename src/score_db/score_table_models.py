@@ -6,10 +6,11 @@ Collection of methods to facilitate file/object retrieval
 
 """
 import enum
-import os
-from dotenv import load_dotenv
+import threading
+import weakref
+from contextlib import asynccontextmanager, contextmanager
 import sqlalchemy as sa
-from datetime import datetime
+from datetime import datetime, timedelta
 from sqlalchemy import create_engine
 from sqlalchemy import Table, Column, MetaData, ForeignKey
 from sqlalchemy import Integer, String, Boolean, DateTime, Float, BigInteger
@@ -17,13 +18,17 @@ from sqlalchemy import Integer, String, Boolean, DateTime, Float, BigInteger
 from sqlalchemy.dialects.postgresql import JSON
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.dialects.postgresql import ARRAY
-from sqlalchemy import inspect, UniqueConstraint
+from sqlalchemy import inspect, UniqueConstraint, Index, PrimaryKeyConstraint
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy_utils import database_exists, create_database
 from sqlalchemy.dialects import postgresql
-from geoalchemy2.types import Geography, Geometry
+from sqlalchemy.schema import CreateIndex
+
+from score_db import db_connection
+from score_db import log_utils
+
+logger = log_utils.get_logger(__name__)
 
 EXPERIMENTS_TABLE = 'experiments'
 EXPERIMENT_METRICS_TABLE = 'expt_metrics'
@@ -36,39 +41,35 @@ EXPT_ARRAY_METRICS_TABLE = 'expt_array_metrics'
 ARRAY_METRIC_TYPES_TABLE = 'array_metric_types'
 SAT_META_TABLE = 'sat_meta'
 INSTRUMENT_META_TABLE = 'instrument_meta'
+EXPT_METRICS_LATEST_VIEW = 'expt_metrics_latest'
 
+# refresh the latest values views after every harvest batch (default: on)
+REFRESH_LATEST_VIEWS_ENV = 'SCORE_DB_REFRESH_LATEST_VIEWS'
 
-# temporary use dotenv to load the db environment
-load_dotenv()
-
-def get_engine(user, passwd, host, port, db):
-    url = f'postgresql://{user}:{passwd}@{host}:{port}/{db}'
-    if not database_exists(url):
-        create_database(url)
 
-    db_engine = create_engine(
-        url,
-        pool_size=50,
-        echo=False,
-        connect_args={"options": "-c timezone=utc"}
-    )
+Base = declarative_base()
 
-    return db_engine
 
+def get_server_utcnow():
+    """
+    The database clock (in UTC) as a column value.  The fact tables stamp
+    created_at with it when a row is written (inserted or upserted), so the
+    stamps of every writer come from the same clock, see
+    db_utils.get_since_watermark.
+    """
+    return sa.func.timezone('utc', sa.func.clock_timestamp())
 
-def get_engine_from_settings():
 
-    return get_engine(
-        os.getenv('SCORE_POSTGRESQL_DB_USERNAME'),
-        os.getenv('SCORE_POSTGRESQL_DB_PASSWORD'),
-        os.getenv('SCORE_POSTGRESQL_DB_ENDPOINT'),
-        os.getenv('SCORE_POSTGRESQL_DB_PORT'),
-        os.getenv('SCORE_POSTGRESQL_DB_NAME'))
+SERVER_UTCNOW = 'timezone(\'utc\', clock_timestamp())'
 
 
-engine = get_engine_from_settings()
-Base = declarative_base()
-Session = sessionmaker(bind=engine)
+def get_engine_from_settings():
+    """
+    Return the process-wide engine (see db_connection.py).  The engine and
+    its connection pool are created on the first call and reused by every
+    subsequent call.
+    """
+    return db_connection.get_engine()
 
 
 class Platforms(enum.Enum):
@@ -121,7 +122,11 @@ class ExperimentMetric(Base):
     time_valid = Column(DateTime, nullable=False)
     forecast_hour = Column(Float)
     ensemble_member = Column(Integer)
-    created_at = Column(DateTime, default=datetime.utcnow())
+    created_at = Column(
+        DateTime,
+        default=get_server_utcnow(),
+        server_default=sa.text(SERVER_UTCNOW)
+    )
 
     experiment = relationship('Experiment', back_populates='metrics')
     metric_type = relationship('MetricType', back_populates='metrics')
@@ -208,7 +213,11 @@ class ExptStoredFileCount(Base):
     time_valid = Column(DateTime)
     forecast_hour = Column(Float)
     file_size_bytes = Column(BigInteger)
-    created_at = Column(DateTime, default=datetime.utcnow())
+    created_at = Column(
+        DateTime,
+        default=get_server_utcnow(),
+        server_default=sa.text(SERVER_UTCNOW)
+    )
 
     experiment = relationship('Experiment', back_populates='file_counts')
     file_type = relationship('FileType', back_populates='file_counts')
@@ -247,7 +256,11 @@ class ExptArrayMetric(Base):
     time_valid = Column(DateTime)
     forecast_hour = Column(Float)
     ensemble_member = Column(Integer)
-    created_at = Column(DateTime, default=datetime.utcnow())
+    created_at = Column(
+        DateTime,
+        default=get_server_utcnow(),
+        server_default=sa.text(SERVER_UTCNOW)
+    )
 
     experiment = relationship('Experiment', back_populates='array_metrics')
     array_metric_type = relationship('ArrayMetricType', back_populates='array_metrics')
@@ -327,12 +340,861 @@ class InstrumentMeta(Base):
     array_metric_type = relationship('ArrayMetricType', back_populates='instrument_meta')
 
 
+# Natural keys of the fact tables.  Each key is backed by a unique index
+# and the handlers write with 'INSERT ... ON CONFLICT DO UPDATE' on it, so
+# re-harvesting the same data updates the existing rows instead of adding
+# duplicates.  Nullable key columns are coalesced to a sentinel (a unique
+# index treats NULLs as distinct).
+NULL_KEY_SENTINELS = {
+    Float: sa.literal_column("'NaN'::float8"),
+    Integer: sa.literal_column('-1'),
+    String: sa.literal_column("''"),
+    DateTime: sa.literal_column("'-infinity'::timestamp"),
+}
+
+
+def get_null_key_sentinel(column):
+    for column_type, sentinel in NULL_KEY_SENTINELS.items():
+        if isinstance(column.type, column_type):
+            return sentinel
+    msg = f'No null key sentinel for column \'{column.name}\' of type ' \
+        f'\'{column.type}\''
+    raise TypeError(msg)
+
+
+def get_natural_key(table, column_names, nullable_column_names):
+    """
+    Returns the natural key of 'table' as a list of column expressions
+    (the unique index elements and the ON CONFLICT target)
+    """
+    key = []
+    for name in column_names:
+        column = table.c[name]
+        if name in nullable_column_names:
+            column = sa.func.coalesce(column, get_null_key_sentinel(column))
+        key.append(column)
+    return key
+
+
+EXPT_METRICS_KEY_COLUMNS = [
+    'experiment_id',
+    'metric_type_id',
+    'region_id',
+    'elevation',
+    'elevation_unit',
+    'time_valid',
+    'forecast_hour',
+    'ensemble_member',
+]
+EXPT_METRICS_NATURAL_KEY = get_natural_key(
+    ExperimentMetric.__table__,
+    EXPT_METRICS_KEY_COLUMNS,
+    ['elevation', 'elevation_unit', 'forecast_hour', 'ensemble_member']
+)
+
+EXPT_ARRAY_METRICS_KEY_COLUMNS = [
+    'experiment_id',
+    'array_metric_type_id',
+    'region_id',
+    'sat_meta_id',
+    'time_valid',
+    'forecast_hour',
+    'ensemble_member',
+]
+EXPT_ARRAY_METRICS_NATURAL_KEY = get_natural_key(
+    ExptArrayMetric.__table__,
+    EXPT_ARRAY_METRICS_KEY_COLUMNS,
+    ['sat_meta_id', 'time_valid', 'forecast_hour', 'ensemble_member']
+)
+
+EXPT_FILE_COUNTS_KEY_COLUMNS = [
+    'experiment_id',
+    'file_type_id',
+    'storage_location_id',
+    'folder_path',
+    'cycle',
+    'time_valid',
+    'forecast_hour',
+]
+EXPT_FILE_COUNTS_NATURAL_KEY = get_natural_key(
+    ExptStoredFileCount.__table__,
+    EXPT_FILE_COUNTS_KEY_COLUMNS,
+    ['folder_path', 'cycle', 'time_valid', 'forecast_hour']
+)
+
+NATURAL_KEY_INDEXES = [
+    Index(
+        'unique_expt_metric', *EXPT_METRICS_NATURAL_KEY, unique=True),
+    Index(
+        'unique_expt_array_metric', *EXPT_ARRAY_METRICS_NATURAL_KEY,
+        unique=True),
+    Index(
+        'unique_expt_stored_file_count', *EXPT_FILE_COUNTS_NATURAL_KEY,
+        unique=True),
+]
+NATURAL_KEY_INDEX_NAMES = {
+    index.table.name: index.name for index in NATURAL_KEY_INDEXES}
+
+
+# Secondary indexes of the fact tables.  The btree indexes follow the
+# filters the GET handlers build (experiment, metric type, region and a
+# time_valid range) and the (time_valid, id) keyset pagination order.  The
+# BRIN indexes are tiny and serve time range scans of the append-mostly
+# time_valid and created_at columns.
+def get_brin_index(table, column_name):
+    return Index(
+        f'brin_{table.name}_{column_name}',
+        table.c[column_name],
+        postgresql_using='brin'
+    )
+
+
+SECONDARY_INDEXES = [
+    Index(
+        'ix_expt_metrics_expt_metric_region_time',
+        ExperimentMetric.experiment_id,
+        ExperimentMetric.metric_type_id,
+        ExperimentMetric.region_id,
+        ExperimentMetric.time_valid
+    ),
+    Index(
+        'ix_expt_metrics_time_valid_id',
+        ExperimentMetric.time_valid,
+        ExperimentMetric.id
+    ),
+    get_brin_index(ExperimentMetric.__table__, 'time_valid'),
+    get_brin_index(ExperimentMetric.__table__, 'created_at'),
+    Index(
+        'ix_expt_array_metrics_expt_metric_region_time',
+        ExptArrayMetric.experiment_id,
+        ExptArrayMetric.array_metric_type_id,
+        ExptArrayMetric.region_id,
+        ExptArrayMetric.time_valid
+    ),
+    Index(
+        'ix_expt_array_metrics_time_valid_id',
+        ExptArrayMetric.time_valid,
+        ExptArrayMetric.id
+    ),
+    get_brin_index(ExptArrayMetric.__table__, 'time_valid'),
+    get_brin_index(ExptArrayMetric.__table__, 'created_at'),
+    Index(
+        'ix_expt_stored_file_counts_expt_time',
+        ExptStoredFileCount.experiment_id,
+        ExptStoredFileCount.time_valid
+    ),
+    get_brin_index(ExptStoredFileCount.__table__, 'time_valid'),
+    get_brin_index(ExptStoredFileCount.__table__, 'created_at'),
+]
+
+
+# Optional declarative partitioning of the largest fact tables.  A
+# partitioned table is created by init_schema (it can't be converted in
+# place) and is partitioned by time_valid range (monthly partitions) or by
+# experiment_id list (one partition per experiment) or hash.  PostgreSQL
+# requires the partition key in the primary key and in every unique index,
+# the range key is therefore only available for expt_metrics (time_valid
+# is nullable and coalesced in the expt_array_metrics natural key).
+PARTITION_BY_RANGE = 'range'
+PARTITION_BY_LIST = 'list'
+PARTITION_BY_HASH = 'hash'
+
+PARTITION_KEYS = {
+    PARTITION_BY_RANGE: 'time_valid',
+    PARTITION_BY_LIST: 'experiment_id',
+    PARTITION_BY_HASH: 'experiment_id',
+}
+
+PARTITION_STRATEGIES = {
+    EXPERIMENT_METRICS_TABLE: [
+        PARTITION_BY_RANGE, PARTITION_BY_LIST, PARTITION_BY_HASH],
+    EXPT_ARRAY_METRICS_TABLE: [PARTITION_BY_LIST, PARTITION_BY_HASH],
+}
+
+DEFAULT_HASH_PARTITIONS = 8
+DEFAULT_MONTHS_AHEAD = 3
+
+# pg_partitioned_table.partstrat values
+PG_PARTITION_STRATEGIES = {
+    'r': PARTITION_BY_RANGE,
+    'l': PARTITION_BY_LIST,
+    'h': PARTITION_BY_HASH,
+}
+
+
+def parse_partitioning(partitioning):
+    """
+    Parse and validate a 'table=strategy,table=strategy' str (or dict),
+    e.g. 'expt_metrics=range,expt_array_metrics=hash'
+    """
+    if partitioning is None:
+        return {}
+
+    if isinstance(partitioning, str):
+        items = [
+            item.split('=') for item in partitioning.split(',')
+            if item.strip() != ''
+        ]
+        if any(len(item) != 2 for item in items):
+            msg = f'Invalid partitioning: \'{partitioning}\', expected ' \
+                'table=strategy'
+            raise ValueError(msg)
+        partitioning = {
+            table.strip(): strategy.strip().lower()
+            for table, strategy in items
+        }
+
+    for table_name, strategy in partitioning.items():
+        if strategy not in PARTITION_STRATEGIES.get(table_name, []):
+            msg = f'Table \'{table_name}\' can not be partitioned by ' \
+                f'\'{strategy}\', partitionable tables: ' \
+                f'{PARTITION_STRATEGIES}'
+            raise ValueError(msg)
+
+    return partitioning
+
+
+def get_partitioned_tables(partitioning):
+    """
+    Returns partitioned copies of the tables in 'partitioning' (a dict of
+    table names and strategies).  The copies live in their own MetaData
+    so the mapped tables (and their primary keys) are left unchanged.
+    """
+    metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        table.to_metadata(metadata)
+
+    tables = []
+    for table_name, strategy in parse_partitioning(partitioning).items():
+        table = metadata.tables[table_name]
+        key_column = table.c[PARTITION_KEYS[strategy]]
+        key_column.primary_key = True
+        key_column.nullable = False
+        table.append_constraint(PrimaryKeyConstraint(table.c.id, key_column))
+        table.dialect_options['postgresql']['partition_by'] = \
+            f'{strategy.upper()} ({key_column.name})'
+        tables.append(table)
+
+    return tables
+
+
+def get_month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def get_next_month(value):
+    return get_month_start(get_month_start(value) + timedelta(days=32))
+
+
+def get_range_partition(table_name, month):
+    """ (name, bounds, row condition) of the partition holding 'month' """
+    month = get_month_start(month)
+    start = f'{month:%Y-%m-%d}'
+    end = f'{get_next_month(month):%Y-%m-%d}'
+    return (
+        f'{table_name}_y{month:%Y}m{month:%m}',
+        f'FROM (\'{start}\') TO (\'{end}\')',
+        f'time_valid >= \'{start}\' AND time_valid < \'{end}\''
+    )
+
+
+def get_list_partition(table_name, experiment_id):
+    """ (name, bounds, row condition) of an experiment's partition """
+    experiment_id = int(experiment_id)
+    return (
+        f'{table_name}_expt_{experiment_id}',
+        f'IN ({experiment_id})',
+        f'experiment_id = {experiment_id}'
+    )
+
+
+def get_partition_statement(table_name, partition):
+    name, bounds, _ = partition
+    return f'CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table_name} ' \
+        f'FOR VALUES {bounds}'
+
+
+def get_move_partition_statements(table_name, partition):
+    """
+    Statements creating 'partition' from the rows of the default partition
+    in its range (a partition can't be created while the default partition
+    holds rows of its range): the rows are moved to a new table which is
+    then attached as the partition.
+    """
+    name, bounds, condition = partition
+    default_name = f'{table_name}_default'
+    return [
+        f'CREATE TABLE {name} (LIKE {table_name} INCLUDING DEFAULTS ' \
+        'INCLUDING CONSTRAINTS)',
+        f'INSERT INTO {name} SELECT * FROM {default_name} WHERE {condition}',
+        f'DELETE FROM {default_name} WHERE {condition}',
+        f'ALTER TABLE {table_name} ATTACH PARTITION {name} FOR VALUES {bounds}'
+    ]
+
+
+def get_range_partition_statement(table_name, month):
+    return get_partition_statement(
+        table_name, get_range_partition(table_name, month))
+
+
+def get_list_partition_statement(table_name, experiment_id):
+    return get_partition_statement(
+        table_name, get_list_partition(table_name, experiment_id))
+
+
+def get_hash_partition_statements(table_name, modulus):
+    return [
+        f'CREATE TABLE IF NOT EXISTS {table_name}_hash_{remainder} ' \
+        f'PARTITION OF {table_name} FOR VALUES WITH ' \
+        f'(MODULUS {modulus}, REMAINDER {remainder})'
+        for remainder in range(modulus)
+    ]
+
+
+def get_default_partition_statement(table_name):
+    return f'CREATE TABLE IF NOT EXISTS {table_name}_default ' \
+        f'PARTITION OF {table_name} DEFAULT'
+
+
+def get_partition_strategy(connection, table_name):
+    """ returns the partition strategy of an existing table (or None) """
+    strategy = connection.execute(sa.text(
+        'SELECT partstrat FROM pg_partitioned_table '
+        'WHERE partrelid = to_regclass(:table_name)'
+    ), {'table_name': table_name}).scalar()
+    return PG_PARTITION_STRATEGIES.get(strategy)
+
+
+def create_partitioned_tables(
+    connection, partitioning, hash_partitions=DEFAULT_HASH_PARTITIONS
+):
+    """
+    Create the partitioned tables in 'partitioning' (unless they exist)
+    with their initial partitions.  Range and list partitioned tables get a
+    DEFAULT partition for rows outside the created partitions, see
+    create_partitions for their monthly or per experiment partitions.
+    """
+    for table in get_partitioned_tables(partitioning):
+        if inspect(connection).has_table(table.name):
+            continue
+        table.create(connection)
+
+        strategy = parse_partitioning(partitioning)[table.name]
+        if strategy == PARTITION_BY_HASH:
+            statements = get_hash_partition_statements(
+                table.name, hash_partitions)
+        else:
+            statements = [get_default_partition_statement(table.name)]
+        for statement in statements:
+            connection.execute(sa.text(statement))
+
+
+class PartitionError(Exception):
+    def __init__(self, m):
+        self.message = m
+    def __str__(self):
+        return self.message
+
+
+def get_months(start, last_month):
+    months = []
+    month = get_month_start(start)
+    while month <= last_month:
+        months.append(month)
+        month = get_next_month(month)
+    return months
+
+
+def create_table_partitions(connection, table_name, months_ahead, start):
+    """
+    Create the missing partitions of one partitioned table (see
+    create_partitions), returns the created partition names
+    """
+    strategy = get_partition_strategy(connection, table_name)
+    default_name = f'{table_name}_default'
+    has_default = connection.execute(sa.text(
+        'SELECT to_regclass(:name) IS NOT NULL'
+    ), {'name': default_name}).scalar()
+
+    now = datetime.utcnow()
+    partitions = []
+    if strategy == PARTITION_BY_RANGE:
+        if start is None:
+            # rows outside the existing months wait in the default
+            # partition, their months are created from the earliest one
+            start = now
+            if has_default:
+                earliest = connection.execute(sa.text(
+                    f'SELECT min(time_valid) FROM {default_name}'
+                )).scalar()
+                if earliest is not None and earliest < start:
+                    start = earliest
+        last_month = get_month_start(now)
+        for _ in range(months_ahead):
+            last_month = get_next_month(last_month)
+        partitions = [
+            get_range_partition(table_name, month)
+            for month in get_months(start, last_month)
+        ]
+    elif strategy == PARTITION_BY_LIST:
+        experiment_ids = connection.execute(sa.text(
+            f'SELECT id FROM {EXPERIMENTS_TABLE} ORDER BY id'
+        )).scalars().all()
+        partitions = [
+            get_list_partition(table_name, experiment_id)
+            for experiment_id in experiment_ids
+        ]
+
+    created = []
+    for partition in partitions:
+        name, _, condition = partition
+        exists = connection.execute(sa.text(
+            'SELECT to_regclass(:name) IS NOT NULL'
+        ), {'name': name}).scalar()
+        if exists:
+            continue
+
+        statements = [get_partition_statement(table_name, partition)]
+        if has_default and connection.execute(sa.text(
+            f'SELECT EXISTS (SELECT 1 FROM {default_name} WHERE {condition})'
+        )).scalar():
+            statements = get_move_partition_statements(table_name, partition)
+        for statement in statements:
+            connection.execute(sa.text(statement))
+        created.append(name)
+
+    return created
 
 
-Base.metadata.create_all(engine)
+def create_partitions(
+    engine=None, months_ahead=DEFAULT_MONTHS_AHEAD, start=None
+):
+    """
+    Create the missing partitions of the partitioned fact tables, meant to
+    be run periodically (e.g. from cron):
+
+        $ python src/score_db/score_db_base.py --create-partitions
+
+    Range partitioned tables get monthly partitions from 'start' (default:
+    the current month, or the earliest month held by the default
+    partition) through 'months_ahead' months from now, list partitioned
+    tables one partition per registered experiment.  Rows of the default
+    partition are moved into the partitions created for them.  Hash
+    partitions are all created with the table.  Every table is handled in
+    its own transaction, a table which fails does not roll back the
+    partitions of the others (a PartitionError naming the failed tables
+    is raised once all tables were tried).
+    """
+    if engine is None:
+        engine = get_engine_from_settings()
+
+    failed = {}
+    for table_name in PARTITION_STRATEGIES:
+        try:
+            with engine.begin() as connection:
+                created = create_table_partitions(
+                    connection, table_name, months_ahead, start)
+        except Exception as err:
+            logger.error(
+                'creating the partitions of %s failed: %s', table_name, err)
+            failed[table_name] = err
+            continue
+        if len(created) > 0:
+            logger.info('created partitions of %s: %s', table_name, created)
+
+    if len(failed) > 0:
+        msg = 'Failed to create the partitions of tables: ' \
+            f'{list(failed.keys())}, errors: ' \
+            f'{[str(err) for err in failed.values()]}'
+        raise PartitionError(msg)
+
+    return engine
+
+
+# Materialized view of the newest expt_metrics row of each natural key
+# (by created_at, then id), i.e. what a 'latest_only' GET selects, kept in
+# its own MetaData so create_all leaves it alone.  The view is created by
+# init_schema and refreshed with REFRESH MATERIALIZED VIEW CONCURRENTLY
+# (readers are never blocked), which requires its unique index on id.
+latest_views_metadata = MetaData()
+
+EXPT_METRICS_LATEST_TABLE = Table(
+    EXPT_METRICS_LATEST_VIEW,
+    latest_views_metadata,
+    *[
+        Column(column.name, column.type, primary_key=column.primary_key)
+        for column in ExperimentMetric.__table__.columns
+    ]
+)
+
+LATEST_VIEW_INDEXES = [
+    Index(
+        f'ux_{EXPT_METRICS_LATEST_VIEW}_id',
+        EXPT_METRICS_LATEST_TABLE.c.id,
+        unique=True
+    ),
+    Index(
+        f'ix_{EXPT_METRICS_LATEST_VIEW}_expt_metric_region_time',
+        EXPT_METRICS_LATEST_TABLE.c.experiment_id,
+        EXPT_METRICS_LATEST_TABLE.c.metric_type_id,
+        EXPT_METRICS_LATEST_TABLE.c.region_id,
+        EXPT_METRICS_LATEST_TABLE.c.time_valid
+    ),
+    Index(
+        f'ix_{EXPT_METRICS_LATEST_VIEW}_time_valid_id',
+        EXPT_METRICS_LATEST_TABLE.c.time_valid,
+        EXPT_METRICS_LATEST_TABLE.c.id
+    ),
+]
+
+
+def get_latest_view_statement(table, natural_key, view_name):
+    """ CREATE MATERIALIZED VIEW statement of the newest row per key """
+    query = sa.select(table).distinct(
+        *natural_key
+    ).order_by(
+        *natural_key,
+        table.c.created_at.desc().nullslast(),
+        table.c.id.desc()
+    )
+    # the null key sentinels are rendered inline, DDL can't be bound
+    query = str(query.compile(
+        dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+    return f'CREATE MATERIALIZED VIEW IF NOT EXISTS {view_name} AS {query}'
+
+
+def create_latest_views(connection):
+    connection.execute(sa.text(get_latest_view_statement(
+        ExperimentMetric.__table__,
+        EXPT_METRICS_NATURAL_KEY,
+        EXPT_METRICS_LATEST_VIEW
+    )))
+    for index in LATEST_VIEW_INDEXES:
+        connection.execute(sa.text(get_create_index_statement(index)))
+
+
+def refresh_latest_views(engine=None, concurrently=True):
+    """
+    Refresh the latest values views which exist, e.g. after a harvest
+    batch (see expt_metrics.refresh_latest_values) or from the command line:
+
+        $ python src/score_db/score_db_base.py --refresh-latest-views
+
+    A concurrent refresh does not lock out readers of the view, it diffs
+    the new contents against the old ones so a plain refresh is faster
+    when most of the view has changed.  Returns the refreshed view names.
+    """
+    if engine is None:
+        engine = get_engine_from_settings()
+
+    refreshed = []
+    option = 'CONCURRENTLY ' if concurrently else ''
+    with engine.begin() as connection:
+        for view_name in [EXPT_METRICS_LATEST_VIEW]:
+            exists = connection.execute(sa.text(
+                'SELECT to_regclass(:view_name) IS NOT NULL'
+            ), {'view_name': view_name}).scalar()
+            if not exists:
+                continue
+            connection.execute(sa.text(
+                f'REFRESH MATERIALIZED VIEW {option}{view_name}'))
+            refreshed.append(view_name)
+
+    return refreshed
+
+
+_schema_initialized = False
+
+
+def init_schema(engine=None, partitioning=None, partition_start=None):
+    """
+    Create the score-db database (if it does not exist) and any missing
+    tables and views.  Importing this module does no database I/O, so this
+    must be run explicitly once per database, e.g.:
+
+        $ python src/score_db/score_db_base.py --init-schema
+
+    or opted into for every process by setting SCORE_DB_AUTO_INIT_SCHEMA.
+    'partitioning' (e.g. 'expt_metrics=range') creates the listed fact
+    tables as partitioned tables, see create_partitioned_tables, and
+    their partitions (range partitions from the 'partition_start' month
+    so data backfilled later does not pile up in the default partition),
+    see create_partitions.
+    """
+    # sqlalchemy_utils is only needed here, keep it off the import path
+    from sqlalchemy_utils import database_exists, create_database
+
+    global _schema_initialized
+    if engine is None:
+        engine = get_engine_from_settings()
+
+    if not database_exists(engine.url):
+        create_database(engine.url)
+
+    partitioning = parse_partitioning(partitioning)
+    if len(partitioning) > 0:
+        with engine.begin() as connection:
+            Base.metadata.create_all(connection, tables=[
+                table for table in Base.metadata.sorted_tables
+                if table.name not in partitioning
+            ])
+            create_partitioned_tables(connection, partitioning)
+
+    Base.metadata.create_all(engine)
+    if len(partitioning) > 0:
+        create_partitions(engine, start=partition_start)
+    with engine.begin() as connection:
+        create_latest_views(connection)
+    _schema_initialized = True
+    return engine
+
+
+def get_delete_duplicates_statement(index):
+    """ DELETE statement of all but the newest row of each key of 'index' """
+    table = index.table
+    key = ', '.join(
+        str(expression.compile(dialect=postgresql.dialect()))
+        for expression in index.expressions
+    )
+    return f'DELETE FROM {table.name} WHERE id IN (' \
+        f'SELECT id FROM (SELECT id, row_number() OVER (' \
+        f'PARTITION BY {key} ORDER BY created_at DESC NULLS LAST, ' \
+        f'id DESC) AS row_num FROM {table.name}) AS ranked ' \
+        f'WHERE row_num > 1)'
+
+
+def add_natural_keys(engine=None, concurrently=True):
+    """
+    Add the natural key unique indexes to fact tables created before the
+    keys existed (create_all only indexes new tables).  Duplicate rows are
+    deleted first, each table in its own transaction, keeping the newest
+    row of each key (latest created_at, then highest id, the row
+    get_latest_records_filter and the latest values view keep).  The
+    indexes are then built like add_indexes builds the secondary indexes,
+    concurrently by default so readers and writers aren't blocked for the
+    length of the build (see add_indexes for a failed concurrent build).
+    Until a table's key exists its upserts raise NaturalKeyError and its
+    GETs drop duplicates on the server, see has_natural_key.
+    """
+    if engine is None:
+        engine = get_engine_from_settings()
+
+    for index in NATURAL_KEY_INDEXES:
+        with engine.begin() as connection:
+            connection.execute(sa.text(
+                get_delete_duplicates_statement(index)))
+
+    create_indexes(engine, NATURAL_KEY_INDEXES, concurrently)
+    _natural_key_indexes.pop(engine, None)
+    return engine
+
+
+class NaturalKeyError(Exception):
+    def __init__(self, m):
+        self.message = m
+    def __str__(self):
+        return self.message
+
+
+# engine -> names of the valid natural key indexes of its database
+_natural_key_indexes = weakref.WeakKeyDictionary()
+_natural_key_lock = threading.Lock()
+
+
+def get_natural_key_indexes(session):
+    """
+    Names of the natural key unique indexes which exist (and are valid) in
+    the database 'session' is bound to.  pg_indexes is only read once per
+    engine, a process started before add_natural_keys ran elsewhere keeps
+    the old answer until it is restarted.
+    """
+    engine = session.get_bind().engine
+    index_names = _natural_key_indexes.get(engine)
+    if index_names is not None:
+        return index_names
+
+    # an interrupted concurrent build leaves an INVALID index behind, it
+    # can't serve as an ON CONFLICT arbiter
+    statement = sa.text(
+        'SELECT indexname FROM pg_indexes JOIN pg_index ON '
+        'pg_index.indexrelid = '
+        'format(\'%I.%I\', schemaname, indexname)::regclass '
+        'WHERE indexname IN :index_names AND pg_index.indisvalid'
+    ).bindparams(sa.bindparam('index_names', expanding=True))
+    index_names = frozenset(session.execute(statement, {
+        'index_names': [index.name for index in NATURAL_KEY_INDEXES]
+    }).scalars())
+    with _natural_key_lock:
+        _natural_key_indexes[engine] = index_names
+
+    return index_names
+
+
+def has_natural_key(session, table_name):
+    """
+    Whether the natural key unique index of fact table 'table_name' exists
+    in the database 'session' is bound to.  Databases created before the
+    keys existed may hold duplicate rows (and can't be upserted into)
+    until add_natural_keys has been run.
+    """
+    return NATURAL_KEY_INDEX_NAMES[table_name] in \
+        get_natural_key_indexes(session)
+
+
+def check_natural_key(session, table_name):
+    """ raise a NaturalKeyError if 'table_name' can't be upserted into """
+    if not has_natural_key(session, table_name):
+        msg = f'Table \'{table_name}\' has no natural key unique index ' \
+            f'\'{NATURAL_KEY_INDEX_NAMES[table_name]}\' (created before ' \
+            'the key existed), run \'python src/score_db/score_db_base.py ' \
+            '--add-natural-keys\' to add it.'
+        raise NaturalKeyError(msg)
+
+
+def get_create_index_statement(index, concurrently=False):
+    statement = str(CreateIndex(index, if_not_exists=True).compile(
+        dialect=postgresql.dialect()))
+    if concurrently:
+        statement = statement.replace('INDEX', 'INDEX CONCURRENTLY', 1)
+    return statement
+
+
+def create_indexes(engine, indexes, concurrently=False):
+    """
+    Build 'indexes' if they don't exist, with 'concurrently' every index
+    (except those of partitioned tables) is built with CREATE INDEX
+    CONCURRENTLY.  Every statement is run in autocommit mode.
+    """
+    with engine.connect().execution_options(
+        isolation_level='AUTOCOMMIT') as connection:
+        for index in indexes:
+            partitioned = get_partition_strategy(
+                connection, index.table.name) is not None
+            connection.execute(sa.text(get_create_index_statement(
+                index, concurrently and not partitioned)))
+
+
+def add_indexes(engine=None, concurrently=False):
+    """
+    Add the secondary indexes to fact tables created before the indexes
+    existed (create_all only indexes new tables).  With 'concurrently' the
+    indexes are built with CREATE INDEX CONCURRENTLY, which does not block
+    writes to a production database but can't run inside a transaction,
+    so every statement is run in autocommit mode.  A failed concurrent
+    build leaves an INVALID index behind which must be dropped before
+    retrying.  Partitioned tables don't support concurrent index builds,
+    their indexes are always built normally.
+    """
+    if engine is None:
+        engine = get_engine_from_settings()
+
+    create_indexes(engine, SECONDARY_INDEXES, concurrently)
+    return engine
+
+
+def get_connection_manager():
+    manager = db_connection.get_connection_manager()
+    if not _schema_initialized and manager.settings.auto_init_schema:
+        init_schema(manager.get_engine())
+
+    return manager
+
 
 def get_session():
-    engine = get_engine_from_settings()
-    Session = sessionmaker(bind=engine)
+    return get_connection_manager().get_session()
+
+
+@contextmanager
+def session_scope():
+    """
+    Provide a transactional scope around a series of operations on the
+    primary database.  The session is committed if the block completes,
+    rolled back if it raises and always closed (returning its connection
+    to the pool), e.g.:
+
+        with stm.session_scope() as session:
+            rows = session.query(...).all()
+
+    A committed session counts as a write, the reads of this process then
+    stay on the primary for SCORE_DB_READ_YOUR_WRITES_SECONDS.
+    """
+    session = get_session()
+    try:
+        yield session
+        session.commit()
+        db_connection.mark_write()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def get_read_session():
+    return get_connection_manager().get_read_session()
+
+
+@contextmanager
+def read_session_scope():
+    """
+    session_scope for the GET handlers, the session reads from the read
+    replica if one is configured (unless the primary must be read, see
+    db_connection.read_from_primary), e.g.:
+
+        with stm.read_session_scope() as session:
+            rows = session.query(...).all()
+    """
+    session = get_read_session()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def get_async_session():
+    return get_connection_manager().get_async_session()
+
+
+def get_async_read_session():
+    return get_connection_manager().get_async_read_session()
+
+
+@asynccontextmanager
+async def async_session_scope():
+    """
+    Asyncio counterpart of session_scope, the session comes from the shared
+    async engine (see db_connection.py), e.g.:
+
+        async with stm.async_session_scope() as session:
+            rows = await session.run_sync(fetch_rows)
+    """
+    session = get_async_session()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
 
-    return Session()
+@asynccontextmanager
+async def async_read_session_scope():
+    """
+    Asyncio counterpart of read_session_scope, for the GET handlers'
+    submit_async.
+    """
+    session = get_async_read_session()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
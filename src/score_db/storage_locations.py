@@ -17,6 +17,9 @@ import score_db.score_table_models as stm
 from score_db.score_table_models import StorageLocation as sl
 from score_db import time_utils
 from score_db import db_utils
+from score_db import dimension_cache
+from score_db import log_utils
+from score_db import result_formats
 
 from pandas import DataFrame
 import sqlalchemy as db
@@ -26,6 +29,8 @@ from sqlalchemy import and_, or_, not_
 from sqlalchemy import asc, desc
 from sqlalchemy.sql import func
 
+logger = log_utils.get_logger(__name__)
+
 StorageLocationData = namedtuple(
     'StorageLocationData',
     [
@@ -48,7 +53,7 @@ class StorageLocation:
     storage_location_data: StorageLocationData = field(init=False)
 
     def __post_init__(self):
-        print(f'in post init name: {self.name}')
+        logger.debug('in post init name: %s', self.name)
         self.storage_location_data = StorageLocationData(
             self.name,
             self.bucket_name,
@@ -85,11 +90,11 @@ def get_string_filter(filters, cls, key, constructed_filter):
             f'type: {type(filters)}'
         raise TypeError(msg)
 
-    print(f'Column \'{key}\' is of type {type(getattr(cls, key).type)}.')
+    logger.debug('Column \'%s\' is of type %s.', key, type(getattr(cls, key).type))
     string_flt = filters.get(key)
 
     if string_flt is None:
-        print(f'No \'{key}\' filter detected')
+        logger.debug('No \'%s\' filter detected', key)
         return constructed_filter
 
     like_filter = string_flt.get('like')
@@ -141,6 +146,7 @@ class StorageLocationRequest:
     filters: dict = field(default_factory=dict, init=False)
     ordering: list = field(default_factory=list, init=False)
     record_limit: int = field(default_factory=int, init=False)
+    output_format: str = field(default=None, init=False)
     body: dict = field(default_factory=dict, init=False)
     storage_location: StorageLocation = field(init=False)
     storage_location_data: namedtuple = field(init=False)
@@ -149,6 +155,7 @@ class StorageLocationRequest:
     def __post_init__(self):
         self.method = db_utils.validate_method(self.request_dict.get('method'))
         self.params = self.request_dict.get('params')
+        self.output_format = result_formats.get_output_format(self.params)
 
         self.body = self.request_dict.get('body')
         if self.method == db_utils.HTTP_PUT:
@@ -158,9 +165,9 @@ class StorageLocationRequest:
                 self.storage_location_data._fields, self.storage_location_data
             ):
                 val = pprint.pformat(v, indent=4)
-                print(f'exp_data: k: {k}, v: {val}')
+                logger.debug('exp_data: k: %s, v: %s', k, val)
         else:
-            print(f'In StorageLocationRequest - params: {self.params}')
+            logger.debug('In StorageLocationRequest - params: %s', self.params)
             if isinstance(self.params, dict):
                 self.filters = construct_filters(self.params.get('filters'))
                 self.ordering = self.params.get('ordering')
@@ -192,12 +199,10 @@ class StorageLocationRequest:
             except Exception as err:
                 error_msg = 'Failed to insert storage location record -' \
                     f' err: {err}'
-                print(f'Submit PUT error: {error_msg}')
+                logger.error('Submit PUT error: %s', error_msg)
                 return self.failed_request(error_msg)
             
     def put_storage_location(self):
-        session = stm.get_session()
-
         insert_stmt = insert(sl).values(
             name=self.storage_location_data.name,
             bucket_name=self.storage_location_data.bucket_name,
@@ -207,7 +212,7 @@ class StorageLocationRequest:
             created_at=datetime.utcnow(),
             updated_at=None
         ).returning(sl)
-        print(f'insert_stmt: {insert_stmt}')
+        logger.debug('insert_stmt: %s', insert_stmt)
 
         time_now = datetime.utcnow()
 
@@ -222,24 +227,26 @@ class StorageLocationRequest:
             )
         )
 
-        print(f'do_update_stmt: {do_update_stmt}')
+        logger.debug('do_update_stmt: %s', do_update_stmt)
 
-        try:
-            result = session.execute(do_update_stmt)
-            session.flush()
-            result_row = result.fetchone()
-            action = db_utils.INSERT
-            if result_row.updated_at is not None:
-                action = db_utils.UPDATE
-            session.commit()
-            session.close()
-        except Exception as err:
-            message = f'Attempt to {action} storage location record FAILED'
-            error_msg = f'Failed to insert/update record - err: {err}'
-            print(f'error_msg: {error_msg}')
-        else:
-            message = f'Attempt to {action} storage location record SUCCEEDED'
-            error_msg = None
+        with stm.session_scope() as session:
+            try:
+                result = session.execute(do_update_stmt)
+                session.flush()
+                result_row = result.fetchone()
+                action = db_utils.INSERT
+                if result_row.updated_at is not None:
+                    action = db_utils.UPDATE
+                session.commit()
+            except Exception as err:
+                session.rollback()
+                result_row = None
+                message = f'Attempt to {action} storage location record FAILED'
+                error_msg = f'Failed to insert/update record - err: {err}'
+                logger.error('error_msg: %s', error_msg)
+            else:
+                message = f'Attempt to {action} storage location record SUCCEEDED'
+                error_msg = None
         
         results = {}
         if result_row is not None:
@@ -247,6 +254,9 @@ class StorageLocationRequest:
             results['data'] = [result_row._mapping]
             results['id'] = result_row.id
 
+        # the next id lookup during ingest reloads the table
+        dimension_cache.invalidate(stm.STORAGE_LOCATION_TABLE)
+
         response = DbActionResponse(
             self.request_dict,
             (error_msg is None),
@@ -255,59 +265,58 @@ class StorageLocationRequest:
             error_msg
         )
 
-        print(f'response: {response}')
+        logger.debug('response: %s', response)
         return response
     
     def get_storage_locations(self):
-        session = stm.get_session()
-
-        q = session.query(
-            sl.id,
-            sl.name,
-            sl.bucket_name,
-            sl.platform,
-            sl.platform_region,
-            sl.key,
-            sl.created_at,
-            sl.updated_at
-        ).select_from(
-            sl
-        )
+        with stm.read_session_scope() as session:
+            q = session.query(
+                sl.id,
+                sl.name,
+                sl.bucket_name,
+                sl.platform,
+                sl.platform_region,
+                sl.key,
+                sl.created_at,
+                sl.updated_at
+            ).select_from(
+                sl
+            )
 
-        print('Before adding filters to storage locations request########################')
-        if self.filters is not None and len(self.filters) > 0:
-            for key, value in self.filters.items():
-                q = q.filter(value)
+            logger.debug('Before adding filters to storage locations request########################')
+            if self.filters is not None and len(self.filters) > 0:
+                for key, value in self.filters.items():
+                    q = q.filter(value)
         
-        print('After adding filters to storage location request########################')
+            logger.debug('After adding filters to storage location request########################')
         
-        # add column ordering
-        column_ordering = db_utils.build_column_ordering(sl, self.ordering)
-        if column_ordering is not None and len(column_ordering) > 0:
-            for ordering_item in column_ordering:
-                q = q.order_by(ordering_item)
+            # add column ordering
+            column_ordering = db_utils.build_column_ordering(sl, self.ordering)
+            if column_ordering is not None and len(column_ordering) > 0:
+                for ordering_item in column_ordering:
+                    q = q.order_by(ordering_item)
 
-        # limit number of returned records
-        if self.record_limit is not None and self.record_limit > 0:
-            q = q.limit(self.record_limit)
+            # limit number of returned records
+            if self.record_limit is not None and self.record_limit > 0:
+                q = q.limit(self.record_limit)
 
-        storage_locations = q.all()
+            storage_locations = q.all()
 
-        results = DataFrame()
+        results = None
         error_msg = None
         record_count = 0
         try:
             if len(storage_locations) > 0:
-                results = DataFrame(storage_locations, columns = storage_locations[0]._fields)
+                results = result_formats.format_records(
+                    storage_locations, storage_locations[0]._fields, self.output_format)
             
         except Exception as err:
             message = 'Request for storage location records FAILED'
             error_msg = f'Failed to get storage location records - err: {err}'
         else:
             message = 'Request for storage location records SUCCEEDED'
-            for idx, row in results.iterrows():
-                print(f'idx: {idx}, row: {row}')
-            record_count = len(results.index)
+            logger.debug('records: %s', results)
+            record_count = len(storage_locations)
         
         details = {}
         details['record_count'] = record_count
@@ -323,6 +332,6 @@ class StorageLocationRequest:
             error_msg
         )
 
-        print(f'response: {response}')
+        logger.debug('response: %s', response)
 
         return response
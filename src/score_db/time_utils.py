@@ -9,6 +9,10 @@ from datetime import datetime, timedelta, time, date
 from typing import Optional
 from dataclasses import dataclass
 
+from score_db import log_utils
+
+logger = log_utils.get_logger(__name__)
+
 
 SECONDS_IN_A_DAY = 24 * 3600
 
@@ -74,7 +78,7 @@ def get_time(value, datetime_format=None):
 def set_datetime(time_str, format_str):
     try:
         time = datetime.strptime(time_str, format_str)
-        print(f'in set_datetime - time: {time}, time_str: {time_str}, format_str: {format_str}')
+        logger.debug('in set_datetime - time: %s, time_str: %s, format_str: %s', time, time_str, format_str)
     except Exception as e:
         msg = f'Invalid time str: {time_str} or format string: {format_str}. {e}'
         raise ValueError(msg)
@@ -120,7 +124,7 @@ def get_date_range_from_dict(date_range):
               f'{DEFAULT_END_TIME}'
         raise ValueError(msg)
 
-    print(f'start: {start}, end: {end}')
+    logger.debug('start: %s, end: %s', start, end)
 
     if start > end:
         msg = f'Invalid date range: {date_range}, "start" must be older than ' \
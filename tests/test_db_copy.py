@@ -0,0 +1,191 @@
+"""
+Copyright 2024 NOAA
+All rights reserved.
+
+Unit tests for db_copy
+
+"""
+from datetime import datetime
+import struct
+
+import pandas as pd
+from pandas import DataFrame
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from score_db import db_copy
+import score_db.score_table_models as stm
+from score_db.score_table_models import ExperimentMetric
+from score_db.expt_metrics import EXPT_METRICS_COPY_COLUMNS
+
+# the PUT columns plus a created_at, the column the database stamps
+COPY_COLUMNS = EXPT_METRICS_COPY_COLUMNS + ['created_at']
+
+ROWS = [
+    (1, 2, 3, 0.0, 'kpa', 2.6, datetime(2015, 12, 2, 6), None, None,
+        datetime(2024, 1, 1)),
+    (1, 4, 5, 50.0, 'kpa', float('nan'), '2015-12-02 06:00:00', 24.0, 256,
+        datetime(2024, 1, 1)),
+]
+
+
+class FakeCursor:
+    def __init__(self):
+        self.copies = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def copy_expert(self, statement, buffer):
+        self.copies.append((statement, buffer.read()))
+
+
+class FakeConnection:
+    def __init__(self):
+        self.connection = self
+        self.fake_cursor = FakeCursor()
+
+    def cursor(self):
+        return self.fake_cursor
+
+
+class FakeSession:
+    def __init__(self):
+        self.fake_connection = FakeConnection()
+
+    def connection(self):
+        return self.fake_connection
+
+
+class UpsertSession(FakeSession):
+    def __init__(self):
+        super().__init__()
+        self.statements = []
+
+    def execute(self, statement):
+        self.statements.append(statement)
+
+
+def test_validate_copy_options():
+    assert db_copy.validate_copy_format(None) == db_copy.COPY_FORMAT_CSV
+    assert db_copy.validate_batch_size(None) == \
+        db_copy.DEFAULT_COPY_BATCH_SIZE
+
+    with pytest.raises(ValueError):
+        db_copy.validate_copy_format('parquet')
+
+    with pytest.raises(ValueError):
+        db_copy.validate_batch_size(0)
+
+
+def test_csv_buffer():
+    buffer = db_copy.to_csv_buffer(ROWS)
+    lines = buffer.read().splitlines()
+    assert lines[0] == \
+        '1,2,3,0.0,kpa,2.6,2015-12-02 06:00:00,\\N,\\N,2024-01-01 00:00:00'
+    # NaN values are loaded as NULL
+    assert lines[1].split(',')[5] == '\\N'
+
+
+def test_binary_buffer():
+    table = ExperimentMetric.__table__
+    encoders = [
+        db_copy.get_binary_encoder(table.columns[name])
+        for name in COPY_COLUMNS
+    ]
+    data = db_copy.to_binary_buffer(ROWS[:1], encoders).read()
+
+    assert data.startswith(db_copy.PGCOPY_HEADER)
+    assert data.endswith(db_copy.PGCOPY_TRAILER)
+
+    offset = len(db_copy.PGCOPY_HEADER)
+    assert struct.unpack_from('!h', data, offset)[0] == \
+        len(COPY_COLUMNS)
+    # experiment_id is an int4 field
+    assert struct.unpack_from('!ii', data, offset + 2) == (4, 1)
+
+    timestamp = db_copy.encode_timestamp(datetime(2000, 1, 2))
+    assert struct.unpack('!q', timestamp)[0] == 86400 * 1000000
+
+
+def test_copy_rows_batches():
+    session = FakeSession()
+    row_count = db_copy.copy_rows(
+        session,
+        ExperimentMetric.__table__,
+        COPY_COLUMNS,
+        iter(ROWS * 3),
+        batch_size=4
+    )
+
+    copies = session.fake_connection.fake_cursor.copies
+    assert row_count == 6
+    assert len(copies) == 2
+    assert copies[0][0].startswith(
+        'COPY expt_metrics (experiment_id, metric_type_id')
+    assert len(copies[0][1].splitlines()) == 4
+    assert len(copies[1][1].splitlines()) == 2
+
+
+def test_copy_frame():
+    frame = DataFrame(
+        [row[:-1] for row in ROWS], columns=COPY_COLUMNS[:-1])
+    frame['ensemble_member'] = frame['ensemble_member'].astype('Int64')
+    frame['time_valid'] = pd.to_datetime(frame['time_valid'])
+
+    session = FakeSession()
+    row_count = db_copy.copy_frame(
+        session, ExperimentMetric.__table__, frame, batch_size=1)
+
+    copies = session.fake_connection.fake_cursor.copies
+    assert row_count == 2
+    assert len(copies) == 2
+    assert copies[1][1] == \
+        '1,4,5,50.0,kpa,\\N,2015-12-02 06:00:00.000000,24.0,256\n'
+
+    session = FakeSession()
+    row_count = db_copy.copy_frame(
+        session, ExperimentMetric.__table__, frame, db_copy.COPY_FORMAT_BINARY)
+
+    copies = session.fake_connection.fake_cursor.copies
+    assert row_count == 2
+    assert copies[0][1].startswith(db_copy.PGCOPY_HEADER)
+
+
+def test_upsert_frame():
+    frame = DataFrame(
+        [row[:-1] for row in ROWS + ROWS[:1]],
+        columns=COPY_COLUMNS[:-1])
+
+    session = UpsertSession()
+    row_count = db_copy.upsert_frame(
+        session,
+        ExperimentMetric.__table__,
+        frame,
+        stm.EXPT_METRICS_NATURAL_KEY,
+        stm.EXPT_METRICS_KEY_COLUMNS,
+        ['value', 'created_at'],
+        server_values={'created_at': stm.get_server_utcnow()}
+    )
+
+    # the repeated row is only written once
+    assert row_count == 2
+    copies = session.fake_connection.fake_cursor.copies
+    assert copies[0][0].startswith('COPY expt_metrics_staging (')
+
+    statements = [
+        str(statement.compile(dialect=postgresql.dialect()))
+        for statement in session.statements
+    ]
+    assert statements[0].startswith(
+        'CREATE TEMPORARY TABLE expt_metrics_staging ON COMMIT DROP')
+    assert 'INSERT INTO expt_metrics' in statements[1]
+    assert 'ON CONFLICT (experiment_id, metric_type_id' in statements[1]
+    assert 'DO UPDATE SET value = excluded.value, ' \
+        'created_at = excluded.created_at' in statements[1]
+    # created_at is stamped by the database, not copied from the frame
+    assert 'clock_timestamp()' in statements[1]
+    assert statements[2] == 'DROP TABLE expt_metrics_staging'
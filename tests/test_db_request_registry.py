@@ -0,0 +1,83 @@
+"""
+Copyright 2024 NOAA
+All rights reserved.
+
+Unit tests for db_request_registry
+
+"""
+import json
+import os
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+from score_db import db_request_registry as dbrr
+
+SRC_DIR = os.path.join(
+    pathlib.Path(__file__).parent.parent.resolve(), 'src')
+
+# cylc launches thousands of short tasks through score_db_base, keep the
+# entry point's import cost (without any handler loaded) well under this
+IMPORT_TIME_BUDGET_SECONDS = 0.5
+
+# modules which only specific handlers need and must not be imported by
+# the entry point itself
+DEFERRED_MODULES = [
+    'matplotlib',
+    'score_hv',
+    'pandas',
+    'numpy',
+    'geoalchemy2',
+    'psycopg2',
+    'sqlalchemy',
+]
+
+MEASURE_IMPORT = '''
+import json
+import sys
+import time
+start = time.perf_counter()
+import score_db.score_db_base
+elapsed = time.perf_counter() - start
+print(json.dumps({'elapsed': elapsed, 'modules': sorted(sys.modules)}))
+'''
+
+
+def test_registered_requests_are_dotted_paths():
+    for name, handler in dbrr.request_registry.items():
+        assert isinstance(handler.request_path, str), name
+        module_name, class_name = handler.request_path.rsplit('.', 1)
+        assert module_name.startswith('score_db.')
+        assert class_name.endswith('Request')
+
+
+def test_get_request_class():
+    with pytest.raises(KeyError):
+        dbrr.get_request_class('not_a_request')
+
+    from score_db.regions import RegionRequest
+    assert dbrr.get_request_class('region') is RegionRequest
+    assert dbrr.get_request_class('region') is RegionRequest
+    # registry values keep exposing the request class
+    assert dbrr.request_registry['region'].request is RegionRequest
+
+
+def test_score_db_base_import_budget():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = SRC_DIR
+    result = subprocess.run(
+        [sys.executable, '-c', MEASURE_IMPORT],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True
+    )
+    measured = json.loads(result.stdout.strip().splitlines()[-1])
+
+    imported = set(measured['modules'])
+    for module in DEFERRED_MODULES:
+        assert module not in imported, module
+
+    assert measured['elapsed'] < IMPORT_TIME_BUDGET_SECONDS
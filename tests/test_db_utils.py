@@ -5,6 +5,7 @@ All rights reserved.
 Unit tests for db_utils
 
 """
+import asyncio
 import os
 import pathlib
 import pytest
@@ -29,3 +30,198 @@ def test_validate_method():
         db_utils.validate_method(method)
     
     print(f'PYTEST_CALLING_DIR: {PYTEST_CALLING_DIR}')
+
+def test_get_latest_records_filter():
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.orm import Query
+    import score_db.score_table_models as stm
+
+    cls = stm.ExperimentMetric
+    q = Query(cls).filter(cls.experiment_id == 1)
+    q = q.filter(db_utils.get_latest_records_filter(
+        q, cls, stm.EXPT_METRICS_NATURAL_KEY))
+
+    sql = str(q.statement.compile(dialect=postgresql.dialect()))
+    assert 'expt_metrics.id IN (SELECT' in sql
+    assert 'SELECT DISTINCT ON (expt_metrics.experiment_id' in sql
+    assert 'expt_metrics.created_at DESC NULLS LAST, ' \
+        'expt_metrics.id DESC' in sql
+
+def test_since():
+    from datetime import datetime
+    from sqlalchemy.dialects import postgresql
+    import score_db.score_table_models as stm
+
+    assert db_utils.validate_since(None) is None
+    assert db_utils.validate_since({}) == {'created_at': None, 'id': None}
+    since = db_utils.validate_since(
+        {'created_at': '2024-03-01 12:00:00.250000', 'id': 42})
+    assert since == {
+        'created_at': datetime(2024, 3, 1, 12, 0, 0, 250000), 'id': 42}
+
+    with pytest.raises(ValueError):
+        db_utils.validate_since({'updated_at': '2024-03-01'})
+    with pytest.raises(ValueError):
+        db_utils.validate_since({'created_at': 'yesterday'})
+    with pytest.raises(TypeError):
+        db_utils.validate_since({'id': '42'})
+
+    cls = stm.ExptStoredFileCount
+    assert db_utils.get_since_filter(cls, db_utils.validate_since({})) is None
+    sql = str(db_utils.get_since_filter(cls, since).compile(
+        dialect=postgresql.dialect()))
+    assert sql == 'expt_stored_file_counts.created_at > %(created_at_1)s ' \
+        'OR expt_stored_file_counts.id > %(id_1)s'
+
+def test_since_watermark_interleaved_writers():
+    from datetime import datetime, timedelta
+
+    start = datetime(2024, 3, 1, 12)
+
+    def at(seconds):
+        return start + timedelta(seconds=seconds)
+
+    # writer 'slow' stamps its row at 10s and commits at 40s, writer 'fast'
+    # starts later, stamps its row at 20s and commits first at 25s
+    writes = [('slow', at(10), at(40)), ('fast', at(20), at(25))]
+
+    def poll(since, now, lag_seconds):
+        """ the rows visible at 'now' after 'since' and the next watermark """
+        watermark = db_utils.get_safe_watermark(now, since, lag_seconds)
+        rows = [
+            name for name, created_at, committed_at in writes
+            if committed_at <= now and (
+                since['created_at'] is None or
+                created_at > since['created_at'])
+        ]
+        return rows, watermark
+
+    since = db_utils.validate_since({})
+    rows, since = poll(since, at(30), 60)
+    assert rows == ['fast']
+    assert since == {'created_at': at(-30), 'id': None}
+    # the slow writer's row committed after the first read is not skipped,
+    # the fast writer's row is delivered again (at least once)
+    rows, since = poll(since, at(50), 60)
+    assert rows == ['slow', 'fast']
+    # rows are repeated until the watermark passes their stamps
+    rows, since = poll(since, at(80), 60)
+    assert rows == ['slow', 'fast']
+    assert since == {'created_at': at(20), 'id': None}
+    rows, since = poll(since, at(90), 60)
+    assert rows == []
+
+    # a watermark taken straight from the clock skips the slow writer
+    since = db_utils.validate_since({})
+    rows, since = poll(since, at(30), 0)
+    rows, since = poll(since, at(50), 0)
+    assert rows == []
+
+    # a watermark never moves back
+    since = {'created_at': at(100), 'id': None}
+    assert db_utils.get_safe_watermark(at(120), since, 60) == since
+
+
+def test_get_since_watermark(monkeypatch):
+    from datetime import datetime
+    from sqlalchemy.dialects import postgresql
+
+    class FakeResult:
+        def scalar(self):
+            return datetime(2024, 3, 1, 12)
+
+    class FakeSession:
+        def execute(self, statement):
+            self.sql = str(statement.compile(dialect=postgresql.dialect()))
+            return FakeResult()
+
+    monkeypatch.setenv(db_utils.SINCE_SAFETY_LAG_ENV, '120')
+    session = FakeSession()
+    watermark = db_utils.get_since_watermark(
+        session, db_utils.validate_since({'id': 42}))
+
+    # the database clock, not the client's, less the safety lag
+    assert 'clock_timestamp()' in session.sql
+    assert watermark == {'created_at': datetime(2024, 3, 1, 11, 58), 'id': None}
+
+def test_iter_chunks():
+    chunks = list(db_utils.iter_chunks(range(7), 3))
+    assert chunks == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(db_utils.iter_chunks([], 3)) == []
+
+    assert db_utils.validate_chunk_size(None) == db_utils.DEFAULT_CHUNK_SIZE
+    with pytest.raises(ValueError):
+        db_utils.validate_chunk_size(-1)
+    with pytest.raises(ValueError):
+        db_utils.validate_chunk_size(True)
+
+def test_keyset_pagination():
+    from datetime import datetime
+    from pandas import DataFrame
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.orm import Query
+    import score_db.score_table_models as stm
+
+    assert db_utils.get_page_direction(None) == db_utils.ASCENDING
+    assert db_utils.get_page_direction(
+        [{'name': 'time_valid', 'order_by': 'desc'}]) == db_utils.DESCENDING
+    assert db_utils.get_page_direction(
+        [{'name': 'value', 'order_by': 'asc'}]) is None
+
+    records = DataFrame({
+        'id': [7, 3],
+        'time_valid': [datetime(2020, 1, 1), datetime(2020, 1, 2, 6)]
+    })
+    assert db_utils.get_next_page_cursor(records, None, 3) is None
+    cursor = db_utils.get_next_page_cursor(records, None, 2)
+    assert db_utils.decode_page_cursor(cursor) == \
+        (datetime(2020, 1, 2, 6), 3)
+    # the cursor can also be taken from a list of named tuples
+    assert db_utils.get_next_page_cursor(
+        list(records.itertuples(index=False)), None, 2) == cursor
+
+    with pytest.raises(ValueError):
+        db_utils.decode_page_cursor('not a cursor')
+
+    cls = stm.ExperimentMetric
+    q = db_utils.apply_ordering_and_limit(Query(cls), cls, None, 2, cursor)
+    sql = str(q.statement.compile(dialect=postgresql.dialect()))
+    assert '(expt_metrics.time_valid, expt_metrics.id) > (' in sql
+    assert 'ORDER BY expt_metrics.time_valid ASC, expt_metrics.id ASC' in sql
+    assert 'LIMIT' in sql
+
+    # rows with a null time_valid sort last and are paged by id
+    cls = stm.ExptArrayMetric
+    q = db_utils.apply_ordering_and_limit(Query(cls), cls, None, 2, cursor)
+    sql = str(q.statement.compile(dialect=postgresql.dialect()))
+    assert 'OR expt_array_metrics.time_valid IS NULL' in sql
+
+    with pytest.raises(ValueError):
+        db_utils.apply_ordering_and_limit(
+            Query(cls), cls, [{'name': 'value', 'order_by': 'asc'}], 2, cursor)
+
+
+class FakeRequest:
+    def __init__(self, value, delay=0):
+        self.value = value
+        self.delay = delay
+
+    def submit(self):
+        return self.value
+
+    async def submit_async(self):
+        await asyncio.sleep(self.delay)
+        return self.value
+
+
+def test_gather_requests():
+    # responses come back in request order, not completion order
+    requests = [FakeRequest(1, 0.02), FakeRequest(2), FakeRequest(3, 0.01)]
+    assert asyncio.run(db_utils.gather_requests(requests)) == [1, 2, 3]
+    assert asyncio.run(db_utils.submit_in_thread(requests[1])) == 2
+
+
+def test_submit_all_without_async_driver(monkeypatch):
+    monkeypatch.setattr(
+        db_utils.db_connection, 'has_async_driver', lambda: False)
+    assert db_utils.submit_all([FakeRequest(1), FakeRequest(2)]) == [1, 2]
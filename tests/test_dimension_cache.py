@@ -0,0 +1,80 @@
+"""
+Copyright 2024 NOAA
+All rights reserved.
+
+Unit tests for dimension_cache
+
+"""
+from contextlib import contextmanager
+
+import pytest
+
+from score_db import dimension_cache
+import score_db.score_table_models as stm
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    def __init__(self, tables):
+        self.tables = tables
+        self.queries = 0
+
+    def execute(self, statement):
+        self.queries += 1
+        return FakeResult(list(self.tables))
+
+
+@pytest.fixture
+def fake_session(monkeypatch):
+    session = FakeSession([(1, 'global'), (2, 'tropics'), (3, 'global')])
+
+    @contextmanager
+    def session_scope():
+        yield session
+
+    monkeypatch.setattr(stm, 'session_scope', session_scope)
+    return session
+
+
+def test_get_ids(fake_session):
+    cache = dimension_cache.DimensionCache(stm.Region, ['name'], ttl=60)
+
+    # the highest id (last row) of a repeated name wins
+    assert cache.get_ids(['global', 'tropics']) == {'global': 3, 'tropics': 2}
+    assert cache.get_id('tropics') == 2
+    assert fake_session.queries == 1
+
+    # a miss reloads the table once
+    fake_session.tables.append((4, 'polar'))
+    assert cache.get_id('polar') == 4
+    assert cache.get_id('arctic') is None
+    assert fake_session.queries == 3
+
+    cache.invalidate()
+    cache.get_id('global')
+    assert fake_session.queries == 4
+
+
+def test_find_id(fake_session):
+    fake_session.tables[:] = [
+        (1, 'gps', 5, 'gps-a', None),
+        (2, 'gps', 7, 'gps-b', 'gb'),
+    ]
+    cache = dimension_cache.DimensionCache(
+        stm.SatMeta, ['name', 'sat_id', 'sat_name', 'short_name'], ttl=60)
+
+    assert cache.find_id(name='gps') == 1
+    assert cache.find_id(name='gps', sat_id=7, short_name=None) == 2
+    assert cache.find_id(name='gps', sat_id=9) is None
+
+
+def test_unknown_table():
+    with pytest.raises(dimension_cache.DimensionCacheError):
+        dimension_cache.get_cache('expt_metrics')
@@ -0,0 +1,75 @@
+"""
+Copyright 2024 NOAA
+All rights reserved.
+
+Unit tests for experiment_ids
+
+"""
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+
+from score_db import experiment_ids
+import score_db.score_table_models as stm
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class FakeSession:
+    def __init__(self, experiment_id):
+        self.experiment_id = experiment_id
+        self.statements = []
+
+    def execute(self, statement):
+        self.statements.append(statement)
+        return FakeResult(self.experiment_id)
+
+
+@pytest.fixture
+def fake_session(monkeypatch):
+    session = FakeSession(None)
+
+    @contextmanager
+    def session_scope():
+        yield session
+
+    monkeypatch.setattr(stm, 'session_scope', session_scope)
+    experiment_ids.invalidate()
+    yield session
+    experiment_ids.invalidate()
+
+
+def test_get_experiment_id(fake_session):
+    # misses are not memoized
+    with pytest.raises(experiment_ids.ExperimentIdError):
+        experiment_ids.get_experiment_id('C96L64', '2024-01-01 00:00:00')
+
+    fake_session.experiment_id = 7
+    assert experiment_ids.get_experiment_id(
+        'C96L64', '2024-01-01 00:00:00') == 7
+    assert experiment_ids.get_experiment_id(
+        'C96L64', datetime(2024, 1, 1)) == 7
+    assert len(fake_session.statements) == 2
+
+    # lookups without a wallclock_start return the latest experiment
+    experiment_ids.get_experiment_id('C96L64', None)
+    experiment_ids.get_experiment_id('C96L64', None)
+    assert len(fake_session.statements) == 4
+    assert 'wallclock_start =' not in str(fake_session.statements[-1])
+
+    experiment_ids.invalidate()
+    experiment_ids.get_experiment_id('C96L64', '2024-01-01 00:00:00')
+    assert len(fake_session.statements) == 5
+
+
+def test_invalid_wallclock_start(fake_session):
+    with pytest.raises(experiment_ids.ExperimentIdError):
+        experiment_ids.get_experiment_id('C96L64', '2024-01-01T00:00')
+    assert len(fake_session.statements) == 0
@@ -0,0 +1,54 @@
+"""
+Copyright 2024 NOAA
+All rights reserved.
+
+Unit tests for expt_file_counts
+
+"""
+from datetime import datetime
+from types import SimpleNamespace
+
+from score_db import db_connection
+from score_db.expt_file_counts import ExptFileCountRequest
+import score_db.score_table_models as stm
+
+
+class FakeSession:
+    def __init__(self):
+        self.calls = []
+
+    def execute(self, statement):
+        self.calls.append('execute')
+        raise RuntimeError('connection lost')
+
+    def commit(self):
+        self.calls.append('commit')
+
+    def rollback(self):
+        self.calls.append('rollback')
+
+    def close(self):
+        self.calls.append('close')
+
+
+def test_failed_put_rolls_back_through_session_scope(monkeypatch):
+    session = FakeSession()
+    writes = []
+    monkeypatch.setattr(stm, 'get_session', lambda: session)
+    monkeypatch.setattr(stm, 'check_natural_key', lambda session, name: None)
+    monkeypatch.setattr(db_connection, 'mark_write', lambda: writes.append(1))
+
+    request = ExptFileCountRequest({'name': 'expt_file_counts', 'method': 'GET'})
+    request.expt_file_count = SimpleNamespace(
+        time_valid=datetime(2015, 12, 2, 6), file_size_bytes=1024)
+    request.expt_file_count_data = SimpleNamespace(
+        count=12.0, folder_path='/noaa/C96L64', cycle=None, forecast_hour=0,
+        experiment_id=1, file_type_id=2, storage_location_id=3)
+
+    response = request.put_expt_file_counts()
+
+    # the scope rolls back once, nothing is committed or counted as a write
+    assert not response.success
+    assert 'connection lost' in response.errors
+    assert session.calls == ['execute', 'rollback', 'close']
+    assert writes == []
@@ -6,7 +6,16 @@ Unit tests for expt_metrics.py
 
 """
 
+import numpy as np
+from pandas import DataFrame
+import pytest
+
 from score_db.expt_metrics import ExptMetricInputData, ExptMetricRequest
+from score_db.expt_metrics import ExptMetricsData, ExptMetricsError
+from score_db.expt_metrics import get_expt_metrics_data_columns, get_metrics_frame
+from score_db.expt_metrics import get_aggregate_columns
+from score_db.expt_metrics import get_filter_sets, get_filter_set_frames
+import score_db.score_table_models as stm
 
 def test_put_exp_metrics_request_dict():
 
@@ -76,3 +85,269 @@ def test_send_get_request():
     result = emr.submit()
     assert(result.success)
     assert(result.details.get('record_count') > 0)
+
+
+def test_put_exp_metrics_columnar_input():
+
+    metrics = {
+        'name': np.array(['innov_stats_temperature_rmsd'] * 2),
+        'region_name': np.array(['global', 'tropics']),
+        'elevation': np.array([0.0, 50.0]),
+        'elevation_unit': np.array(['kpa', 'kpa']),
+        'value': np.array([2.6, np.nan]),
+        'time_valid': np.array(
+            ['2015-12-02 06:00:00', '2015-12-02 12:00:00'],
+            dtype='datetime64[s]'),
+    }
+
+    for body_metrics in [metrics, DataFrame(metrics)]:
+        request_dict = {
+            'db_request_name': 'expt_metrics',
+            'method': 'PUT',
+            'body': {
+                'expt_name': 'C96L64.UFSRNR.GSI_3DVAR.012016',
+                'expt_wallclock_start': '2021-07-22 09:22:05',
+                'metrics': body_metrics,
+                'datestr_format': '%Y-%m-%d %H:%M:%S'
+            }
+        }
+
+        emr = ExptMetricRequest(request_dict)
+        result = emr.submit()
+        assert(result.success)
+        assert(result.details.get('record_count') == 2)
+
+def test_get_metrics_frame():
+
+    metrics = [
+        ExptMetricInputData('innov_stats_temperature_rmsd', 'global', '0', 'kpa', 2.6, '2015-12-02 06:00:00', None, None),
+        ExptMetricInputData('innov_stats_uvwind_rmsd', 'tropics', '50', 'kpa', 2.8, '2015-12-02 06:00:00', 24, 256)
+    ]
+    metrics_df = get_metrics_frame(metrics)
+    assert(metrics_df['elevation'].tolist() == [0.0, 50.0])
+    assert(str(metrics_df['ensemble_member'].dtype) == 'Int64')
+    assert(metrics_df['ensemble_member'].isna().tolist() == [True, False])
+
+    # the nullable columns may be left out of columnar input
+    metrics_df = get_metrics_frame({
+        'name': np.array(['innov_stats_temperature_rmsd']),
+        'region_name': np.array(['global']),
+        'elevation': np.array([0.0]),
+        'value': np.array([np.nan]),
+        'time_valid': np.array(['2015-12-02 06:00:00']),
+    })
+    assert(metrics_df['elevation_unit'].isna().all())
+    assert(metrics_df['value'].isna().all())
+
+    with pytest.raises(ExptMetricsError):
+        get_metrics_frame({'name': np.array(['innov_stats_temperature_rmsd'])})
+
+    with pytest.raises(ExptMetricsError):
+        get_metrics_frame(DataFrame({
+            'name': ['innov_stats_temperature_rmsd'],
+            'region_name': ['global'],
+            'elevation': ['high'],
+            'value': [2.6],
+            'time_valid': ['2015-12-02 06:00:00'],
+        }))
+
+def test_expt_metrics_data_columns():
+
+    columns = get_expt_metrics_data_columns()
+    assert([column.name for column in columns] == list(ExptMetricsData._fields))
+    assert(columns[0].element.table.name == 'expt_metrics')
+    assert(columns[1].element.table.name == 'metric_types')
+
+def test_stream_request_is_lazy():
+
+    request_dict = {
+        'name': 'expt_metrics',
+        'method': 'GET',
+        'params': {
+            'filters': {},
+            'stream': True,
+            'chunk_size': 500
+        }
+    }
+
+    # nothing is read until the caller iterates over the chunks
+    response = ExptMetricRequest(request_dict).submit()
+    assert(response.success)
+    assert(response.details['chunk_size'] == 500)
+    assert(hasattr(response.details['chunks'], '__next__'))
+    response.details['chunks'].close()
+
+    request_dict['params']['chunk_size'] = 0
+    with pytest.raises(ValueError):
+        ExptMetricRequest(request_dict)
+
+
+def test_aggregate_columns():
+
+    group_columns, aggregate_columns = get_aggregate_columns({
+        'group_by': ['expt_name', 'elevation', 'region'],
+        'functions': ['mean', 'count']
+    })
+    assert([column.name for column in group_columns] == \
+        ['expt_name', 'elevation', 'region'])
+    assert([column.name for column in aggregate_columns] == \
+        ['value_mean', 'value_count'])
+
+    with pytest.raises(ExptMetricsError):
+        get_aggregate_columns({'group_by': ['blah']})
+
+    with pytest.raises(ExptMetricsError):
+        get_aggregate_columns({'group_by': 'region', 'functions': ['median']})
+
+
+def test_aggregate_time_bucket():
+
+    group_columns, _ = get_aggregate_columns({
+        'group_by': ['expt_name'],
+        'time_bucket': 'week'
+    })
+    assert([column.name for column in group_columns] == \
+        ['time_valid', 'expt_name'])
+    assert('date_trunc(\'week\'' in str(group_columns[0]))
+
+    group_columns, _ = get_aggregate_columns({'time_bucket': '6 hours'})
+    assert('date_bin(interval \'6 hours\'' in str(group_columns[0]))
+
+    with pytest.raises(ExptMetricsError):
+        get_aggregate_columns({'time_bucket': '6 hours; drop table'})
+
+
+def test_filter_sets(monkeypatch):
+    from sqlalchemy.orm import Session
+
+    filters = {
+        'experiment': {'name': {'exact': 'C96L64.UFSRNR.GSI_3DVAR.012016'}},
+        'regions': {'name': {'exact': ['global']}}
+    }
+    filter_sets = [
+        {'metric_types': {'name': {'exact': ['innov_stats_temperature_rmsd']}}},
+        {
+            'metric_types': {'name': {'exact': ['innov_stats_uvwind_rmsd']}},
+            'regions': {'name': {'exact': ['tropics']}}
+        }
+    ]
+
+    # the keys of each set replace those of the common filters
+    merged_sets = get_filter_sets(filter_sets, filters)
+    assert(list(merged_sets.keys()) == [0, 1])
+    assert(merged_sets[0]['regions'] == filters['regions'])
+    assert(merged_sets[1]['regions'] == {'name': {'exact': ['tropics']}})
+
+    with pytest.raises(ExptMetricsError):
+        get_filter_sets([])
+
+    monkeypatch.setattr(stm, 'has_natural_key', lambda session, name: True)
+
+    emr = ExptMetricRequest({
+        'name': 'expt_metrics',
+        'method': 'GET',
+        'params': {
+            'filters': filters,
+            'filter_sets': filter_sets,
+            'ordering': [{'name': 'time_valid', 'order_by': 'asc'}],
+            'record_limit': 10
+        }
+    })
+    statement = str(emr.get_metrics_statement(Session()))
+    assert(statement.count('UNION ALL') == 1)
+    assert('AS query_tag' in statement)
+    assert(statement.endswith(
+        'ORDER BY batch.query_tag ASC, batch.time_valid ASC'))
+
+    records = DataFrame({'value': [1.0, 2.0, 3.0], 'query_tag': [1, 0, 1]})
+    frames = get_filter_set_frames(records, [0, 1, 2])
+    assert(list(frames[1]['value']) == [1.0, 3.0])
+    assert(list(frames[0].columns) == ['value'])
+    assert(frames[2].shape[0] == 0)
+
+
+def test_latest_view():
+    from sqlalchemy.orm import Session
+
+    emr = ExptMetricRequest({
+        'name': 'expt_metrics',
+        'method': 'GET',
+        'params': {
+            'filters': {
+                'experiment': {'name': {'exact': 'C96L64.UFSRNR.GSI_3DVAR.012016'}},
+                'time_valid': {'from': '2015-12-01 00:00:00'}
+            },
+            'latest_view': True,
+            'latest_only': True
+        }
+    })
+    statement = str(emr.get_metrics_statement(Session()))
+    assert('FROM expt_metrics_latest JOIN experiments ON ' \
+        'experiments.id = expt_metrics_latest.experiment_id' in statement)
+    assert('expt_metrics_latest.time_valid >=' in statement)
+    # the view holds only the latest rows, no DISTINCT ON is needed
+    assert('DISTINCT' not in statement)
+    assert('expt_metrics.' not in statement)
+
+
+def test_dedup_without_natural_key(monkeypatch):
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.orm import Session
+
+    def get_statement(emr):
+        return str(emr.get_metrics_statement(Session()).compile(
+            dialect=postgresql.dialect()))
+
+    emr = ExptMetricRequest({
+        'name': 'expt_metrics',
+        'method': 'GET',
+        'params': {
+            'filters': {
+                'experiment': {'name': {'exact': 'C96L64.UFSRNR.GSI_3DVAR.012016'}}
+            }
+        }
+    })
+
+    monkeypatch.setattr(stm, 'has_natural_key', lambda session, name: True)
+    assert('DISTINCT ON' not in get_statement(emr))
+
+    # a table which may still hold duplicates keeps only the newest rows
+    monkeypatch.setattr(stm, 'has_natural_key', lambda session, name: False)
+    assert('DISTINCT ON' in get_statement(emr))
+
+
+def test_parse_metrics_duplicate_dimension_names(monkeypatch):
+    from contextlib import contextmanager
+    from score_db import dimension_cache
+
+    class FakeResult:
+        def all(self):
+            # a region and a metric type name registered twice
+            return [
+                (1, 'global'),
+                (2, 'innov_stats_temperature_rmsd'),
+                (3, 'global'),
+                (4, 'innov_stats_temperature_rmsd'),
+            ]
+
+    class FakeSession:
+        def execute(self, statement):
+            return FakeResult()
+
+    @contextmanager
+    def session_scope():
+        yield FakeSession()
+
+    monkeypatch.setattr(stm, 'session_scope', session_scope)
+    monkeypatch.setattr(dimension_cache, '_caches', {})
+
+    emr = ExptMetricRequest({'name': 'expt_metrics', 'method': 'PUT'})
+    emr.expt_id = 1
+    records = emr.parse_metrics_data([
+        ExptMetricInputData('innov_stats_temperature_rmsd', 'global', '0',
+            'kpa', 2.6, '2015-12-02 06:00:00', None, None)
+    ])
+
+    # the last (highest id) row of a repeated name wins
+    assert(list(records['region_id']) == [3])
+    assert(list(records['metric_type_id']) == [4])
@@ -0,0 +1,68 @@
+"""
+Copyright 2024 NOAA
+All rights reserved.
+
+Unit tests for log_utils
+
+"""
+import io
+import logging
+
+import pytest
+
+from score_db import log_utils
+
+
+class CountingRepr:
+    ''' counts how often a log argument is formatted '''
+    def __init__(self):
+        self.count = 0
+
+    def __str__(self):
+        self.count += 1
+        return 'formatted'
+
+
+@pytest.fixture
+def restore_levels():
+    names = ['score_db', 'score_db.expt_metrics', 'score_db.regions']
+    levels = {name: logging.getLogger(name).level for name in names}
+    yield
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+    logging.getLogger('score_db').removeHandler(log_utils._handler)
+
+
+def test_parse_module_levels():
+    levels = log_utils.parse_module_levels(
+        'expt_metrics=DEBUG, score_db.regions=info')
+    assert levels == {
+        'score_db.expt_metrics': logging.DEBUG,
+        'score_db.regions': logging.INFO
+    }
+    assert log_utils.parse_module_levels('') == {}
+
+    with pytest.raises(ValueError):
+        log_utils.parse_module_levels('expt_metrics')
+
+    with pytest.raises(ValueError):
+        log_utils.get_level('chatty')
+
+
+def test_module_logger_levels(restore_levels):
+    logger = log_utils.get_logger('expt_metrics')
+    assert logger.name == 'score_db.expt_metrics'
+
+    stream = io.StringIO()
+    log_utils.configure_logging(
+        'WARNING', 'expt_metrics=DEBUG', stream=stream)
+
+    # messages below the active level are never formatted
+    arg = CountingRepr()
+    log_utils.get_logger('regions').debug('quiet: %s', arg)
+    assert arg.count == 0
+    assert stream.getvalue() == ''
+
+    logger.debug('loud: %s', arg)
+    assert arg.count > 0
+    assert 'score_db.expt_metrics: loud: formatted' in stream.getvalue()
@@ -0,0 +1,80 @@
+"""
+Copyright 2024 NOAA
+All rights reserved.
+
+Unit tests for result_cache
+
+"""
+from datetime import datetime
+import os
+
+from pandas import DataFrame
+import pytest
+
+from score_db import result_cache
+
+WATERMARK = [10, datetime(2024, 3, 1, 12)]
+
+
+def write_entry(cache, key, watermark, size, mtime):
+    result_path, watermark_path = cache.get_paths(key)
+    with open(result_path, 'wb') as result_file:
+        result_file.write(b'0' * size)
+    with open(watermark_path, 'w', encoding='utf-8') as watermark_file:
+        watermark_file.write(result_cache.normalize(watermark))
+    os.utime(result_path, (mtime, mtime))
+
+
+def test_get_request_key():
+    params = {
+        'filters': {'experiment': {'experiment_name': 'C96L64'}},
+        'ordering': [{'name': 'time_valid', 'order_by': 'asc'}],
+    }
+    key = result_cache.get_request_key('expt_metrics', params)
+
+    # key order and the params which only change the output are ignored
+    reordered = dict(reversed(list(params.items())))
+    reordered.update({'cache': True, 'output_format': 'pandas_dataframe'})
+    assert result_cache.get_request_key('expt_metrics', reordered) == key
+
+    assert result_cache.get_request_key('expt_stored_file_counts', params) != key
+    assert result_cache.get_request_key(
+        'expt_metrics', {**params, 'record_limit': 5}) != key
+
+
+def test_is_cache_requested(monkeypatch):
+    monkeypatch.delenv(result_cache.RESULT_CACHE_ENV, raising=False)
+    assert not result_cache.is_cache_requested({})
+    assert result_cache.is_cache_requested({'cache': True})
+
+    monkeypatch.setenv(result_cache.RESULT_CACHE_ENV, 'true')
+    assert result_cache.is_cache_requested(None)
+    assert not result_cache.is_cache_requested({'cache': False})
+
+
+def test_stale_and_evict(tmp_path):
+    cache = result_cache.ResultCache(str(tmp_path), max_bytes=250)
+
+    write_entry(cache, 'stale', WATERMARK, 10, 1000)
+    assert cache.get('stale', [11, WATERMARK[1]]) is None
+    assert cache.get_entries() == []
+
+    write_entry(cache, 'oldest', WATERMARK, 100, 1000)
+    write_entry(cache, 'older', WATERMARK, 100, 2000)
+    write_entry(cache, 'newest', WATERMARK, 100, 3000)
+    cache.evict()
+    assert sorted(key for _, _, key in cache.get_entries()) == \
+        ['newest', 'older']
+
+    cache.clear()
+    assert os.listdir(tmp_path) == []
+
+
+def test_put_get(tmp_path):
+    pytest.importorskip('pyarrow')
+    cache = result_cache.ResultCache(str(tmp_path))
+    frame = DataFrame({'name': ['global', 'tropics'], 'value': [2.5, 3.0]})
+
+    assert cache.put('key', WATERMARK, frame)
+    assert cache.get('key', WATERMARK).equals(frame)
+    assert cache.get('key', [0, None]) is None
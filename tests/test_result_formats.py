@@ -0,0 +1,72 @@
+"""
+Copyright 2024 NOAA
+All rights reserved.
+
+Unit tests for result_formats
+
+"""
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+from pandas import DataFrame
+import pytest
+
+from score_db import result_formats
+from score_db.db_request_registry import NAMED_TUPLES_LIST, PANDAS_DATAFRAME
+from score_db.db_request_registry import NUMPY_STRUCTURED_ARRAY, ARROW_TABLE
+
+Record = namedtuple(
+    'Record', ['id', 'name', 'value', 'time_valid', 'forecast_hour', 'values'])
+
+ROWS = [
+    Record(1, 'global', 2.5, datetime(2015, 12, 2, 6), None, [1.0, 2.0]),
+    Record(2, 'tropics', 3, datetime(2015, 12, 2, 12), 24.0, [3.0]),
+]
+
+
+def test_validate_output_format():
+    assert result_formats.validate_output_format(None) == PANDAS_DATAFRAME
+    assert result_formats.get_output_format(None) == PANDAS_DATAFRAME
+    assert result_formats.get_output_format(
+        {'output_format': NAMED_TUPLES_LIST}) == NAMED_TUPLES_LIST
+
+    with pytest.raises(ValueError):
+        result_formats.validate_output_format('csv')
+
+
+def test_format_records():
+    records = result_formats.format_records(ROWS, Record._fields)
+    assert isinstance(records, DataFrame)
+    assert list(records.columns) == list(Record._fields)
+
+    records = result_formats.format_records(
+        ROWS, Record._fields, NAMED_TUPLES_LIST)
+    assert records == ROWS
+    assert records[1].name == 'tropics'
+
+    records = result_formats.format_records(
+        ROWS, Record._fields, NUMPY_STRUCTURED_ARRAY)
+    assert records.dtype.names == Record._fields
+    assert records['id'].dtype == np.int64
+    # ints and floats mix into a float column
+    assert records['value'].dtype == np.float64
+    assert records['name'].dtype.kind == 'U'
+    assert records['time_valid'][1] == np.datetime64('2015-12-02T12:00')
+    # nulls and lists are kept as objects
+    assert records['forecast_hour'].dtype == object
+    assert records['values'][0] == [1.0, 2.0]
+
+    records = result_formats.format_records(
+        [], Record._fields, NUMPY_STRUCTURED_ARRAY)
+    assert len(records) == 0
+    assert records.dtype.names == Record._fields
+
+
+def test_arrow_table():
+    pa = pytest.importorskip('pyarrow')
+
+    table = result_formats.format_records(ROWS, Record._fields, ARROW_TABLE)
+    assert isinstance(table, pa.Table)
+    assert table.num_rows == 2
+    assert table.column('forecast_hour').null_count == 1
@@ -0,0 +1,24 @@
+"""
+Copyright 2024 NOAA
+All rights reserved.
+
+Unit tests for the score_db_base command line
+
+"""
+import sys
+
+import pytest
+
+from score_db import score_db_base
+
+
+@pytest.mark.parametrize('argv', [
+    ['--partition-by', 'expt_metrics=range'],
+    ['--start', '2023-01-01'],
+    ['--create-partitions', '--start', '2023-13-01'],
+])
+def test_invalid_schema_arguments(monkeypatch, argv):
+    monkeypatch.setattr(sys, 'argv', ['score_db_base.py'] + argv)
+    with pytest.raises(SystemExit) as error:
+        score_db_base.main()
+    assert error.value.code == 2